@@ -18,3 +18,98 @@ class Config:
     BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
     ENV = os.getenv("ENV", "DEVELOPMENT")
     SESSION_COOKIE_DOMAIN = os.getenv("SESSION_COOKIE_DOMAIN", None)
+
+    # RENDER EXECUTOR (PDF/DOCX/PPTX building off the event loop)
+    RENDER_EXECUTOR = os.getenv("RENDER_EXECUTOR", "thread") # thread, process or inline
+    RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "4"))
+    RENDER_QUEUE_LIMIT = int(os.getenv("RENDER_QUEUE_LIMIT", "16")) # Waiting jobs allowed on top of busy workers
+    RENDER_RETRY_AFTER = int(os.getenv("RENDER_RETRY_AFTER", "5")) # Seconds, sent with 503 on backpressure
+
+    # RENDERED EXPORT CACHE (content-addressed PDF/DOCX/PPTX bytes)
+    EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR") # Optional disk tier, disabled when unset
+    EXPORT_CACHE_DISK_MAX_BYTES = int(os.getenv("EXPORT_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+    # LLM ADMISSION SCHEDULER
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8")) # Global in-flight cap to OpenRouter
+    LLM_AGING_SECONDS = float(os.getenv("LLM_AGING_SECONDS", "30")) # Waiters move up one lane per interval
+
+    # LLM ROUTING (backends from LLM_BACKENDS, see gemini_client.Config)
+    LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() == "true" # Hedge slow calls to the next backend (needs 2+ backends)
+    LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.9")) # Hedge once the primary passes this latency quantile
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2")) # Seconds; never hedge earlier than this
+    LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "30")) # Seconds, until a backend has a profile
+    LLM_HEDGE_DEFAULT_TTFT = float(os.getenv("LLM_HEDGE_DEFAULT_TTFT", "8")) # Same, for time to first streamed token
+    LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.2")) # Max share of recent calls that may hedge
+    LLM_PROFILE_WINDOW = int(os.getenv("LLM_PROFILE_WINDOW", "200")) # Calls kept per backend for latency/error stats
+    LLM_PROFILE_MIN_SAMPLES = int(os.getenv("LLM_PROFILE_MIN_SAMPLES", "10")) # Below this the defaults above apply
+
+    # LLM RETRIES & CIRCUIT BREAKER
+    LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "5")) # Per request, across backends
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1")) # Seconds; full jitter up to base * 2^attempt
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20")) # Seconds, cap for one backoff sleep
+    LLM_MIN_ATTEMPT_SECONDS = float(os.getenv("LLM_MIN_ATTEMPT_SECONDS", "5")) # No retry if less than this would be left
+    LLM_DEADLINE_RPP = float(os.getenv("LLM_DEADLINE_RPP", "150")) # Seconds per request incl. retries (stream: first token)
+    LLM_DEADLINE_PPT = float(os.getenv("LLM_DEADLINE_PPT", "120"))
+    LLM_DEADLINE_QUIZ = float(os.getenv("LLM_DEADLINE_QUIZ", "60")) # Per chunk; QuizService re-asks failed chunks
+    LLM_DEADLINE_DEFAULT = float(os.getenv("LLM_DEADLINE_DEFAULT", "90"))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120")) # Seconds without a byte from the provider
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5")) # Consecutive outage errors that open a backend's breaker
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30")) # Seconds open before one probe call
+    LLM_BREAKER_MAX_COOLDOWN = float(os.getenv("LLM_BREAKER_MAX_COOLDOWN", "300")) # Cooldown doubles per failed probe
+
+    # GENERATION CACHE (reuse Modul Ajar for identical prompts minus identity fields)
+    GEN_CACHE_TTL_SECONDS = int(os.getenv("GEN_CACHE_TTL_SECONDS", str(3 * 24 * 3600)))
+    GEN_CACHE_MAX_ENTRIES = int(os.getenv("GEN_CACHE_MAX_ENTRIES", "500"))
+
+    # ENTITLEMENTS (active subscription -> plan & feature flags)
+    ENTITLEMENT_CACHE_TTL = int(os.getenv("ENTITLEMENT_CACHE_TTL", "60")) # Seconds
+
+    # TRIPAY HTTP CLIENT
+    TRIPAY_BASE_URL = os.getenv("TRIPAY_BASE_URL") # Optional override (e.g. a mock); defaults by TRIPAY_MODE
+    TRIPAY_TIMEOUT = float(os.getenv("TRIPAY_TIMEOUT", "15")) # Seconds per request
+    TRIPAY_CONNECT_TIMEOUT = float(os.getenv("TRIPAY_CONNECT_TIMEOUT", "5"))
+    TRIPAY_CHANNELS_TTL = int(os.getenv("TRIPAY_CHANNELS_TTL", "600")) # Seconds; refreshed in the background
+    TRIPAY_CHANNELS_RETRY = int(os.getenv("TRIPAY_CHANNELS_RETRY", "30")) # Seconds callers fail fast after a failed fetch with no list cached
+
+    # PASSWORD HASHING (off the event loop)
+    HASH_CONCURRENCY = int(os.getenv("HASH_CONCURRENCY", "2")) # Parallel hash/verify jobs (dedicated threads)
+    HASH_TARGET_MS = float(os.getenv("HASH_TARGET_MS", "100")) # Cost budget for one pbkdf2_sha256 hash
+    PBKDF2_ROUNDS = os.getenv("PBKDF2_ROUNDS") # Fixed rounds; skips calibration when set
+
+    # BACKGROUND JOBS (async PPT generation)
+    JOB_STORE = os.getenv("JOB_STORE", "memory") # memory or database (jobs table, survives restarts)
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600))) # Finished jobs are kept this long
+
+    # QUIZ GENERATION (batched)
+    QUIZ_CHUNK_SIZE = int(os.getenv("QUIZ_CHUNK_SIZE", "5")) # Questions per LLM call
+    QUIZ_MAX_PARALLEL = int(os.getenv("QUIZ_MAX_PARALLEL", "4")) # Concurrent chunk calls per quiz
+    QUIZ_CHUNK_RETRIES = int(os.getenv("QUIZ_CHUNK_RETRIES", "2")) # Re-asks for missing/invalid questions per chunk
+
+    # CURRICULUM CATALOG (in-memory)
+    CURRICULUM_RELOAD_SECONDS = int(os.getenv("CURRICULUM_RELOAD_SECONDS", "60")) # Fingerprint check interval
+    CURRICULUM_MAX_AGE = int(os.getenv("CURRICULUM_MAX_AGE", "300")) # Browser cache for /subjects and /goals, revalidated by ETag
+
+    # FULL-TEXT SEARCH
+    SEARCH_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "indonesian") # Postgres text search config ('simple' if not installed)
+
+    # PROMPT CONTEXT COMPACTION (Modul Ajar text pasted into PPT/quiz prompts)
+    CONTEXT_COMPACTION = os.getenv("CONTEXT_COMPACTION", "true").lower() == "true"
+    PPT_CONTEXT_TOKENS = int(os.getenv("PPT_CONTEXT_TOKENS", "2500")) # Estimated-token budget for the slide prompt
+    QUIZ_CONTEXT_TOKENS = int(os.getenv("QUIZ_CONTEXT_TOKENS", "2000")) # Per quiz chunk prompt
+
+    # LLM USAGE ACCOUNTING (llm_usage table)
+    LLM_USAGE_FLUSH_SECONDS = float(os.getenv("LLM_USAGE_FLUSH_SECONDS", "5")) # Buffered rows are written this often
+    LLM_USAGE_BATCH_SIZE = int(os.getenv("LLM_USAGE_BATCH_SIZE", "200")) # ...or as soon as this many are waiting
+    LLM_USAGE_MAX_BUFFER = int(os.getenv("LLM_USAGE_MAX_BUFFER", "10000")) # Oldest rows dropped beyond this (DB down)
+    # USD per 1M tokens (google/gemini-2.5-flash list price on OpenRouter)
+    LLM_PRICE_INPUT_PER_M = float(os.getenv("LLM_PRICE_INPUT_PER_M", "0.30"))
+    LLM_PRICE_CACHED_PER_M = float(os.getenv("LLM_PRICE_CACHED_PER_M", "0.075"))
+    LLM_PRICE_OUTPUT_PER_M = float(os.getenv("LLM_PRICE_OUTPUT_PER_M", "2.50"))
+    ADMIN_API_KEY = os.getenv("ADMIN_API_KEY") # X-Admin-Key for /api/admin/*; admin API disabled when unset
+
+    # METRICS (Prometheus text format)
+    METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN") # Bearer token required for scrapes when set
@@ -1,30 +1,93 @@
 import os
+import math
+import time
 import asyncio
-from openai import AsyncOpenAI
+import httpx
+from contextlib import aclosing
 from dotenv import load_dotenv
+from app.config import Config as AppConfig
+from app.services.llm_scheduler import llm_scheduler
+from app.services.llm_router import LLMRouter, load_backends
+from app.services.llm_resilience import RetryPolicy, classify_error
+from app.utils.json_stream import JSONStreamParser
+from app.metrics import llm_calls, llm_retries, stage_duration
+from app.services.llm_usage import llm_usage_recorder, estimate_tokens
 
 load_dotenv()
 
 class Config:
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") # Deprecated, keep for reference or legacy
     OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+    OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1") # Override for a local/fake endpoint
     DATABASE_URL = os.getenv("DATABASE_URL")
     SECRET_KEY = os.getenv("SECRET_KEY", "unsafe-secret-key")
     # Use OpenRouter model ID for Gemini 2.5 Flash
     # GEMINI_MODEL = "gemini-2.5-flash" 
     GEMINI_MODEL = "google/gemini-2.5-flash" 
+    # Optional JSON list of backends for routing/hedging, first = default primary, e.g.
+    # [{"name": "flash", "model": "google/gemini-2.5-flash"},
+    #  {"name": "google", "model": "gemini-2.5-flash", "base_url": "https://generativelanguage.googleapis.com/v1beta/openai/", "api_key_env": "GEMINI_API_KEY"},
+    #  {"name": "local", "model": "qwen2.5-7b-instruct", "base_url": "http://localhost:8080/v1", "api_key": "local", "weight": 0.3}]
+    # Unset = GEMINI_MODEL on OpenRouter only
+    LLM_BACKENDS = os.getenv("LLM_BACKENDS")
+    # Structured output for JSON prompts: "schema" (json_schema), "object" (json_object) or "off"
+    JSON_MODE = os.getenv("LLM_JSON_MODE", "schema")
+    # Ask for the usage block at the end of streams (stream_options.include_usage)
+    STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "true").lower() == "true"
+
+class GeminiStreamError(Exception):
+    """Raised by stream_content when the completion cannot be streamed."""
+
+def json_response_format(name: str, schema: dict):
+    """response_format for a JSON prompt according to LLM_JSON_MODE (None = plain text)."""
+    if Config.JSON_MODE == "schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+    if Config.JSON_MODE == "object":
+        return {"type": "json_object"}
+    return None
+
+def _error_message(error) -> str:
+    """User-facing "Error..." text for a call that gave up (see classify_error)."""
+    if error.kind == "circuit_open":
+        return f"Error: Layanan AI sedang gangguan. Silakan coba lagi dalam {math.ceil(error.retry_after or 0)} detik."
+    if error.kind == "deadline":
+        return "Error: Waktu tunggu AI habis. Silakan coba lagi."
+    if error.retryable:
+        return "Error: Failed after retries (OpenRouter/Gemini System Busy)"
+    return f"Error Generating RPP: {error.message}"
+
+async def _prefixed(head: list, stream):
+    """Chunks already read while racing for the first token, then the rest of the stream."""
+    for chunk in head:
+        yield chunk
+    async for chunk in stream:
+        yield chunk
 
 class GeminiClient:
     def __init__(self):
-        if not Config.OPENROUTER_API_KEY:
+        # One AsyncOpenAI client per backend (OpenRouter by default); see LLMRouter
+        backends = load_backends(
+            Config.LLM_BACKENDS,
+            default={"name": "openrouter", "model": Config.GEMINI_MODEL,
+                     "base_url": Config.OPENROUTER_BASE_URL, "api_key": Config.OPENROUTER_API_KEY},
+            window=AppConfig.LLM_PROFILE_WINDOW,
+            min_samples=AppConfig.LLM_PROFILE_MIN_SAMPLES,
+            breaker={"failure_threshold": AppConfig.LLM_BREAKER_FAILURES, "cooldown": AppConfig.LLM_BREAKER_COOLDOWN,
+                     "max_cooldown": AppConfig.LLM_BREAKER_MAX_COOLDOWN},
+            timeout=httpx.Timeout(AppConfig.LLM_TIMEOUT, connect=AppConfig.LLM_CONNECT_TIMEOUT)
+        )
+        if not backends:
             print("Warning: OPENROUTER_API_KEY not set")
-            self.client = None
-        else:
-            # Initialize AsyncOpenAI client pointing to OpenRouter
-            self.client = AsyncOpenAI(
-                api_key=Config.OPENROUTER_API_KEY,
-                base_url="https://openrouter.ai/api/v1"
-            )
+        self.router = LLMRouter(
+            backends,
+            hedge=AppConfig.LLM_HEDGE,
+            hedge_quantile=AppConfig.LLM_HEDGE_QUANTILE,
+            min_delay=AppConfig.LLM_HEDGE_MIN_DELAY,
+            default_delay={"complete": AppConfig.LLM_HEDGE_DEFAULT_DELAY, "stream": AppConfig.LLM_HEDGE_DEFAULT_TTFT},
+            max_hedge_ratio=AppConfig.LLM_HEDGE_MAX_RATIO,
+            window=AppConfig.LLM_PROFILE_WINDOW
+        )
+        self.model = backends[0].model if backends else Config.GEMINI_MODEL
 
 
 
@@ -39,42 +102,241 @@ class GeminiClient:
     #             base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
     #         )
 
-    async def generate_content(self, prompt: str) -> str:
-        if not self.client:
+    def _record_usage(self, feature: str, mode: str, status: str, usage, prompt: str, output_chars: int,
+                      latency: float, retries: int, user_id, plan_type: str, model: str = None):
+        """Queue one usage row; without a usage block (abandoned/failed stream) tokens are estimated from length."""
+        if usage is not None:
+            prompt_tokens = usage.prompt_tokens or 0
+            completion_tokens = usage.completion_tokens or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", None) or 0
+        else:
+            prompt_tokens = estimate_tokens(len(prompt)) if status != "error" or output_chars else 0
+            completion_tokens = estimate_tokens(output_chars)
+            cached_tokens = 0
+        llm_usage_recorder.record(
+            user_id=user_id, plan_type=plan_type, feature=feature, model=model or self.model, mode=mode, status=status,
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens,
+            usage_estimated=usage is None and (prompt_tokens > 0 or completion_tokens > 0),
+            latency_ms=int(latency * 1000), retries=retries
+        )
+
+    async def _complete(self, backend, prompt: str, response_format: dict):
+        return await backend.client.chat.completions.create(
+            model=backend.model,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            **({"response_format": response_format} if response_format else {})
+        )
+
+    async def _open_stream(self, backend, prompt: str, response_format: dict):
+        """Start a stream on `backend` and read up to its first text delta. Returns (stream, chunks read so far)."""
+        stream = await backend.client.chat.completions.create(
+            model=backend.model,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            stream=True,
+            **({"stream_options": {"include_usage": True}} if Config.STREAM_USAGE else {}),
+            **({"response_format": response_format} if response_format else {})
+        )
+        head = []
+        try:
+            while True:
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+                head.append(chunk)
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    break
+        except BaseException:
+            await stream.close() # Lost the hedge race (cancelled) or failed: free the connection
+            raise
+        return stream, head
+
+    @staticmethod
+    async def _close_stream(opened):
+        await opened[0].close()
+
+    async def generate_content(self, prompt: str, user_id=None, plan_type: str = "free", response_format: dict = None,
+                               feature: str = "other") -> str:
+        """
+        Run one completion. `user_id`/`plan_type` feed the admission scheduler
+        (global cap, plan lanes, per-user fairness); the slot is released while
+        sleeping between retries. `response_format` (see json_response_format) is
+        dropped if the provider rejects it. Token usage is recorded under `feature`.
+        With several backends the router picks one and may hedge to a second; the
+        hedge needs a second scheduler slot and is skipped when none is free. Transient errors are retried with jittered
+        backoff (Retry-After honoured) within the feature's deadline, see RetryPolicy.
+        """
+        if not self.router.backends:
              return "Error: API Key Missing (OpenRouter)"
         
-        max_retries = 5
-        for attempt in range(max_retries):
+        policy = RetryPolicy(feature)
+        retries = 0
+        latency = 0.0
+        while True:
             try:
                 # Use standard chat completion API
-                response = await self.client.chat.completions.create(
-                    model=Config.GEMINI_MODEL,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
+                async with llm_scheduler.slot(user_id, plan_type):
+                    policy.start()
+                    started = time.monotonic()
+                    try:
+                        async with asyncio.timeout(max(policy.remaining(), 0)):
+                            response, backend = await self.router.race(
+                                "complete", lambda b: self._complete(b, prompt, response_format)
+                            )
+                    finally:
+                        latency = time.monotonic() - started
                 
                 # Check for content in response
                 if response.choices and response.choices[0].message:
-                    return response.choices[0].message.content
+                    llm_calls.inc(mode="complete", outcome="ok")
+                    content = response.choices[0].message.content
+                    self._record_usage(feature, "complete", "ok", response.usage, prompt, len(content or ""),
+                                       latency, retries, user_id, plan_type, model=backend.model)
+                    return content
                 else:
+                    llm_calls.inc(mode="complete", outcome="empty")
+                    backend.profile.record_error()
+                    self._record_usage(feature, "complete", "empty", response.usage, prompt, 0,
+                                       latency, retries, user_id, plan_type, model=backend.model)
                     return "Error: Empty response from model"
 
             except Exception as e:
-                error_str = str(e)
-                # Handle Rate Limits (429) or Server Errors (5xx)
-                if ("429" in error_str or 
-                    "503" in error_str or 
-                    "502" in error_str or
-                    "overloaded" in error_str or
-                    "UNAVAILABLE" in error_str):
-                    
-                    if attempt < max_retries - 1:
-                        wait_time = 5 * (attempt + 1)
-                        print(f"OpenRouter/Gemini Busy (Attempt {attempt+1}/{max_retries}). Retrying in {wait_time}s... Error: {error_str[:100]}")
-                        await asyncio.sleep(wait_time)
-                        continue
-                return f"Error Generating RPP: {error_str}"
-        return "Error: Failed after retries (OpenRouter/Gemini System Busy)"
+                error = classify_error(e)
+                if response_format and error.kind == "response_format":
+                    print(f"DEBUG: response_format not supported, retrying as plain text: {error.message[:100]}")
+                    llm_retries.inc(reason="response_format")
+                    retries += 1
+                    response_format = None
+                    continue
+                delay = policy.next_delay(error)
+                if delay is not None:
+                    print(f"OpenRouter/Gemini {error.kind} (Attempt {policy.attempt}/{policy.max_attempts}). Retrying in {delay:.1f}s... Error: {error.message[:100]}")
+                    llm_retries.inc(reason=error.kind)
+                    retries += 1
+                    await asyncio.sleep(delay)
+                    continue
+                llm_calls.inc(mode="complete", outcome="error")
+                self._record_usage(feature, "complete", "error", None, prompt, 0, latency, retries, user_id, plan_type)
+                return _error_message(error)
+
+    async def stream_content(self, prompt: str, user_id=None, plan_type: str = "free", response_format: dict = None,
+                             feature: str = "other"):
+        """
+        Stream the completion as text deltas (OpenAI-compatible `stream=True`).
+
+        Transient errors are retried like generate_content, but only until the
+        first chunk arrives; a failure after that raises GeminiStreamError because the
+        caller has already forwarded partial output. Usage comes from the final chunk
+        (stream_options.include_usage) and is estimated if the stream ends early.
+        Hedging (see LLMRouter) and the deadline apply to the time to first token only.
+        Closing the generator or cancelling the task closes the upstream stream at once.
+        """
+        if not self.router.backends:
+            raise GeminiStreamError("Error: API Key Missing (OpenRouter)")
+
+        policy = RetryPolicy(feature)
+        retries = 0
+        while True:
+            received_any = False
+            usage = None
+            output_chars = 0
+            backend = None
+            started = time.monotonic()
+            try:
+                # The slot is held for the whole stream
+                async with llm_scheduler.slot(user_id, plan_type):
+                    policy.start()
+                    started = time.monotonic()
+                    async with asyncio.timeout(max(policy.remaining(), 0)):
+                        (stream, head), backend = await self.router.race(
+                            "stream", lambda b: self._open_stream(b, prompt, response_format), discard=self._close_stream
+                        )
+                    try:
+                        async for chunk in _prefixed(head, stream):
+                            if getattr(chunk, "usage", None):
+                                usage = chunk.usage
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content if chunk.choices[0].delta else None
+                            if delta:
+                                received_any = True
+                                output_chars += len(delta)
+                                yield delta
+                    finally:
+                        await stream.close() # Early exit/disconnect: stop the upstream generation and free the connection now
+                if not received_any:
+                    llm_calls.inc(mode="stream", outcome="empty")
+                    backend.profile.record_error()
+                    self._record_usage(feature, "stream", "empty", usage, prompt, 0,
+                                       time.monotonic() - started, retries, user_id, plan_type,
+                                       model=backend and backend.model)
+                    raise GeminiStreamError("Error: Empty response from model")
+                llm_calls.inc(mode="stream", outcome="ok")
+                self._record_usage(feature, "stream", "ok", usage, prompt, output_chars,
+                                   time.monotonic() - started, retries, user_id, plan_type,
+                                   model=backend and backend.model)
+                return
+
+            except GeminiStreamError:
+                raise
+            except (GeneratorExit, asyncio.CancelledError):
+                # Consumer stopped early (closed the generator) or the client disconnected (task cancelled)
+                llm_calls.inc(mode="stream", outcome="abandoned")
+                self._record_usage(feature, "stream", "abandoned", usage, prompt, output_chars,
+                                   time.monotonic() - started, retries, user_id, plan_type,
+                                   model=backend and backend.model)
+                raise
+            except Exception as e:
+                error = classify_error(e)
+                if received_any:
+                    # Broke mid-stream; the router only saw the first token
+                    backend.profile.record_error()
+                    if error.outage:
+                        backend.breaker.record_failure(error.retry_after)
+                if not received_any and response_format and error.kind == "response_format":
+                    print(f"DEBUG: response_format not supported, retrying stream as plain text: {error.message[:100]}")
+                    llm_retries.inc(reason="response_format")
+                    retries += 1
+                    response_format = None
+                    continue
+                delay = None if received_any else policy.next_delay(error)
+                if delay is not None:
+                    print(f"OpenRouter/Gemini {error.kind} (Attempt {policy.attempt}/{policy.max_attempts}). Retrying stream in {delay:.1f}s... Error: {error.message[:100]}")
+                    llm_retries.inc(reason=error.kind)
+                    retries += 1
+                    await asyncio.sleep(delay)
+                    continue
+                llm_calls.inc(mode="stream", outcome="error")
+                self._record_usage(feature, "stream", "error", usage, prompt, output_chars,
+                                   time.monotonic() - started, retries, user_id, plan_type,
+                                   model=backend and backend.model)
+                raise GeminiStreamError(_error_message(error)) from e
+
+    async def stream_json(self, prompt: str, parser: JSONStreamParser, user_id=None, plan_type: str = "free",
+                          response_format: dict = None, feature: str = "other"):
+        """
+        Stream a JSON completion through `parser`, yielding each element of its
+        target array as soon as the element closes. After the loop, parser.result()
+        is the whole document. Raises GeminiStreamError (stream failed) or
+        ValueError (malformed output, raised at the first broken element).
+        """
+        parse_seconds = 0.0 # Parser time only, summed across deltas; recorded as json_extraction
+        try:
+            # aclosing: a consumer that stops early closes the inner stream (slot + upstream) right away, not at GC
+            async with aclosing(self.stream_content(prompt, user_id=user_id, plan_type=plan_type,
+                                                    response_format=response_format, feature=feature)) as deltas:
+                async for delta in deltas:
+                    start = time.perf_counter()
+                    items = parser.feed(delta)
+                    parse_seconds += time.perf_counter() - start
+                    for item in items:
+                        yield item
+        finally:
+            stage_duration.observe(parse_seconds, stage="json_extraction")
 
 gemini_client = GeminiClient()
@@ -1,24 +1,58 @@
+import asyncio
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from contextlib import asynccontextmanager
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import logging
 
 from app.database import init_db, engine, Base
 from app.config import Config
-from app.models import user, curriculum, rpp_data, payment # Import all models here
-from app.routes import auth, rpp, curriculum, payment
+from app.models import user, curriculum, rpp_data, payment, job # Import all models here
+from app.routes import auth, rpp, curriculum, payment, admin
+from app.services.render_executor import render_executor
+from app.services.ppt_service import ppt_templates
+from app.services.tripay import tripay_service
+from app.security import password_hasher
+from app.services.job_queue import job_queue
+from app.services.curriculum_catalog import curriculum_catalog
+from app.services.search_service import search_index
+from app.services.llm_usage import llm_usage_recorder
+from app.metrics import registry, MetricsMiddleware, install_db_hooks
+from sqlalchemy.orm import Session
+
+# Time every ORM commit as the db_commit stage
+install_db_hooks(Session)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Init DB
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # Full-text search columns/indexes (Postgres tsvector or SQLite FTS5)
+    await search_index.setup(engine)
+    # Load PPT themes into memory once instead of per request
+    await asyncio.to_thread(ppt_templates.preload)
+    # Pooled Tripay client + background refresh of payment channels
+    await tripay_service.start()
+    # Tune pbkdf2 rounds to the hashing budget on this machine
+    await asyncio.to_thread(password_hasher.calibrate, Config.PBKDF2_ROUNDS)
+    # Background job workers (async PPT generation)
+    await job_queue.start()
+    # Curriculum served from memory, reloaded when the tables change
+    await curriculum_catalog.start()
+    # Buffered writer for per-call LLM token usage
+    await llm_usage_recorder.start()
     yield
     # Shutdown
+    await llm_usage_recorder.close()
+    await curriculum_catalog.close()
+    await job_queue.stop()
+    await tripay_service.close()
+    render_executor.shutdown()
+    password_hasher.shutdown()
 
 app = FastAPI(title="RPP AI Backend", lifespan=lifespan)
 
@@ -66,12 +100,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 3. Routes
+# 3. Metrics (outermost, so CORS/session time is included)
+app.add_middleware(MetricsMiddleware)
+
+# 4. Routes
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 app.include_router(rpp.router, prefix="/api/rpp", tags=["RPP"])
 app.include_router(curriculum.router) # Prefix defined in router
 app.include_router(payment.router, prefix="/api/payment", tags=["Payment"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 
 @app.get("/")
 def root():
     return {"message": "RPP AI Backend Online"}
+
+@app.get(Config.METRICS_PATH, include_in_schema=False)
+async def metrics(request: Request):
+    if Config.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {Config.METRICS_TOKEN}":
+        return PlainTextResponse("Unauthorized", status_code=401)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
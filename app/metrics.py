@@ -0,0 +1,311 @@
+import bisect
+import time
+from contextlib import contextmanager
+from app.config import Config
+
+# Seconds; spans cache hits (ms) up to a full PPT generation (~1 min)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 120)
+
+INF_LABEL = 'le="+Inf"'
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, key)} {_num(v)}" for key, v in sorted(self._values.items())
+        ]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    render = Counter.render
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        idx = bisect.bisect_left(self.buckets, value)
+        if idx < len(self.buckets):
+            entry[0][idx] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = self.header()
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = 'le="%s"' % _num(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """
+    In-process metrics in the Prometheus text format (no client library needed).
+
+    Counters/histograms are updated on the hot path; values that already live
+    elsewhere (cache counters, scheduler and pool state) are read by collectors
+    only when /metrics is scraped. Single event loop, so no locking; render-pool
+    threads never touch the registry.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register fn() to refresh gauges right before each scrape. Usable as a decorator."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"DEBUG: Metrics collector {fn.__name__} failed: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# --- HTTP (MetricsMiddleware) ---
+http_requests = registry.counter("http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_duration = registry.histogram("http_request_duration_seconds", "Time until the last response byte was sent.", ("method", "route"))
+http_in_flight = registry.gauge("http_requests_in_flight", "Requests currently being handled.")
+
+# --- Request stages ---
+# subscription_check, cp_lookup, prompt_build, context_compaction, llm_queue_wait, llm_call, json_extraction, render, db_commit
+stage_duration = registry.histogram("stage_duration_seconds", "Time spent per request stage.", ("stage",))
+
+def stage_timer(stage: str):
+    """`with stage_timer("cp_lookup"): ...` records into stage_duration_seconds."""
+    return stage_duration.time(stage=stage)
+
+# --- LLM (GeminiClient) ---
+llm_calls = registry.counter("llm_calls_total", "LLM calls by mode (complete/stream) and outcome.", ("mode", "outcome"))
+llm_retries = registry.counter("llm_retries_total", "LLM attempts retried, by error kind (rate_limit, overloaded, timeout, ...).", ("reason",))
+llm_in_flight = registry.gauge("llm_in_flight", "LLM calls holding a scheduler slot.")
+llm_waiting = registry.gauge("llm_waiting", "LLM calls queued for a scheduler slot.")
+llm_capacity = registry.gauge("llm_capacity", "LLM_MAX_CONCURRENCY.")
+llm_backend_calls = registry.counter(
+    "llm_backend_calls_total", "Calls per LLM backend (stream = until first token) by outcome.", ("backend", "mode", "outcome")
+)
+llm_hedges = registry.counter("llm_hedges_total", "Hedged/failover requests: fired, skipped_budget, skipped_capacity, primary_won, hedge_won, failover.", ("outcome",))
+llm_circuit_state = registry.gauge("llm_circuit_state", "Circuit breaker per backend: 0 closed, 1 half_open, 2 open.", ("backend",))
+llm_circuit_transitions = registry.counter("llm_circuit_transitions_total", "Circuit breaker state changes by new state.", ("backend", "state"))
+llm_backend_latency = registry.gauge("llm_backend_latency_seconds", "Rolling latency quantile per backend (stream = time to first token).", ("backend", "mode", "quantile"))
+llm_backend_error_rate = registry.gauge("llm_backend_error_rate", "Failed share of the backend's recent calls.", ("backend",))
+llm_backend_share = registry.gauge("llm_backend_routing_share", "Probability of the backend being picked as primary.", ("backend", "mode"))
+prompt_context_tokens = registry.counter(
+    "prompt_context_tokens_total", "Estimated Modul Ajar tokens per PPT/quiz prompt, before and after compaction.", ("feature", "kind")
+)
+
+# --- Caches ---
+cache_hits = registry.gauge("cache_hits", "Cache hits since start.", ("cache",))
+cache_misses = registry.gauge("cache_misses", "Cache misses since start.", ("cache",))
+cache_hit_ratio = registry.gauge("cache_hit_ratio", "Hits / lookups since start.", ("cache",))
+
+# --- Render pool ---
+render_pending = registry.gauge("render_jobs_pending", "Render jobs running or queued.")
+render_capacity = registry.gauge("render_jobs_capacity", "Render workers + queue limit.")
+
+# --- DB pool ---
+db_pool_size = registry.gauge("db_pool_size", "Configured pool size.")
+db_pool_checked_out = registry.gauge("db_pool_checked_out", "Connections in use.")
+db_pool_overflow = registry.gauge("db_pool_overflow", "Connections opened beyond pool_size.")
+db_pool_saturation = registry.gauge("db_pool_saturation", "Checked out / (pool_size + max_overflow).")
+
+@registry.collector
+def _collect_services():
+    from app.services.llm_scheduler import llm_scheduler
+    from app.services.render_executor import render_executor
+    from app.services.generation_cache import generation_cache
+    from app.services.artifact_cache import artifact_cache
+    from app.services.entitlements import entitlement_resolver
+    from app.gemini_client import gemini_client
+
+    sched = llm_scheduler.stats()
+    llm_in_flight.set(sched["in_flight"])
+    llm_waiting.set(sched["waiting"])
+    llm_capacity.set(sched["capacity"])
+
+    for backend in gemini_client.router.stats():
+        name = backend["name"]
+        llm_backend_error_rate.set(backend["error_rate"], backend=name)
+        for mode, share in backend["routing_share"].items():
+            llm_backend_share.set(share, backend=name, mode=mode)
+            if backend["p50_seconds"][mode] is not None:
+                llm_backend_latency.set(backend["p50_seconds"][mode], backend=name, mode=mode, quantile="0.5")
+            llm_backend_latency.set(backend["hedge_delay_seconds"][mode], backend=name, mode=mode, quantile="hedge")
+
+    render_pending.set(render_executor.pending)
+    render_capacity.set(render_executor.max_workers + render_executor.max_queue)
+
+    for name, stats in (("generation", generation_cache.stats()),
+                        ("exports", artifact_cache.stats()),
+                        ("entitlements", entitlement_resolver.stats())):
+        hits = stats.get("hits", 0) + stats.get("disk_hits", 0)
+        misses = stats.get("misses", 0)
+        cache_hits.set(hits, cache=name)
+        cache_misses.set(misses, cache=name)
+        cache_hit_ratio.set(round(hits / (hits + misses), 4) if hits + misses else 0, cache=name)
+
+@registry.collector
+def _collect_db_pool():
+    from app.database import engine
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"): # NullPool/StaticPool (e.g. SQLite) have no sizing
+        return
+    size, checked_out = pool.size(), pool.checkedout()
+    db_pool_size.set(size)
+    db_pool_checked_out.set(checked_out)
+    db_pool_overflow.set(max(pool.overflow(), 0))
+    capacity = size + max(getattr(pool, "_max_overflow", 0), 0)
+    db_pool_saturation.set(round(checked_out / capacity, 4) if capacity > 0 else 0)
+
+def install_db_hooks(session_class):
+    """Time every ORM commit (flush + COMMIT) as the db_commit stage."""
+    from sqlalchemy import event
+
+    @event.listens_for(session_class, "before_commit")
+    def _before_commit(session):
+        session.info["metrics_commit_start"] = time.perf_counter()
+
+    def _done(session):
+        start = session.info.pop("metrics_commit_start", None)
+        if start is not None:
+            stage_duration.observe(time.perf_counter() - start, stage="db_commit")
+
+    event.listen(session_class, "after_commit", _done)
+    event.listen(session_class, "after_soft_rollback", lambda session, previous_transaction: _done(session))
+
+def _route_template(scope) -> str:
+    """
+    Path template of the matched route, e.g. /api/rpp/history/{rpp_id}.
+    Routers included with a prefix may report only their own part of the path,
+    so the static prefix is taken back from the request path.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+    path, regex = scope["path"], getattr(route, "path_regex", None)
+    if regex is not None and not regex.match(path):
+        for i, ch in enumerate(path):
+            if ch == "/" and i and regex.match(path[i:]):
+                return path[:i] + template
+    return template
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: counts requests and times them until the last body
+    chunk, so streamed responses (SSE, downloads) are measured end to end.
+    Routes are labelled by their template (/api/rpp/history/{rpp_id}); unmatched
+    paths share one label to keep the series count bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == Config.METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+        http_in_flight.inc()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            template = _route_template(scope)
+            method = scope["method"]
+            http_requests.inc(method=method, route=template, status=status["code"])
+            http_duration.observe(time.perf_counter() - start, method=method, route=template)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -11,6 +11,11 @@ class Subject(Base):
 
     goals = relationship("CurriculumGoal", back_populates="subject")
 
+    __table_args__ = (
+        # Upsert key of the curriculum importer
+        Index("uq_subjects_name", "name", unique=True),
+    )
+
 class CurriculumGoal(Base):
     __tablename__ = "curriculum_goals"
 
@@ -22,3 +27,8 @@ class CurriculumGoal(Base):
     version = Column(String, default="2024")
 
     subject = relationship("Subject", back_populates="goals")
+
+    __table_args__ = (
+        # Upsert key of the curriculum importer; also serves the (subject_id, phase) lookup
+        Index("uq_curriculum_goals_key", "subject_id", "phase", "element", "version", unique=True),
+    )
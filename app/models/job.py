@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
+from app.database import Base
+from app.utils.time_utils import get_jakarta_time
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String(32), primary_key=True) # uuid4 hex
+    kind = Column(String, nullable=False) # 'ppt'
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    dedup_key = Column(String(64), nullable=False) # Hash of the job inputs
+
+    status = Column(String, nullable=False, default="queued") # queued, running, done, failed
+    payload = Column(JSON, nullable=False) # Handler input
+    result = Column(JSON, nullable=True) # Handler output
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=get_jakarta_time)
+    updated_at = Column(DateTime, default=get_jakarta_time, onupdate=get_jakarta_time)
+
+    __table_args__ = (
+        # Dedup lookup: same user + same inputs
+        Index("ix_jobs_user_kind_dedup", "user_id", "kind", "dedup_key"),
+        Index("ix_jobs_status", "status"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, SmallInteger, String, Text, DateTime, ForeignKey, JSON, Index, UniqueConstraint, Boolean, Float
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -18,6 +18,8 @@ class SavedRPP(Base):
     # Content
     content_markdown = Column(Text, nullable=False) # The generated RPP
     input_data = Column(JSON, nullable=True) # Full form inputs
+    content_ast = Column(JSON, nullable=True) # {"v": AST_VERSION, "blocks": [...]} from app.utils.markdown_ast
+    content_hash = Column(String(64), nullable=True) # SHA-256 of content_markdown
     
     created_at = Column(DateTime, default=get_jakarta_time)
     updated_at = Column(DateTime, default=get_jakarta_time, onupdate=get_jakarta_time)
@@ -25,6 +27,11 @@ class SavedRPP(Base):
     # Relationship
     owner = relationship("User", back_populates="rpps")
 
+    __table_args__ = (
+        # History pages: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_saved_rpps_user_created_id", "user_id", "created_at", "id"),
+    )
+
 class SavedQuiz(Base):
     __tablename__ = "saved_quizzes"
 
@@ -44,6 +51,11 @@ class SavedQuiz(Base):
     # Relationship
     owner = relationship("User", back_populates="quizzes")
 
+    __table_args__ = (
+        # Quiz lookup for a history item by (mapel, topik)
+        Index("ix_saved_quizzes_user_mapel_topik", "user_id", "mapel", "topik"),
+    )
+
 class GenerationLog(Base):
     __tablename__ = "generation_logs"
 
@@ -53,6 +65,52 @@ class GenerationLog(Base):
     plan_type = Column(String, nullable=False) # Store plan at time of generation
     created_at = Column(DateTime, default=get_jakarta_time)
 
+    __table_args__ = (
+        Index("ix_generation_logs_user_created", "user_id", "created_at"),
+    )
+
+class LLMUsage(Base):
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True) # None for calls outside a request
+    plan_type = Column(String(16), nullable=True)
+    feature = Column(String(16), nullable=False) # rpp, ppt, quiz, other
+
+    model = Column(String(64), nullable=False)
+    mode = Column(String(8), nullable=False) # complete, stream
+    status = Column(String(12), nullable=False) # ok, empty, error, abandoned
+
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0) # Part of prompt_tokens served from the provider cache
+    usage_estimated = Column(Boolean, nullable=False, default=False) # No usage block; counted from text length
+    cost_usd = Column(Float, nullable=False, default=0.0) # At the LLM_PRICE_* in effect when recorded
+
+    latency_ms = Column(Integer, nullable=False, default=0) # Last attempt, slot held (excludes queue wait)
+    retries = Column(SmallInteger, nullable=False, default=0)
+    created_at = Column(DateTime, default=get_jakarta_time)
+
+    __table_args__ = (
+        # Aggregates are always over a time window
+        Index("ix_llm_usage_created", "created_at"),
+        Index("ix_llm_usage_user_created", "user_id", "created_at"),
+    )
+
+class UsageCounter(Base):
+    __tablename__ = "usage_counters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    
+    period = Column(String(7), nullable=False) # 'YYYY-MM' (Asia/Jakarta)
+    count = Column(Integer, nullable=False, default=0) # RPP generations in this period
+    updated_at = Column(DateTime, default=get_jakarta_time, onupdate=get_jakarta_time)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "period", name="uq_usage_counters_user_period"),
+    )
+
 # Update User model to include this relationship? 
 # Or just define back_populates here and ensure User model has it or we can skip back_populates on one side if not needed.
 # Let's check user.py content first to be clean, but for now defining it here is step 1.
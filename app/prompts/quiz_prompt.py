@@ -0,0 +1,63 @@
+def explanation_instruction(with_explanation: bool) -> str:
+    if not with_explanation:
+        # Standard: Kunci Jawaban (Tanpa Pembahasan)
+        return "DILARANG KERAS memberikan penjelasan atau pembahasan. Biarkan field 'penjelasan' berisi STRING KOSONG (\"\"). Jangan tulis apapun di sana."
+    # Pro/Premium: Kunci + Pembahasan Lengkap
+    return "Berikan kunci jawaban beserta penjelasan lengkap dan mendalam mengapa jawaban itu benar pada field 'penjelasan'."
+
+def build_quiz_prompt(
+    rpp_content: str,
+    jumlah_soal: int,
+    tingkat_kesulitan: str,
+    with_explanation: bool,
+    start_no: int = 1,
+    part: int = 1,
+    total_parts: int = 1,
+    avoid_questions: list = None
+) -> str:
+    """
+    Prompt for `jumlah_soal` multiple-choice questions numbered from `start_no`.
+    With total_parts > 1 the request is one chunk of a batched quiz; each chunk is
+    steered to a different part of the material so parallel chunks do not overlap.
+    """
+    chunk_rule = ""
+    if total_parts > 1:
+        chunk_rule = (
+            f"\n5. Ini adalah bagian {part} dari {total_parts}. Ambil soal dari bagian materi ke-{part} "
+            f"(bagi materi Modul Ajar menjadi {total_parts} bagian berurutan) agar tidak sama dengan bagian lain."
+        )
+    if avoid_questions:
+        listed = "\n".join(f"- {q}" for q in avoid_questions)
+        chunk_rule += f"\n6. JANGAN mengulang atau memparafrasekan soal berikut:\n{listed}"
+
+    return f"""
+Berdasarkan Modul Ajar berikut:
+{rpp_content}
+
+Buatkan {jumlah_soal} soal pilihan ganda dengan tingkat kesulitan {tingkat_kesulitan}.
+
+Aturan:
+1. Gunakan bahasa Indonesia yang baku dan sesuai umur siswa di Fase tersebut.
+2. Berikan 4 pilihan jawaban (A, B, C, D).
+3. {explanation_instruction(with_explanation)}
+4. Output harus dalam format JSON murni.{chunk_rule}
+
+Struktur JSON:
+{{
+  "judul_kuis": "Judul Kuis",
+  "questions": [
+    {{
+      "no": {start_no},
+      "pertanyaan": "Teks pertanyaan...",
+      "options": {{
+        "A": "Jawaban A",
+        "B": "Jawaban B",
+        "C": "Jawaban C",
+        "D": "Jawaban D"
+      }},
+      "kunci_jawaban": "A",
+      "penjelasan": "Karena..."
+    }}
+  ]
+}}
+"""
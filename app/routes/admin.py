@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db
+from app.security import require_admin_key
+from app.services.llm_usage import llm_usage_recorder, GROUP_COLUMNS
+
+router = APIRouter(dependencies=[Depends(require_admin_key)])
+
+@router.get("/llm-usage")
+async def get_llm_usage(
+    days: int = 30,
+    group_by: str = "plan,feature", # Comma-separated: plan, feature, model, user, status, day
+    db: AsyncSession = Depends(get_db)
+):
+    """Tokens, spend and tokens/sec of LLM calls, e.g. ?group_by=plan or ?group_by=feature,day&days=7."""
+    dimensions = [d.strip() for d in group_by.split(",") if d.strip()]
+    unknown = [d for d in dimensions if d not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"group_by tidak dikenal: {', '.join(unknown)}. Pilihan: {', '.join(GROUP_COLUMNS)}")
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days harus antara 1 dan 366.")
+
+    # Include calls still waiting in the write buffer
+    try:
+        await llm_usage_recorder.flush()
+    except Exception as e:
+        print(f"DEBUG: LLM usage flush before report failed: {e}")
+
+    report = await llm_usage_recorder.summarize(db, days, list(dict.fromkeys(dimensions)))
+    report["recorder"] = llm_usage_recorder.stats()
+    return report
+
+@router.get("/llm-backends")
+async def get_llm_backends():
+    """Rolling latency/error profile, hedge delay and routing share of each LLM backend."""
+    from app.gemini_client import gemini_client
+    return {"hedge": gemini_client.router.hedge, "backends": gemini_client.router.stats()}
@@ -7,7 +7,7 @@ import os
 from app.database import get_db
 from app.models.user import User
 from app.schemas.auth_schema import UserCreate, UserLogin, UserResponse
-from app.security import get_password_hash, verify_password
+from app.security import password_hasher
 
 router = APIRouter()
 
@@ -44,7 +44,7 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
 
     new_user = User(
         email=user_in.email,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await password_hasher.hash(user_in.password),
         full_name=user_in.full_name
     )
     db.add(new_user)
@@ -57,12 +57,21 @@ async def login(request: Request, user_in: UserLogin, db: AsyncSession = Depends
     result = await db.execute(select(User).where(User.email == user_in.email))
     user = result.scalar_one_or_none()
 
-    if not user or not user.hashed_password or not verify_password(user_in.password, user.hashed_password):
+    if not user or not user.hashed_password:
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
+    # Verify off the event loop; legacy bcrypt / weak hashes come back re-hashed
+    valid, new_hash = await password_hasher.verify_and_update(user_in.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid email or password")
+    user_id, email = user.id, user.email
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
     # Set Session Cookie
-    request.session["user_id"] = user.id
-    return {"message": "Login successful", "user": {"id": user.id, "email": user.email}}
+    request.session["user_id"] = user_id
+    return {"message": "Login successful", "user": {"id": user_id, "email": email}}
 
 @router.post("/logout")
 async def logout(request: Request):
@@ -127,20 +136,11 @@ async def get_current_user(request: Request, db: AsyncSession = Depends(get_db))
         raise HTTPException(status_code=401, detail="User not found")
     
     # Check Subscription
-    from app.models.payment import Subscription
-    from app.utils.time_utils import get_jakarta_time
-    
-    sub_res = await db.execute(
-        select(Subscription).where(
-            Subscription.user_id == user_id,
-            Subscription.is_active == True,
-            Subscription.end_date > get_jakarta_time()
-        )
-    )
-    subscription = sub_res.scalars().first()
+    from app.services.entitlements import entitlement_resolver
+    entitlement = await entitlement_resolver.resolve(db, user_id)
     
     # Attach plan type to user object for UserResponse mapping
-    raw_plan = subscription.plan_type if subscription else "free"
+    raw_plan = entitlement.plan_type
     
     # Map 'monthly' and 'yearly' to 'pro' for easier frontend handling
     if raw_plan in ["monthly", "yearly"]:
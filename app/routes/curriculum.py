@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.database import get_db
 from app.models.curriculum import Subject, CurriculumGoal
+from app.services.curriculum_catalog import curriculum_catalog
+from app.config import Config
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -56,20 +58,26 @@ async def seed_data(db: AsyncSession = Depends(get_db)):
     
     db.add_all(goals)
     await db.commit()
+    await curriculum_catalog.reload()
     
     return {"message": "Seeded successfully"}
 
+def _catalog_response(request: Request, body: bytes, etag: str) -> Response:
+    """Pre-serialized catalog JSON with a strong ETag; 304 when the client already has it."""
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={Config.CURRICULUM_MAX_AGE}"}
+    header = request.headers.get("if-none-match")
+    if header and (etag in [c.strip() for c in header.split(",")] or header.strip() == "*"):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Served from the in-memory curriculum catalog (response_model kept for the OpenAPI docs)
 @router.get("/subjects", response_model=List[SubjectResponse])
-async def get_subjects(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Subject))
-    return result.scalars().all()
+async def get_subjects(request: Request):
+    catalog = await curriculum_catalog.snapshot()
+    return _catalog_response(request, catalog.subjects_body, catalog.subjects_etag)
 
 @router.get("/goals", response_model=List[GoalResponse])
-async def get_goals(subject_id: int, phase: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(CurriculumGoal).where(
-            CurriculumGoal.subject_id == subject_id,
-            CurriculumGoal.phase == phase
-        )
-    )
-    return result.scalars().all()
+async def get_goals(subject_id: int, phase: str, request: Request):
+    catalog = await curriculum_catalog.snapshot()
+    body, etag = catalog.goals(subject_id, phase)
+    return _catalog_response(request, body, etag)
@@ -12,14 +12,14 @@ from datetime import datetime, timedelta
 from app.database import get_db
 from app.models.user import User
 from app.models.payment import Transaction, Subscription, PaymentStatus
+from app.services.entitlements import entitlement_resolver
 from app.routes.auth import get_current_user
-from app.services.tripay import TripayService
+from app.services.tripay import tripay_service
 from app.utils.time_utils import get_jakarta_time
 
 from app.schemas.payment_schema import TransactionResponse
 
 router = APIRouter()
-tripay_service = TripayService()
 logger = logging.getLogger(__name__)
 
 @router.get("/history", response_model=List[TransactionResponse])
@@ -67,6 +67,7 @@ async def get_plans():
 @router.get("/channels")
 async def get_channels():
     try:
+        # Served from the cache kept fresh in the background
         channels_res = await tripay_service.get_payment_channels()
         return channels_res
     except Exception as e:
@@ -83,11 +84,9 @@ async def create_payment(
     if not plan:
         raise HTTPException(status_code=400, detail="Invalid Plan ID")
 
-    # Calculate Fee (User bears the fee)
+    # Calculate Fee (User bears the fee), from the cached fee table
     try:
-        channels_res = await tripay_service.get_payment_channels()
-        channels = channels_res.get("data", [])
-        channel = next((c for c in channels if c["code"] == req.payment_method), None)
+        channel = await tripay_service.get_channel(req.payment_method)
         
         if not channel:
             raise HTTPException(status_code=400, detail="Metode pembayaran tidak valid.")
@@ -99,6 +98,8 @@ async def create_payment(
         total_fee = flat_fee + int((plan.price * percent_fee) / 100)
         total_amount = plan.price + total_fee
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error calculating fees: {e}")
         # Fallback to base price if something fails, but better to error to be transparent
@@ -238,7 +239,11 @@ async def payment_callback(request: Request, db: AsyncSession = Depends(get_db))
         elif status == "FAILED":
             trx.payment_status = PaymentStatus.FAILED.value
             
+        paid_user_id = trx.user_id if status == "PAID" else None
         await db.commit()
+        if paid_user_id is not None:
+            # Drop the cached plan so the new features apply on the next request
+            await entitlement_resolver.invalidate(paid_user_id)
         logger.info(f"Callback processed successfully for {merchant_ref}")
         
         return {"success": True}
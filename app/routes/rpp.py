@@ -1,121 +1,126 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
+import base64
+from contextlib import aclosing
 import json
+import math
 import re
 import traceback
 from app.utils.time_utils import get_jakarta_time
-import io
-from fpdf import FPDF
-from docx import Document
-from docx.shared import Pt, RGBColor
 from app.schemas.rpp_schema import RPPRequest, RPPResponse, RPPData
 from app.prompts.rpp_prompt import build_rpp_prompt
-from app.gemini_client import gemini_client
+from app.gemini_client import gemini_client, GeminiStreamError, json_response_format
 from app.security import get_current_user_id # Restored
 from app.services.ppt_service import PPTService # Restored
+from app.services.export_service import ExportService
+from app.services.render_executor import render_executor, RenderQueueFull
+from app.services.artifact_cache import artifact_cache
+from app.services.llm_scheduler import llm_scheduler
+from app.services.generation_cache import generation_cache
+from app.services.entitlements import Entitlement, entitlement_resolver, get_entitlement
+from app.services.usage_service import UsageService
+from app.services.curriculum_catalog import curriculum_catalog
+from app.services.search_service import search_index
+from app.services.quiz_service import QuizService, QuizGenerationError
+from app.services.job_queue import job_queue, make_dedup_key, JOB_DONE, JOB_FAILED
+from app.schemas.ppt_schema import PPTSlide, PPT_JSON_SCHEMA
+from app.utils.json_stream import JSONStreamParser
+from app.utils.markdown_ast import parse_markdown_cached, build_content_ast, content_hash, AST_VERSION
+from app.metrics import stage_timer, prompt_context_tokens
+from app.utils.context_compactor import compact_context
+from app.config import Config
 
 router = APIRouter() # Restored
 
 from app.database import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.models.curriculum import Subject, CurriculumGoal
 
 from datetime import datetime, date
 
-def clean_text(text: str) -> str:
-    """Clean text to be compatible with FPDF's default latin-1 fonts."""
-    if not text:
-        return ""
-    # Standardize spaces and common unicode characters
-    text = str(text)
-    text = text.replace('\r', '')
-    text = text.replace('\u2013', '-').replace('\u2014', '-').replace('\u2019', "'").replace('\u2018', "'")
-    text = text.replace('\u201c', '"').replace('\u201d', '"').replace('\u2022', '\x95')
-    # Force to latin-1, replacing anything else with '?'
-    # This prevents UnicodeEncodeError in fpdf2
-    return text.encode('latin-1', 'replace').decode('latin-1')
-
-def clean_markdown_symbols(text: str) -> str:
-    """Extra robust function to remove markdown symbols like **, *, etc."""
-    if not text: return ""
-    # Remove bold/italic markers
-    text = text.replace('***', '').replace('**', '').replace('*', '')
-    # Remove underline markers if any
-    text = text.replace('__', '').replace('_', '')
-    return text.strip()
-
-@router.post("/generate", response_model=RPPResponse)
-async def generate_rpp(
-    request: RPPRequest, 
-    curr_req: Request, 
-    user_id: int = Depends(get_current_user_id),
-    db: AsyncSession = Depends(get_db)
-):
-    from app.models.payment import Subscription
-    from app.models.rpp_data import SavedRPP, GenerationLog
-    from sqlalchemy import func
+def _render_busy_error(e: RenderQueueFull) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server sedang sibuk membuat dokumen lain. Silakan coba lagi sebentar.",
+        headers={"Retry-After": str(e.retry_after)}
+    )
 
-    # 0. Check Subscription & Limits
-    # a. Get active subscription
-    sub_res = await db.execute(
-        select(Subscription).where(
-            Subscription.user_id == user_id,
-            Subscription.is_active == True,
-            Subscription.end_date > get_jakarta_time()
+def _ensure_llm_available():
+    """Fail fast with 503 while the circuit breaker of every LLM backend is open."""
+    retry_after = gemini_client.router.retry_after()
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=503,
+            detail="Layanan AI sedang gangguan. Silakan coba lagi sebentar.",
+            headers={"Retry-After": str(math.ceil(retry_after))}
         )
+
+async def _render(fn, *args, **kwargs):
+    """Run a document builder on the render pool, mapping backpressure to 503."""
+    try:
+        return await render_executor.run(fn, *args, **kwargs)
+    except RenderQueueFull as e:
+        raise _render_busy_error(e)
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+async def _export_response(request: Request, key: str, media_type: str, filename: str, render) -> Response:
+    """
+    Serve an export from the artifact cache, rendering only on a miss.
+    The content-addressed key is the ETag, so repeat downloads can be answered with 304.
+    """
+    etag = f'"{key}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers)
+
+    content = await artifact_cache.get_or_render(key, render)
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Access-Control-Expose-Headers": "Content-Disposition, ETag",
+            **cache_headers
+        }
     )
-    subscription = sub_res.scalars().first()
-    
-    plan_type = subscription.plan_type if subscription else "free"
+
+def _quota_error(usage_count: int, limit: int) -> HTTPException:
+    return HTTPException(
+        status_code=403, 
+        detail=f"Kuota RPP Anda sudah habis ({usage_count}/{limit}) bulan ini. Upgrade paket untuk kuota lebih banyak."
+    )
+
+async def _prepare_rpp_generation(request: RPPRequest, user_id: int, entitlement: Entitlement, db: AsyncSession):
+    """
+    Check the user's quota and build the Modul Ajar prompt.
+    Returns (prompt, plan_type, cache_key) where cache_key addresses generation_cache.
+    """
+    # 0. Check Subscription & Limits
+    # a. Plan and quota come from the (cached) entitlement
+    plan_type = entitlement.plan_type
+    limit = entitlement.rpp_limit
     
     # b. Check Usage based on Plan
-    # Limits
-    LIMITS = {
-        "free": 2,
-        "standard": 10,
-        "pro": 25,
-        "premium": 60,
-        # Legacy/Other
-        "monthly": 25, 
-        "yearly": 300,
-        "school": 1000
-    }
-    
-    limit = LIMITS.get(plan_type, 2) # Default to free limit
 
-    # Count RPP Generations in the current month
-    today = date.today()
-    first_day = today.replace(day=1)
-    
-    count_stmt = select(func.count(GenerationLog.id)).where(
-        GenerationLog.user_id == user_id,
-        GenerationLog.created_at >= first_day
-    )
-    count_res = await db.execute(count_stmt)
-    usage_count = count_res.scalar() or 0
+    # Pre-check against this month's usage counter (the real check happens in UsageService.consume)
+    usage_count = await UsageService.get_usage(db, user_id)
     
     if usage_count >= limit:
-        raise HTTPException(
-            status_code=403, 
-            detail=f"Kuota RPP Anda sudah habis ({usage_count}/{limit}) bulan ini. Upgrade paket untuk kuota lebih banyak."
-        )
+        raise _quota_error(usage_count, limit)
 
-    # Proceed with generation...
-    # Debug Session
-    print(f"DEBUG SESSION: {curr_req.session}")
-    
-    # 0. Fetch CP Content from DB (Smart Logic)
+    # 0. Fetch CP Content from the in-memory curriculum catalog (Smart Logic)
     db_cp_content = None
     try:
         # Cari CP berdasarkan Mapel (Nama), Fase, dan Elemen
-        stmt = select(CurriculumGoal.cp_content).join(Subject).where(
-            Subject.name == request.mapel,
-            CurriculumGoal.phase == request.fase,
-            CurriculumGoal.element == request.elemen
-        )
-        result = await db.execute(stmt)
-        cp_found = result.scalar_one_or_none()
+        with stage_timer("cp_lookup"):
+            catalog = await curriculum_catalog.snapshot()
+            cp_found = catalog.cp_content(request.mapel, request.fase, request.elemen)
         
         if cp_found:
             db_cp_content = cp_found
@@ -126,19 +131,44 @@ async def generate_rpp(
         print(f"Error fetching CP: {e}")
 
     # 1. Build Prompt with CP
-    prompt = build_rpp_prompt(request, db_cp_content)
-    
-    # 2. Call AI
-    result_text = await gemini_client.generate_content(prompt)
+    with stage_timer("prompt_build"):
+        prompt = build_rpp_prompt(request, db_cp_content)
+        cache_key = generation_cache.make_key(request, db_cp_content, gemini_client.model)
+
+    # Release the pooled DB connection while we wait on the LLM
+    await db.commit()
+    return prompt, plan_type, cache_key
+
+@router.post("/generate", response_model=RPPResponse)
+async def generate_rpp(
+    request: RPPRequest, 
+    curr_req: Request, 
+    fresh: bool = False, # Skip the generation cache and always call the AI
+    user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
+    db: AsyncSession = Depends(get_db)
+):
+    # Debug Session
+    print(f"DEBUG SESSION: {curr_req.session}")
+
+    # 0-1. Check quota, fetch CP and build prompt
+    prompt, plan_type, cache_key = await _prepare_rpp_generation(request, user_id, entitlement, db)
     
-    # 3. Validation: Stop if AI returned an error string
-    if result_text.startswith("Error"):
-        raise HTTPException(status_code=500, detail=result_text)
+    # 2. Call AI (unless an identical prompt was generated recently)
+    result_text = None if fresh else generation_cache.get(cache_key, request)
+    if result_text is None:
+        _ensure_llm_available()
+        result_text = await gemini_client.generate_content(prompt, user_id=user_id, plan_type=plan_type, feature="rpp")
+        
+        # 3. Validation: Stop if AI returned an error string
+        if result_text.startswith("Error"):
+            raise HTTPException(status_code=500, detail=result_text)
+        generation_cache.put(cache_key, request, result_text)
     
-    # 4. Log Generation (Success)
-    new_log = GenerationLog(user_id=user_id, plan_type=plan_type)
-    db.add(new_log)
-    await db.commit()
+    # 4. Log Generation (Success): take one from the quota and log it in one transaction
+    if not await UsageService.record_generation(db, user_id, plan_type, entitlement.rpp_limit):
+        # A parallel request used the last slot while we were waiting on the AI
+        raise _quota_error(entitlement.rpp_limit, entitlement.rpp_limit)
     
     # 5. Return
     return RPPResponse(
@@ -148,7 +178,99 @@ async def generate_rpp(
         )
     )
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/generate/stream")
+async def generate_rpp_stream(
+    request: RPPRequest,
+    fresh: bool = False, # Skip the generation cache and always call the AI
+    user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Same as /generate but relays the Modul Ajar as Server-Sent Events while it is written.
+
+    Events: `start` ({"cached": bool}), an optional `queue` (position/ETA), then
+    `chunk` ({"text": delta}) repeatedly, then either `done` ({"length": n}) or
+    `error` ({"detail": msg}). Quota is consumed (usage counter + GenerationLog)
+    only when the stream completes successfully.
+    """
+    from app.database import SessionLocal
+
+    # Quota/CP/prompt run before the stream opens so errors still come back as normal HTTP errors
+    prompt, plan_type, cache_key = await _prepare_rpp_generation(request, user_id, entitlement, db)
+    cached_text = None if fresh else generation_cache.get(cache_key, request)
+    if cached_text is None:
+        _ensure_llm_available()
+
+    async def event_stream():
+        yield _sse("start", {"topik": request.topik, "cached": cached_text is not None})
+
+        if cached_text is not None:
+            result_text = cached_text
+            for offset in range(0, len(result_text), 2048):
+                yield _sse("chunk", {"text": result_text[offset:offset + 2048]})
+        else:
+            # Tell the client where it stands if the LLM scheduler is saturated
+            queue = llm_scheduler.estimate(user_id, plan_type)
+            if queue["position"]:
+                yield _sse("queue", queue)
+
+            parts = []
+            try:
+                async for delta in gemini_client.stream_content(prompt, user_id=user_id, plan_type=plan_type, feature="rpp"):
+                    parts.append(delta)
+                    yield _sse("chunk", {"text": delta})
+            except GeminiStreamError as e:
+                yield _sse("error", {"detail": str(e)})
+                return
+
+            result_text = "".join(parts)
+            if result_text.startswith("Error"):
+                yield _sse("error", {"detail": result_text})
+                return
+            generation_cache.put(cache_key, request, result_text)
+
+        # The request-scoped session may already be closed once streaming starts
+        async with SessionLocal() as session:
+            recorded = await UsageService.record_generation(session, user_id, plan_type, entitlement.rpp_limit)
+        if not recorded:
+            yield _sse("error", {"detail": _quota_error(entitlement.rpp_limit, entitlement.rpp_limit).detail})
+            return
+
+        yield _sse("done", {"length": len(result_text)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no" # Disable proxy buffering (nginx)
+        }
+    )
+
+@router.get("/cache-stats")
+async def get_cache_stats(user_id: int = Depends(get_current_user_id)):
+    """Hit-rate counters for the generation, rendered export and entitlement caches, plus the curriculum catalog."""
+    return {
+        "generation": generation_cache.stats(),
+        "exports": artifact_cache.stats(),
+        "entitlements": entitlement_resolver.stats(),
+        "curriculum": curriculum_catalog.stats()
+    }
+
+@router.get("/queue-status")
+async def get_queue_status(
+    user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement)
+):
+    """Queue position and ETA of the user's oldest waiting AI request, or what a new request would face."""
+    return llm_scheduler.estimate(user_id, entitlement.plan_type)
+
 from pydantic import BaseModel
+from typing import Optional
 class SaveRPPRequest(BaseModel):
     mapel: str
     kelas: str
@@ -174,24 +296,96 @@ async def save_rpp(
         kelas=req.kelas,
         topik=req.topik,
         content_markdown=req.content_markdown,
-        input_data=req.input_data
+        input_data=req.input_data,
+        # Parsed once here; exports by rpp_id render straight from it
+        content_ast=build_content_ast(req.content_markdown),
+        content_hash=content_hash(req.content_markdown)
     )
     db.add(new_rpp)
     await db.commit()
     await db.refresh(new_rpp)
     
-    return {"message": "RPP Saved Successfully", "id": new_rpp.id}
+    return {"message": "RPP Saved Successfully", "id": new_rpp.id, "content_hash": new_rpp.content_hash}
+
+async def _store_rpp_ast(db: AsyncSession, rpp_id: int) -> dict:
+    """Parse a SavedRPP saved before content_ast existed (or with an old AST version) and persist it."""
+    from app.models.rpp_data import SavedRPP
+    from sqlalchemy import update
+
+    res = await db.execute(select(SavedRPP.content_markdown).where(SavedRPP.id == rpp_id))
+    content_markdown = res.scalar() or ""
+    content_ast = build_content_ast(content_markdown)
+    await db.execute(
+        update(SavedRPP).where(SavedRPP.id == rpp_id).values(
+            content_ast=content_ast, content_hash=content_hash(content_markdown)
+        )
+    )
+    await db.commit()
+    return content_ast
+
+async def _load_saved_rpp_meta(db: AsyncSession, rpp_id: int, user_id: int):
+    """Metadata + content_hash of the user's SavedRPP, without loading the document itself."""
+    from app.models.rpp_data import SavedRPP
+
+    res = await db.execute(
+        select(SavedRPP.id, SavedRPP.mapel, SavedRPP.kelas, SavedRPP.topik, SavedRPP.content_hash)
+        .where(SavedRPP.id == rpp_id, SavedRPP.user_id == user_id)
+    )
+    row = res.mappings().first()
+    if not row:
+        raise HTTPException(status_code=404, detail="RPP not found")
+    row = dict(row)
+    if row["content_hash"] is None:
+        await _store_rpp_ast(db, rpp_id)
+        res = await db.execute(select(SavedRPP.content_hash).where(SavedRPP.id == rpp_id))
+        row["content_hash"] = res.scalar()
+    return row
+
+async def _load_saved_rpp_blocks(db: AsyncSession, rpp_id: int):
+    """Stored AST blocks of a SavedRPP, (re)building them once if missing or outdated."""
+    from app.models.rpp_data import SavedRPP
+
+    res = await db.execute(select(SavedRPP.content_ast).where(SavedRPP.id == rpp_id))
+    content_ast = res.scalar()
+    if not content_ast or content_ast.get("v") != AST_VERSION:
+        content_ast = await _store_rpp_ast(db, rpp_id)
+    return content_ast["blocks"]
+
+async def _resolve_rpp_content(req, user_id: int, db: AsyncSession) -> str:
+    """
+    Modul Ajar text for PPT/quiz prompts: from the saved RPP when rpp_id is given
+    (filling mapel/topik if the client left them out), otherwise the uploaded rpp_content.
+    """
+    from app.models.rpp_data import SavedRPP
+
+    if req.rpp_id is None:
+        if not req.rpp_content:
+            raise HTTPException(status_code=400, detail="rpp_content atau rpp_id wajib diisi.")
+        return req.rpp_content
+
+    res = await db.execute(
+        select(SavedRPP.mapel, SavedRPP.topik, SavedRPP.content_markdown)
+        .where(SavedRPP.id == req.rpp_id, SavedRPP.user_id == user_id)
+    )
+    row = res.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="RPP not found")
+    req.mapel = req.mapel or row.mapel
+    req.topik = req.topik or row.topik
+    return row.content_markdown
 
 class GeneratePPTRequest(BaseModel):
-    rpp_content: str
-    mapel: str
-    topik: str
+    rpp_content: str = "" # Either the Modul Ajar text...
+    rpp_id: Optional[int] = None # ...or the id of a saved RPP
+    mapel: str = ""
+    topik: str = ""
     template: str = "auto"
 
 class GenerateQuizRequest(BaseModel):
-    rpp_content: str
-    mapel: str
-    topik: str
+    rpp_content: str = "" # Either the Modul Ajar text...
+    rpp_id: Optional[int] = None # ...or the id of a saved RPP
+    mapel: str = ""
+    topik: str = ""
     jumlah_soal: int
     tingkat_kesulitan: str
 
@@ -201,34 +395,15 @@ class ExportQuizRequest(BaseModel):
     topik: str
 
 class ExportRPPRequest(BaseModel):
-    content_markdown: str
-    mapel: str
-    topik: str
+    content_markdown: str = "" # Either the Modul Ajar text...
+    rpp_id: Optional[int] = None # ...or the id of a saved RPP (metadata is taken from it)
+    mapel: str = ""
+    topik: str = ""
     kelas: str = "Semua"
 
-@router.post("/generate-ppt")
-async def generate_ppt_route(
-    req: GeneratePPTRequest,
-    user_id: int = Depends(get_current_user_id),
-    db: AsyncSession = Depends(get_db)
-):
-    # 1. Check if user is Pro/School
-    from app.models.payment import Subscription
-    from datetime import datetime
-    
-    sub_res = await db.execute(
-        select(Subscription).where(
-            Subscription.user_id == user_id,
-            Subscription.is_active == True,
-            Subscription.end_date > get_jakarta_time()
-        )
-    )
-    sub = sub_res.scalars().first()
-    
-    if not sub or sub.plan_type not in ["pro", "premium", "school", "yearly"]:
-        raise HTTPException(status_code=403, detail="Fitur Buat PPT hanya tersedia untuk pelanggan Pro, Premium, atau Sekolah.")
-
-    # 2. Build Prompt for JSON Structure
+async def _generate_ppt_deck(template: str, topik: str, rpp_content: str, user_id: int, plan_type: str) -> dict:
+    """Ask the AI for the slide structure (JSON) of a deck. Raises HTTPException on bad output."""
+    # 1. Build Prompt for JSON Structure
     # Determine Theme Instruction
     theme_instruction = """
 PILIH TEMA:
@@ -238,10 +413,10 @@ Pilih salah satu tema yang paling cocok berdasarkan mapel dan topik:
 - "Alam": Cocok untuk IPA/Geografi, warna hijau.
 - "Pastel": Cocok untuk materi bimbingan atau desain, warna pink/soft.
 """
-    if req.template and req.template != "auto":
+    if template and template != "auto":
         theme_instruction = f"""
-TEMA DIPILIH USER: "{req.template}"
-Gunakan gaya desain "{req.template}" untuk seluruh slide.
+TEMA DIPILIH USER: "{template}"
+Gunakan gaya desain "{template}" untuk seluruh slide.
 """
 
     prompt = f"""
@@ -273,140 +448,233 @@ Campur jenis layout agar tidak bosan.
 Format harus JSON murni tanpa teks penjelasan lain.
 
 ISI MODUL AJAR:
-{req.rpp_content}
+{rpp_content}
 """
 
+    # 2. Call AI (JSON mode, streamed: each slide is checked as soon as it closes)
+    print(f"DEBUG: Generating Slide JSON for {topik}...")
+    parser = JSONStreamParser("slides")
     try:
-        # 3. Call AI
-        print(f"DEBUG: Generating Slide JSON for {req.topik}...")
-        response_text = await gemini_client.generate_content(prompt)
-        print(f"DEBUG: Raw AI Response: {response_text[:200]}...")
-        
-        # Clean JSON: Extract only the part between the first { and the last }
-        match = re.search(r'(\{.*\}|\[.*\])', response_text, re.DOTALL)
-        if not match:
-            print(f"DEBUG: No JSON structure found in response: {response_text}")
-            raise HTTPException(status_code=500, detail="AI tidak memberikan format data yang benar.")
-            
-        clean_json = match.group(0)
-        
-        try:
-            data = json.loads(clean_json)
-        except Exception as json_err:
-            print(f"DEBUG: JSON Parse Error: {json_err}. Content: {clean_json}")
-            raise HTTPException(status_code=500, detail="AI memberikan format JSON yang tidak valid.")
-        
-        if "slides" not in data:
-             print(f"DEBUG: Missing 'slides' key in: {data}")
-             raise HTTPException(status_code=500, detail="Data slide tidak lengkap.")
+        stream = gemini_client.stream_json(
+            prompt, parser, user_id=user_id, plan_type=plan_type, feature="ppt",
+            response_format=json_response_format("presentation", PPT_JSON_SCHEMA)
+        )
+        async with aclosing(stream) as slides: # Free the LLM slot as soon as a slide is rejected
+            async for slide in slides:
+                PPTSlide.model_validate(slide)
+        data = parser.result()
+    except GeminiStreamError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except ValueError as json_err: # Includes pydantic ValidationError
+        print(f"DEBUG: JSON Parse Error: {json_err}. Content: {parser.text[:500]}")
+        raise HTTPException(status_code=500, detail="AI memberikan format JSON yang tidak valid.")
+    
+    if not isinstance(data, dict) or not data.get("slides"):
+         print(f"DEBUG: Missing 'slides' key in: {parser.text[:500]}")
+         raise HTTPException(status_code=500, detail="Data slide tidak lengkap.")
+    return data
+
+def _ppt_filename(topik: str) -> str:
+    # Clean filename from potentially unsafe characters
+    safe_topik = re.sub(r'[^\w\s-]', '', topik).strip().replace(" ", "_")
+    return f"PPT_{safe_topik}.pptx"
+
+def _compact_rpp_context(rpp_content: str, task: str) -> dict:
+    """Modul Ajar cut down to the sections the PPT/quiz prompt needs (see compact_context)."""
+    if not Config.CONTEXT_COMPACTION:
+        return {"text": rpp_content, "original_tokens": 0, "context_tokens": 0, "saved_tokens": 0, "sections": ["all"]}
+    budget = Config.PPT_CONTEXT_TOKENS if task == "ppt" else Config.QUIZ_CONTEXT_TOKENS
+    with stage_timer("context_compaction"):
+        context = compact_context(rpp_content, task, budget)
+    prompt_context_tokens.inc(context["original_tokens"], feature=task, kind="original")
+    prompt_context_tokens.inc(context["context_tokens"], feature=task, kind="sent")
+    print(f"DEBUG: {task} context {context['original_tokens']} -> {context['context_tokens']} tokens "
+          f"(saved {context['saved_tokens']}, sections: {', '.join(context['sections']) or 'trimmed'})")
+    return context
+
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+@router.post("/generate-ppt")
+async def generate_ppt_route(
+    req: GeneratePPTRequest,
+    user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
+    db: AsyncSession = Depends(get_db)
+):
+    # 1. Check if user is Pro/School
+    if not entitlement.can_generate_ppt:
+        raise HTTPException(status_code=403, detail="Fitur Buat PPT hanya tersedia untuk pelanggan Pro, Premium, atau Sekolah.")
+    plan_type = entitlement.plan_type
+    _ensure_llm_available()
+    rpp_content = await _resolve_rpp_content(req, user_id, db)
+    context = _compact_rpp_context(rpp_content, "ppt")
+
+    # Release the pooled DB connection while we wait on the LLM
+    await db.commit()
+
+    try:
+        # 2-3. Prompt + AI call for the slide structure
+        data = await _generate_ppt_deck(req.template, req.topik, context["text"], user_id, plan_type)
 
         # 4. Generate PPTX File
         print(f"DEBUG: Generating PPTX File for {len(data.get('slides', []))} slides...")
-        ppt_file = await PPTService.generate_ppt(data)
+        try:
+            ppt_bytes, ppt_etag = await PPTService.render_ppt(data)
+        except RenderQueueFull as e:
+            raise _render_busy_error(e)
         
         # 5. Return as Download
-        # Clean filename from potentially unsafe characters
-        safe_topik = re.sub(r'[^\w\s-]', '', req.topik).strip().replace(" ", "_")
-        filename = f"PPT_{safe_topik}.pptx"
+        filename = _ppt_filename(req.topik)
         print(f"DEBUG: PPTX Generated successfully. Sending {filename}")
         
-        return StreamingResponse(
-            ppt_file,
-            media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+        return Response(
+            content=ppt_bytes,
+            media_type=PPTX_MEDIA_TYPE,
             headers={
                 "Content-Disposition": f"attachment; filename={filename}",
-                "Access-Control-Expose-Headers": "Content-Disposition"
+                "Access-Control-Expose-Headers": "Content-Disposition, ETag, X-Context-Tokens-Saved",
+                "ETag": f'"{ppt_etag}"',
+                "X-Context-Tokens-Saved": str(context["saved_tokens"])
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc() # Print full stack trace to terminal
         print(f"Error generating PPT: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Gagal generate PPT: {str(e)}")
 
+# --- PPT JOBS (async variant of /generate-ppt) ---
+
+async def _run_ppt_job(job: dict) -> dict:
+    payload = job["payload"]
+    data = await _generate_ppt_deck(
+        payload["template"], payload["topik"], payload["rpp_content"], job["user_id"], payload["plan_type"]
+    )
+    # Render now so the download is served straight from the artifact cache.
+    # Best effort: the deck is already paid for and valid, and the download re-renders on a miss.
+    try:
+        await PPTService.render_ppt(data)
+    except Exception as e:
+        print(f"DEBUG: PPT job {job['id']} warm-up render failed, download will render: {e}")
+    return {"deck": data}
+
+job_queue.register("ppt", _run_ppt_job)
+
+def _ppt_job_status(job: dict) -> dict:
+    status = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "topik": job["payload"].get("topik"),
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["status"] == JOB_DONE:
+        status["download_url"] = f"/api/rpp/ppt-jobs/{job['id']}/download"
+    return status
+
+async def _get_user_job(job_id: str, user_id: int) -> dict:
+    job = await job_queue.get(job_id)
+    if not job or job["user_id"] != user_id or job["kind"] != "ppt":
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/ppt-jobs", status_code=202)
+async def create_ppt_job(
+    req: GeneratePPTRequest,
+    user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Queue a PPT generation and return its job id right away.
+    Poll GET /ppt-jobs/{job_id} until status is "done", then fetch download_url.
+    Submitting the same inputs again returns the existing job (deduplicated=true).
+    """
+    if not entitlement.can_generate_ppt:
+        raise HTTPException(status_code=403, detail="Fitur Buat PPT hanya tersedia untuk pelanggan Pro, Premium, atau Sekolah.")
+    _ensure_llm_available()
+    rpp_content = await _resolve_rpp_content(req, user_id, db)
+    await db.commit()
+
+    dedup_key = make_dedup_key("ppt", req.template, req.mapel, req.topik, content_hash(rpp_content))
+    job, deduplicated = await job_queue.submit("ppt", user_id, {
+        "template": req.template,
+        "mapel": req.mapel,
+        "topik": req.topik,
+        "rpp_content": _compact_rpp_context(rpp_content, "ppt")["text"],
+        "plan_type": entitlement.plan_type
+    }, dedup_key)
+    return {**_ppt_job_status(job), "deduplicated": deduplicated}
+
+@router.get("/ppt-jobs/{job_id}")
+async def get_ppt_job(
+    job_id: str,
+    response: Response,
+    user_id: int = Depends(get_current_user_id)
+):
+    job = await _get_user_job(job_id, user_id)
+    if job["status"] not in (JOB_DONE, JOB_FAILED):
+        response.headers["Retry-After"] = "3" # Suggested polling interval
+    return _ppt_job_status(job)
+
+@router.get("/ppt-jobs/{job_id}/download")
+async def download_ppt_job(
+    job_id: str,
+    request: Request,
+    user_id: int = Depends(get_current_user_id)
+):
+    job = await _get_user_job(job_id, user_id)
+    if job["status"] == JOB_FAILED:
+        raise HTTPException(status_code=409, detail=f"Gagal generate PPT: {job['error']}")
+    if job["status"] != JOB_DONE:
+        raise HTTPException(status_code=409, detail="PPT masih diproses. Silakan coba lagi sebentar.", headers={"Retry-After": "3"})
+
+    deck = job["result"]["deck"]
+    return await _export_response(
+        request, PPTService.cache_key(deck), PPTX_MEDIA_TYPE, _ppt_filename(job["payload"]["topik"]),
+        lambda: _render(PPTService.build_ppt, deck)
+    )
+
 @router.post("/generate-quiz")
 async def generate_quiz(
     req: GenerateQuizRequest,
+    batched: bool = True, # ?batched=false asks for all questions in one call
     user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
     db: AsyncSession = Depends(get_db)
 ):
     from app.models.rpp_data import SavedQuiz
-    from app.models.payment import Subscription
     
     # 0. Check Subscription
-    sub_res = await db.execute(
-        select(Subscription).where(
-            Subscription.user_id == user_id,
-            Subscription.is_active == True,
-            Subscription.end_date > get_jakarta_time()
-        )
-    )
-    sub = sub_res.scalars().first()
-    if not sub or sub.plan_type == "free":
+    if not entitlement.can_generate_quiz:
         raise HTTPException(status_code=403, detail="Fitur Buat Soal hanya tersedia untuk paket berbayar.")
+    plan_type = entitlement.plan_type
 
     # 1. Validate Feature Limits
     if req.jumlah_soal > 20:
         raise HTTPException(status_code=400, detail="Maksimal soal yang dapat dibuat adalah 20 soal.")
+    _ensure_llm_available()
+    rpp_content = await _resolve_rpp_content(req, user_id, db)
+    context = _compact_rpp_context(rpp_content, "quiz")
     
-    # Determine Prompt Instruction based on Plan
-    explanation_instruction = ""
-    if sub.plan_type in ["standard", "standar"]:
-        # Standard: Kunci Jawaban (Tanpa Pembahasan)
-        explanation_instruction = "DILARANG KERAS memberikan penjelasan atau pembahasan. Biarkan field 'penjelasan' berisi STRING KOSONG (\"\"). Jangan tulis apapun di sana."
-    else:
-        # Pro/Premium: Kunci + Pembahasan Lengkap
-        explanation_instruction = "Berikan kunci jawaban beserta penjelasan lengkap dan mendalam mengapa jawaban itu benar pada field 'penjelasan'."
-
-    # 2. Build Prompt
-    prompt = f"""
-Berdasarkan Modul Ajar berikut:
-{req.rpp_content}
-
-Buatkan {req.jumlah_soal} soal pilihan ganda dengan tingkat kesulitan {req.tingkat_kesulitan}.
-
-Aturan:
-1. Gunakan bahasa Indonesia yang baku dan sesuai umur siswa di Fase tersebut.
-2. Berikan 4 pilihan jawaban (A, B, C, D).
-3. {explanation_instruction}
-4. Output harus dalam format JSON murni.
-
-Struktur JSON:
-{{
-  "judul_kuis": "Judul Kuis",
-  "questions": [
-    {{
-      "no": 1,
-      "pertanyaan": "Teks pertanyaan...",
-      "options": {{
-        "A": "Jawaban A",
-        "B": "Jawaban B",
-        "C": "Jawaban C",
-        "D": "Jawaban D"
-      }},
-      "kunci_jawaban": "A",
-      "penjelasan": "Karena..."
-    }}
-  ]
-}}
-"""
-
     try:
-        # 2. Call AI
-        print(f"DEBUG: Generating Quiz for {req.topik}...")
-        response_text = await gemini_client.generate_content(prompt)
-        
-        # 3. Validation: Stop if AI returned an error string
-        if response_text.startswith("Error"):
-            raise HTTPException(status_code=500, detail=response_text)
-        
-        # Clean JSON
-        match = re.search(r'(\{.*\}|\[.*\])', response_text, re.DOTALL)
-        if not match:
-             raise HTTPException(status_code=500, detail="AI tidak memberikan format data yang benar.")
-        
-        quiz_data = json.loads(match.group(0))
+        # 2. Call AI: chunks of QUIZ_CHUNK_SIZE questions generated in parallel
+        print(f"DEBUG: Generating Quiz for {req.topik} ({req.jumlah_soal} soal, batched={batched})...")
+        # Release the pooled DB connection while we wait on the LLM
+        await db.commit()
+        quiz_data = await QuizService.generate(
+            context["text"],
+            req.jumlah_soal,
+            req.tingkat_kesulitan,
+            with_explanation=entitlement.quiz_explanations,
+            user_id=user_id,
+            plan_type=plan_type,
+            batched=batched
+        )
         
         # 3. Save to DB
         new_quiz = SavedQuiz(
@@ -423,9 +691,15 @@ Struktur JSON:
         return {
             "status": "success",
             "quiz_id": new_quiz.id,
-            "data": quiz_data
+            "data": quiz_data,
+            # Estimated Modul Ajar tokens per chunk prompt, before/after compaction
+            "context": {k: context[k] for k in ("original_tokens", "context_tokens", "saved_tokens")}
         }
         
+    except HTTPException:
+        raise
+    except QuizGenerationError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -434,103 +708,22 @@ Struktur JSON:
 @router.post("/export-quiz-pdf")
 async def export_quiz_pdf(
     req: ExportQuizRequest,
-    user_id: int = Depends(get_current_user_id),
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    entitlement: Entitlement = Depends(get_entitlement)
 ):
     # Gate: Paid Only
-    from app.models.payment import Subscription
-    sub_res = await db.execute(select(Subscription).where(
-        Subscription.user_id == user_id, Subscription.is_active == True, Subscription.end_date > get_jakarta_time()
-    ))
-    sub = sub_res.scalars().first()
-    if not sub or sub.plan_type == "free":
+    if not entitlement.can_export_quiz_pdf:
         raise HTTPException(status_code=403, detail="Download Soal Format PDF hanya tersedia di paket berbayar.")
 
     try:
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # --- HEADER ---
-        pdf.set_y(15)
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_font("Arial", 'B', 11)
-        pdf.cell(190, 10, "LATIHAN SOAL & EVALUASI", ln=True, align='C')
-        
-        pdf.set_font("Arial", 'B', 18)
-        pdf.multi_cell(190, 12, clean_text(req.topik), align='C')
-        
-        pdf.set_font("Arial", 'I', 10)
-        pdf.cell(190, 8, clean_text(f"Mata Pelajaran: {req.mapel}"), ln=True, align='C')
-        
-        # Separator Line
-        pdf.ln(2)
-        pdf.set_draw_color(200, 200, 200)
-        pdf.line(20, pdf.get_y(), 190, pdf.get_y())
-        pdf.ln(10)
-        
-        # --- QUESTIONS ---
-        questions = req.quiz_data.get("questions", [])
-        for q in questions:
-            # Check for page break space
-            if pdf.get_y() > 250:
-                pdf.add_page()
-
-            pdf.set_x(10) # Ensure we are at the left margin
-            pdf.set_font("Arial", 'B', 11)
-            # Question Number and Text
-            no = q.get('no', '')
-            txt = clean_text(f"{no}. {q.get('pertanyaan', '')}")
-            # Use explicit width pdf.epw instead of 0 to avoid calculation errors
-            pdf.multi_cell(pdf.epw, 8, txt)
-            
-            pdf.ln(2)
-            pdf.set_font("Arial", '', 10)
-            options = q.get("options", {})
-            for key, val in options.items():
-                pdf.set_x(10) # Reset X before each option
-                # Option text
-                opt_txt = clean_text(f"   {key}. {val}")
-                pdf.multi_cell(pdf.epw, 7, opt_txt)
-            
-            pdf.ln(5)
-
-        # --- ANSWER KEY PAGE ---
-        pdf.add_page()
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, "KUNCI JAWABAN & PENJELASAN", ln=True, align='C')
-        pdf.ln(5)
-        
-        pdf.set_font("Arial", '', 10)
-        for q in questions:
-            if pdf.get_y() > 260:
-                pdf.add_page()
-
-            pdf.set_x(10) # Start from margin
-            pdf.set_font("Arial", 'B', 10)
-            pdf.cell(0, 8, clean_text(f"Nomor {q.get('no', '')}: {q.get('kunci_jawaban', '')}"), ln=True)
-            
-            penjelasan = q.get('penjelasan', '').strip()
-            # Only show if not empty and not just a placeholder
-            if penjelasan and len(penjelasan) > 2:
-                pdf.set_x(10) # Ensure description also starts from margin
-                pdf.set_font("Arial", 'I', 9)
-                pdf.set_text_color(80, 80, 80)
-                pdf.multi_cell(pdf.epw, 6, clean_text(f"Penjelasan: {penjelasan}"))
-                pdf.set_text_color(0, 0, 0)
-            
-            pdf.ln(3)
-
-        # Buffer
-        pdf_bytes = pdf.output()
         safe_topik = re.sub(r'[^\w\s-]', '', req.topik).strip().replace(" ", "_")
-        return StreamingResponse(
-            io.BytesIO(pdf_bytes),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=Quiz_{safe_topik}.pdf",
-                "Access-Control-Expose-Headers": "Content-Disposition"
-            }
+        key = artifact_cache.make_key("quiz-pdf", ExportService.RENDERER_VERSION, req.quiz_data, req.mapel, req.topik)
+        return await _export_response(
+            request, key, "application/pdf", f"Quiz_{safe_topik}.pdf",
+            lambda: _render(ExportService.build_quiz_pdf, req.quiz_data, req.mapel, req.topik)
         )
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Gagal export PDF Quiz: {str(e)}")
@@ -538,510 +731,286 @@ async def export_quiz_pdf(
 @router.post("/export-quiz-word")
 async def export_quiz_word(
     req: ExportQuizRequest,
-    user_id: int = Depends(get_current_user_id),
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    entitlement: Entitlement = Depends(get_entitlement)
 ):
     # Check if Premium
-    from app.models.payment import Subscription
-    sub_res = await db.execute(select(Subscription).where(
-        Subscription.user_id == user_id, Subscription.is_active == True, Subscription.end_date > get_jakarta_time()
-    ))
-    sub = sub_res.scalars().first()
-    
-    if not sub or sub.plan_type not in ["premium", "school"]:
+    if not entitlement.can_export_quiz_word:
         # Allow legacy pro/monthly if needed, but strictly per request: only Premium has .docx for Question
         raise HTTPException(status_code=403, detail="Download Soal Format Word (.docx) hanya tersedia di Paket Premium.")
 
     try:
-        doc = Document()
-        
-        # Title
-        title = doc.add_heading(f"Latihan Soal: {req.topik}", 0)
-        subtitle = doc.add_paragraph(f"Mata Pelajaran: {req.mapel}")
-        subtitle.alignment = 1 # Center
-        
-        questions = req.quiz_data.get("questions", [])
-        for q in questions:
-            p = doc.add_paragraph()
-            p.add_run(f"{q.get('no', '')}. {q.get('pertanyaan', '')}").bold = True
-            
-            options = q.get("options", {})
-            for key, val in options.items():
-                doc.add_paragraph(f"   {key}. {val}")
-        
-        # Kunci Jawaban at the end
-        doc.add_page_break()
-        doc.add_heading("Kunci Jawaban & Penjelasan", level=1)
-        for q in questions:
-            p = doc.add_paragraph()
-            p.add_run(f"No {q.get('no', '')}: ").bold = True
-            p.add_run(f"{q.get('kunci_jawaban', '')}")
-            
-            expl = doc.add_paragraph()
-            expl.add_run("Penjelasan: ").italic = True
-            expl.add_run(f"{q.get('penjelasan', '')}")
-            
-        file_stream = io.BytesIO()
-        doc.save(file_stream)
-        file_stream.seek(0)
-        
-        return Response(
-            content=file_stream.getvalue(),
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename=Quiz_{req.topik}.docx"}
+        key = artifact_cache.make_key("quiz-docx", ExportService.RENDERER_VERSION, req.quiz_data, req.mapel, req.topik)
+        return await _export_response(
+            request, key,
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            f"Quiz_{req.topik}.docx",
+            lambda: _render(ExportService.build_quiz_docx, req.quiz_data, req.mapel, req.topik)
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gagal export Word: {str(e)}")
 
 # --- HISTORY ENDPOINTS ---
 
-@router.post("/export-pdf")
-async def export_rpp_pdf(req: ExportRPPRequest):
-    try:
-        # Robust input sanitization
-        topik = str(req.topik or "Tanpa Judul")
-        mapel = str(req.mapel or "Mata Pelajaran")
-        kelas = str(req.kelas or "Semua")
-        content_markdown = str(req.content_markdown or "")
+async def _rpp_export_source(req: ExportRPPRequest, user_id, db: AsyncSession):
+    """
+    (topik, mapel, kelas, content_hash, load_blocks) for an RPP export, either from the
+    request body or from a saved RPP. load_blocks() is only awaited on a cache miss.
+    """
+    if req.rpp_id is not None:
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Unauthorized. Please login.")
+        meta = await _load_saved_rpp_meta(db, req.rpp_id, user_id)
+        topik, mapel, kelas = meta["topik"], meta["mapel"], meta["kelas"]
+        doc_hash = meta["content_hash"]
 
-        if topik.lower() == "null": topik = "Tanpa Judul"
-        if mapel.lower() == "null": mapel = "Mata Pelajaran"
-        if kelas.lower() == "null": kelas = "Semua"
+        async def load_blocks():
+            return await _load_saved_rpp_blocks(db, req.rpp_id)
+    else:
+        topik, mapel, kelas = req.topik, req.mapel, req.kelas
+        content_markdown = str(req.content_markdown or "")
         if content_markdown.lower() == "null": content_markdown = ""
+        doc_hash = content_hash(content_markdown)
 
-        print(f"DEBUG: Exporting Synchronized PDF for {topik}...")
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # --- HEADER (Matches Word/Modal) ---
-        pdf.set_y(15)
-        pdf.set_x(10)
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_font("Arial", 'B', 11)
-        pdf.cell(190, 10, "MODUL AJAR (RPP)", ln=True, align='C')
-        
-        pdf.set_font("Arial", 'B', 18)
-        pdf.set_x(10)
-        pdf.multi_cell(190, 12, clean_text(clean_markdown_symbols(topik)), align='C')
-        
-        pdf.set_font("Arial", 'I', 10)
-        pdf.set_x(10)
-        meta_text_clean = clean_markdown_symbols(f"{mapel} | Kelas {kelas}")
-        pdf.cell(190, 8, clean_text(meta_text_clean), ln=True, align='C')
-        
-        # Separator Line
-        pdf.ln(2)
-        pdf.set_draw_color(200, 200, 200)
-        pdf.line(20, pdf.get_y(), 190, pdf.get_y())
-        pdf.ln(10)
-        
-        # Content Parsing
-        lines = content_markdown.split('\n')
-        pdf.set_font("Arial", '', 11)
-        
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Table detection
-            is_table_start = '|' in line and i + 1 < len(lines) and re.match(r'^\s*\|?[:\-\s|]+\|?[:\-\s|]*\s*$', lines[i+1])
-            if is_table_start:
-                table_data = []
-                header_line = line.strip().strip('|')
-                headers = [clean_text(clean_markdown_symbols(c)) for c in header_line.split('|')]
-                i += 2
-                while i < len(lines):
-                    row_line = lines[i].strip()
-                    if not '|' in row_line and not row_line.startswith('|'): break
-                    row_content = row_line.strip('|')
-                    row = [clean_text(clean_markdown_symbols(c)) for c in row_content.split('|')]
-                    if row:
-                        while len(row) < len(headers): row.append("")
-                        table_data.append(row[:len(headers)])
-                    i += 1
-                
-                if headers or table_data:
-                    pdf.ln(2)
-                    # Check if it's the Identity table (Informasi Umum)
-                    is_identity = any("Identitas" in h for h in headers) or (len(headers) == 2 and any(k in headers[0] for k in ["Penyusun", "Instansi"]))
-                    
-                    if is_identity:
-                        pdf.set_line_width(0)
-                    else:
-                        pdf.set_line_width(0.1)
-
-                    with pdf.table(width=190, padding=2, line_height=7) as table:
-                        if headers and not is_identity:
-                            header_row = table.row()
-                            pdf.set_font("Arial", 'B', 10)
-                            pdf.set_fill_color(245, 245, 245)
-                            for h in headers: header_row.cell(h)
-                        
-                        pdf.set_font("Arial", '', 10)
-                        for r_data in table_data:
-                            row = table.row()
-                            for r_idx, c in enumerate(r_data):
-                                if is_identity and r_idx == 0:
-                                    pdf.set_font("Arial", 'B', 10)
-                                row.cell(c)
-                                if is_identity: pdf.set_font("Arial", '', 10)
-                    pdf.ln(2)
-                continue
-
-            if not line:
-                pdf.ln(2)
-                i += 1
-                continue
-            
-            # Header handling (Hierarchy)
-            if line.startswith('#'):
-                clean_header = clean_markdown_symbols(re.sub(r'^#+\s*', '', line))
-                
-                if line.startswith('###'): # Level A, B, C
-                    pdf.ln(4)
-                    pdf.set_font("Arial", 'B', 12)
-                elif line.startswith('##'): # Level I, II, III
-                    pdf.ln(6)
-                    pdf.set_font("Arial", 'B', 14)
-                    # Draw a thin line above main sections
-                    pdf.set_draw_color(230, 230, 230)
-                    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-                    pdf.ln(2)
-                else: # Title #
-                    pdf.set_font("Arial", 'B', 16)
-                    pdf.ln(5)
-                
-                pdf.set_x(10)
-                # Auto center the main title if it's level 1
-                align = 'C' if not line.startswith('##') else 'L'
-                pdf.multi_cell(0, 8, clean_text(clean_header), align=align)
-                pdf.set_font("Arial", '', 11)
-            
-            # Ordered List handling (Roman/Alpha/Numeric)
-            elif re.match(r'^\s*(\d+|[a-zA-Z]|[ivxIVX]+)\.\s+', line):
-                match = re.match(r'^\s*(\d+|[a-zA-Z]|[ivxIVX]+)\.\s+(.*)', line)
-                marker = match.group(1)
-                text = clean_markdown_symbols(match.group(2))
-                
-                # Determine indentation based on marker type or leading spaces
-                indent = 10 if line.startswith('   ') else 0
-                pdf.set_x(15 + indent)
-                pdf.multi_cell(0, 7, clean_text(f"{marker}. {text}"))
-                pdf.set_x(10)
-
-            # Unordered List handling
-            elif re.match(r'^\s*[\-\*•]\s*', line):
-                text = re.sub(r'^\s*[\-\*•]\s*', '', line)
-                text = clean_markdown_symbols(text)
-                indent = 20 if line.startswith('   ') else 15
-                pdf.set_x(indent)
-                pdf.multi_cell(0, 7, clean_text(f"\x95 {text}"))
-                pdf.set_x(10)
-            
-            # Regular text
-            else:
-                text = clean_markdown_symbols(line)
-                pdf.set_x(10)
-                pdf.multi_cell(0, 7, clean_text(text))
-            i += 1
-        
-        pdf_bytes = pdf.output()
-        safe_topik = re.sub(r'[^\w\s-]', '', req.topik).strip().replace(" ", "_")
-        return StreamingResponse(
-            io.BytesIO(pdf_bytes),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=RPP_{safe_topik}.pdf",
-                "Access-Control-Expose-Headers": "Content-Disposition"
-            }
+        async def load_blocks():
+            return parse_markdown_cached(content_markdown)
+
+    # Robust input sanitization
+    topik = str(topik or "Tanpa Judul")
+    mapel = str(mapel or "Mata Pelajaran")
+    kelas = str(kelas or "Semua")
+
+    if topik.lower() == "null": topik = "Tanpa Judul"
+    if mapel.lower() == "null": mapel = "Mata Pelajaran"
+    if kelas.lower() == "null": kelas = "Semua"
+    return topik, mapel, kelas, doc_hash, load_blocks
+
+@router.post("/export-pdf")
+async def export_rpp_pdf(
+    req: ExportRPPRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        topik, mapel, kelas, doc_hash, load_blocks = await _rpp_export_source(
+            req, request.session.get("user_id"), db
         )
+
+        print(f"DEBUG: Exporting Synchronized PDF for {topik}...")
+        safe_topik = re.sub(r'[^\w\s-]', '', topik).strip().replace(" ", "_")
+        key = artifact_cache.make_key("rpp-pdf", ExportService.RENDERER_VERSION, topik, mapel, kelas, doc_hash)
+
+        async def render():
+            return await _render(ExportService.build_rpp_pdf, topik, mapel, kelas, await load_blocks())
+
+        return await _export_response(request, key, "application/pdf", f"RPP_{safe_topik}.pdf", render)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Gagal export PDF RPP: {str(e)}")
 @router.post("/export-word")
 async def export_rpp_word(
     req: ExportRPPRequest,
+    request: Request,
     user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
     db: AsyncSession = Depends(get_db)
 ):
     # Gate: All Paid Plans
-    from app.models.payment import Subscription
-    sub_res = await db.execute(select(Subscription).where(
-        Subscription.user_id == user_id, Subscription.is_active == True, Subscription.end_date > get_jakarta_time()
-    ))
-    sub = sub_res.scalars().first()
-    if not sub or sub.plan_type == "free":
+    if not entitlement.can_export_rpp_word:
         raise HTTPException(status_code=403, detail="Download Word RPP hanya tersedia untuk paket berbayar.")
 
     try:
-        # Robust input sanitization
-        topik = str(req.topik or "Tanpa Judul")
-        mapel = str(req.mapel or "Mata Pelajaran")
-        kelas = str(req.kelas or "Semua")
-        content_markdown = str(req.content_markdown or "")
-
-        if topik.lower() == "null": topik = "Tanpa Judul"
-        if mapel.lower() == "null": mapel = "Mata Pelajaran"
-        if kelas.lower() == "null": kelas = "Semua"
-        if content_markdown.lower() == "null": content_markdown = ""
+        topik, mapel, kelas, doc_hash, load_blocks = await _rpp_export_source(req, user_id, db)
 
         print(f"DEBUG: Exporting Word RPP for {topik}...")
-        doc = Document()
-        
-        # Title Section (Styled as Modal)
-        h0 = doc.add_heading("MODUL AJAR (RPP)", 0)
-        h0.alignment = 1
-        for run in h0.runs: run.font.color.rgb = RGBColor(0, 0, 0)
-        
-        p_topik = doc.add_paragraph()
-        p_topik.alignment = 1
-        run_topik = p_topik.add_run(topik)
-        run_topik.bold = True
-        run_topik.font.size = Pt(18)
-        run_topik.font.color.rgb = RGBColor(0, 0, 0)
-        
-        p_meta = doc.add_paragraph()
-        p_meta.alignment = 1
-        run_mapel = p_meta.add_run(f" {mapel} ")
-        run_mapel.font.size = Pt(10)
-        run_mapel.italic = True
-        run_mapel.font.color.rgb = RGBColor(0, 0, 0)
-        
-        run_kelas = p_meta.add_run(f" | Kelas {kelas} ")
-        run_kelas.font.size = Pt(10)
-        run_kelas.italic = True
-        run_kelas.font.color.rgb = RGBColor(0, 0, 0)
-        
-        doc.add_paragraph("_" * 60).alignment = 1
-        
-        # Content Parsing with Table Support
-        lines = content_markdown.split('\n')
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Table detection
-            is_table_start = '|' in line and i + 1 < len(lines) and re.match(r'^\s*\|?[:\-\s|]+\|?[:\-\s|]*\s*$', lines[i+1])
-            if is_table_start:
-                header_line = line.strip().strip('|')
-                headers = [c.strip().replace('**', '') for c in header_line.split('|')]
-                
-                i += 2 # Skip header and separator
-                rows = []
-                while i < len(lines):
-                    row_line = lines[i].strip()
-                    if not '|' in row_line and not row_line.startswith('|'):
-                        break
-                    
-                    row_content = row_line.strip('|')
-                    row = [c.strip().replace('**', '') for c in row_content.split('|')]
-                    if row:
-                        while len(row) < len(headers): row.append("")
-                        rows.append(row[:len(headers)])
-                    i += 1
-                
-                if headers or rows:
-                    table = doc.add_table(rows=0, cols=len(headers))
-                    
-                    # Check if it's the Identity table (Informasi Umum)
-                    is_identity = any("Identitas" in h for h in headers) or (len(headers) == 2 and any(k in headers[0] for k in ["Penyusun", "Instansi"]))
-                    
-                    if not is_identity:
-                        table.style = 'Table Grid'
-                    
-                    if headers and not is_identity:
-                        header_row = table.add_row().cells
-                        for idx, hs in enumerate(headers):
-                            p = header_row[idx].paragraphs[0]
-                            r = p.add_run(hs)
-                            r.bold = True
-                            r.font.color.rgb = RGBColor(0, 0, 0)
-                    
-                    for row_data in rows:
-                        cells = table.add_row().cells
-                        for idx, val in enumerate(row_data):
-                            p = cells[idx].paragraphs[0]
-                            if is_identity and idx == 0:
-                                r = p.add_run(val)
-                                r.bold = True
-                            else:
-                                r = p.add_run(val)
-                            r.font.color.rgb = RGBColor(0, 0, 0)
-                    
-                    doc.add_paragraph() # Add space after table
-                continue
-
-            if not line:
-                i += 1
-                continue
-            
-            # Header handling (Hierarchy)
-            if line.startswith('#'):
-                clean_header = re.sub(r'^#+\s*', '', line)
-                level = 1
-                if line.startswith('###'): level = 3
-                elif line.startswith('##'): level = 2
-                
-                h = doc.add_heading(clean_header, level=level)
-                if level == 1:
-                    h.alignment = 1 # Center main title
-                
-                # Set heading color to black
-                for run in h.runs:
-                    run.font.color.rgb = RGBColor(0, 0, 0)
-            
-            # Ordered List handling (Roman/Alpha/Numeric)
-            elif re.match(r'^\s*(\d+|[a-zA-Z]|[ivxIVX]+)\.\s+', line):
-                match = re.match(r'^\s*(\d+|[a-zA-Z]|[ivxIVX]+)\.\s+(.*)', line)
-                marker = match.group(1)
-                text = match.group(2)
-                
-                # We use a custom paragraph for nested lists as docx styles can be finicky
-                p = doc.add_paragraph()
-                # Indentation based on logic (simple implementation)
-                if line.startswith('   '):
-                    p.paragraph_format.left_indent = Pt(36)
-                else:
-                    p.paragraph_format.left_indent = Pt(18)
-                
-                # Check for Roman (I., II.) or Alpha (A., B.) to make them look like headings if needed
-                is_roman = bool(re.match(r'^[IVX]+$', marker))
-                is_alpha = bool(re.match(r'^[A-Z]$', marker))
-                
-                r_marker = p.add_run(f"{marker}. ")
-                if is_roman or is_alpha:
-                    r_marker.bold = True
-                
-                # Handle bold parts in text
-                parts = re.split(r'(\*\*.*?\*\*)', text)
-                for part in parts:
-                    if part.startswith('**') and part.endswith('**'):
-                        r = p.add_run(part[2:-2])
-                        r.bold = True
-                    else:
-                        r = p.add_run(part)
-                    r.font.color.rgb = RGBColor(0, 0, 0)
-
-            # Unordered List handling (Bullets)
-            elif re.match(r'^\s*[\-\*•]\s*', line):
-                p = doc.add_paragraph(style='List Bullet')
-                text = re.sub(r'^\s*[\-\*•]\s*', '', line)
-                
-                if line.startswith('   '):
-                    p.paragraph_format.left_indent = Pt(54)
-                
-                # Handle bold parts
-                parts = re.split(r'(\*\*.*?\*\*)', text)
-                for part in parts:
-                    if part.startswith('**') and part.endswith('**'):
-                        r = p.add_run(part[2:-2])
-                        r.bold = True
-                    else:
-                        r = p.add_run(part)
-                    r.font.color.rgb = RGBColor(0, 0, 0)
-            
-            # Regular text
-            else:
-                p = doc.add_paragraph()
-                # Handle bold parts
-                parts = re.split(r'(\*\*.*?\*\*)', line)
-                for part in parts:
-                    if part.startswith('**') and part.endswith('**'):
-                        r = p.add_run(part[2:-2])
-                        r.bold = True
-                    else:
-                        r = p.add_run(part)
-                    r.font.color.rgb = RGBColor(0, 0, 0)
-            i += 1
-        
-        file_stream = io.BytesIO()
-        doc.save(file_stream)
-        file_stream.seek(0)
-        
-        safe_topik = re.sub(r'[^\w\s-]', '', req.topik).strip().replace(" ", "_")
-        
-        return Response(
-            content=file_stream.getvalue(),
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={
-                "Content-Disposition": f"attachment; filename=RPP_{safe_topik}.docx",
-                "Access-Control-Expose-Headers": "Content-Disposition"
-            }
+        safe_topik = re.sub(r'[^\w\s-]', '', topik).strip().replace(" ", "_")
+        key = artifact_cache.make_key("rpp-docx", ExportService.RENDERER_VERSION, topik, mapel, kelas, doc_hash)
+
+        async def render():
+            return await _render(ExportService.build_rpp_docx, topik, mapel, kelas, await load_blocks())
+
+        return await _export_response(
+            request, key,
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            f"RPP_{safe_topik}.docx",
+            render
         )
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
 
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+def _encode_history_cursor(created_at: datetime, rpp_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{rpp_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_history_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, rpp_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(rpp_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor riwayat tidak valid.")
+
 @router.get("/history")
 async def get_rpp_history(
+    response: Response,
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: str = None, # Value of X-Next-Cursor from the previous page
     user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    One page of the user's saved RPPs, newest first, metadata only.
+
+    Pages are keyed on (created_at, id): pass the X-Next-Cursor header of a page as
+    `cursor` to get the next one (the header is absent on the last page). The full
+    content of an item comes from GET /history/{rpp_id}.
+    """
     from app.models.rpp_data import SavedRPP, SavedQuiz
-    from app.models.payment import Subscription
+    from sqlalchemy import and_, or_
     
     # Gate: Paid Only
-    sub_res = await db.execute(select(Subscription).where(
-        Subscription.user_id == user_id, Subscription.is_active == True, Subscription.end_date > get_jakarta_time()
-    ))
-    sub = sub_res.scalars().first()
-    if not sub or sub.plan_type == "free":
+    if not entitlement.can_view_history:
         # Return empty list or error? 
         # Requirement: "Simpan Riwayat Selamanya hanya ada di paket berbayar"
         # Implies Free users don't see history.
         return []
+
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
         
-    # 1. Fetch RPPs
-    stmt = select(SavedRPP).where(SavedRPP.user_id == user_id).order_by(SavedRPP.created_at.desc())
+    # 1. Latest quiz for the same (mapel, topik), resolved in SQL per row
+    quiz_id = (
+        select(SavedQuiz.id)
+        .where(
+            SavedQuiz.user_id == user_id,
+            SavedQuiz.mapel == SavedRPP.mapel,
+            SavedQuiz.topik == SavedRPP.topik
+        )
+        .order_by(SavedQuiz.id.desc())
+        .limit(1)
+        .correlate(SavedRPP)
+        .scalar_subquery()
+        .label("quiz_id")
+    )
+
+    # 2. Metadata columns only (no content_markdown / input_data)
+    stmt = select(
+        SavedRPP.id, SavedRPP.user_id, SavedRPP.mapel, SavedRPP.kelas, SavedRPP.topik,
+        SavedRPP.created_at, SavedRPP.updated_at, quiz_id
+    ).where(SavedRPP.user_id == user_id)
+
+    if cursor:
+        cursor_created_at, cursor_id = _decode_history_cursor(cursor)
+        stmt = stmt.where(or_(
+            SavedRPP.created_at < cursor_created_at,
+            and_(SavedRPP.created_at == cursor_created_at, SavedRPP.id < cursor_id)
+        ))
+
+    # Fetch one extra row to know whether there is a next page
+    stmt = stmt.order_by(SavedRPP.created_at.desc(), SavedRPP.id.desc()).limit(limit + 1)
     result = await db.execute(stmt)
-    history = result.scalars().all()
-    
-    # 2. Check for Quizzes for each RPP (naive approach, could be optimized with join)
-    # We want to return { ...rpp, quiz_id: id | None }
-    
-    # Let's fetch all quizzes for this user to map them
-    stmt_quiz = select(SavedQuiz).where(SavedQuiz.user_id == user_id)
-    res_quiz = await db.execute(stmt_quiz)
-    quizzes = res_quiz.scalars().all()
-    
-    # Create a map key: (mapel, topik) -> quiz_id
-    # Note: If multiple quizzes exist for same topic, pick latest (logic depends on usage)
-    quiz_map = {}
-    for q in quizzes:
-        key = (q.mapel, q.topik)
-        quiz_map[key] = q.id
-        
-    # Append quiz_id to response
-    # We can't easily modify the ORM object directly if it's not a dict or Pydantic model with extra fields allowed.
-    # So we'll return a list of dicts.
-    
-    response_data = []
-    for item in history:
-        # Convert to dict
-        item_dict = {c.name: getattr(item, c.name) for c in item.__table__.columns}
-        
-        # Find match
-        q_id = quiz_map.get((item.mapel, item.topik))
-        item_dict['quiz_id'] = q_id
-        
-        response_data.append(item_dict)
-        
-    return response_data
+    rows = result.mappings().all()
+
+    page = [dict(row) for row in rows[:limit]]
+    if len(rows) > limit:
+        last = page[-1]
+        response.headers["X-Next-Cursor"] = _encode_history_cursor(last["created_at"], last["id"])
+    response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor"
+    return page
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+SEARCH_MAX_DEPTH = 500 # page * page_size; deeper pages should refine the query instead
+SEARCH_TYPES = {"all": ["rpp", "quiz"], "rpp": ["rpp"], "quiz": ["quiz"]}
+
+@router.get("/search")
+async def search_history(
+    q: str,
+    type: str = "all", # all, rpp or quiz
+    page: int = 1,
+    page_size: int = SEARCH_PAGE_SIZE,
+    user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ranked full-text search over the user's saved RPPs (topik, mapel, kelas, isi)
+    and quizzes (topik, mapel, pertanyaan). Snippets are HTML-escaped text with
+    matches wrapped in <mark>...</mark>, safe to render as HTML.
+    """
+    # Gate: same as history
+    if not entitlement.can_view_history:
+        raise HTTPException(status_code=403, detail="Pencarian riwayat hanya tersedia untuk paket berbayar.")
+    if search_index.backend is None:
+        raise HTTPException(status_code=503, detail="Pencarian belum tersedia di server ini.")
+    if type not in SEARCH_TYPES:
+        raise HTTPException(status_code=400, detail="type harus all, rpp, atau quiz.")
+
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Kata kunci pencarian wajib diisi.")
+    page = max(1, page)
+    page_size = max(1, min(page_size, SEARCH_MAX_PAGE_SIZE))
+    if page * page_size > SEARCH_MAX_DEPTH:
+        raise HTTPException(status_code=400, detail="Halaman terlalu jauh. Persempit kata kunci pencarian.")
+
+    return await search_index.search(db, user_id, q[:200], SEARCH_TYPES[type], page, page_size)
+
+@router.get("/history/{rpp_id}")
+async def get_rpp_history_item(
+    rpp_id: int,
+    user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
+    db: AsyncSession = Depends(get_db)
+):
+    """Full saved RPP (including content_markdown and input_data) for one history item."""
+    from app.models.rpp_data import SavedRPP, SavedQuiz
+
+    # Gate: Paid Only
+    if not entitlement.can_view_history:
+        raise HTTPException(status_code=403, detail="Riwayat RPP hanya tersedia untuk paket berbayar.")
+
+    stmt = select(SavedRPP).where(SavedRPP.id == rpp_id, SavedRPP.user_id == user_id)
+    result = await db.execute(stmt)
+    rpp = result.scalar_one_or_none()
+
+    if not rpp:
+        raise HTTPException(status_code=404, detail="RPP not found")
+
+    quiz_res = await db.execute(
+        select(SavedQuiz.id).where(
+            SavedQuiz.user_id == user_id,
+            SavedQuiz.mapel == rpp.mapel,
+            SavedQuiz.topik == rpp.topik
+        ).order_by(SavedQuiz.id.desc()).limit(1)
+    )
+
+    # content_ast is a server-side cache of content_markdown; not sent to the client
+    item_dict = {c.name: getattr(rpp, c.name) for c in rpp.__table__.columns if c.name != "content_ast"}
+    item_dict['quiz_id'] = quiz_res.scalar()
+    return item_dict
 
 @router.get("/quiz/{quiz_id}/download-word")
 async def download_quiz_word_by_id(
     quiz_id: int,
+    request: Request,
     user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
     db: AsyncSession = Depends(get_db)
 ):
     from app.models.rpp_data import SavedQuiz
-    from app.models.payment import Subscription
     
     # Gate Check: Premium Only for Soal .docx
-    sub_res = await db.execute(select(Subscription).where(
-        Subscription.user_id == user_id, Subscription.is_active == True, Subscription.end_date > get_jakarta_time()
-    ))
-    sub = sub_res.scalars().first()
-    if not sub or sub.plan_type not in ["premium", "school"]:
+    if not entitlement.can_export_quiz_word:
         raise HTTPException(status_code=403, detail="Download Soal Format Word (.docx) hanya tersedia di Paket Premium.")
     
     stmt = select(SavedQuiz).where(SavedQuiz.id == quiz_id, SavedQuiz.user_id == user_id)
@@ -1051,55 +1020,19 @@ async def download_quiz_word_by_id(
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
         
-    # Reuse export logic
-    # We can reuse the function logic or call it if it was a service. 
-    # Since it's inside a route handler, let's duplicate the logic briefly or use a shared function. 
-    # For speed and safety in this context, I'll copy the Word generation logic here but using the stored data.
-    
     try:
-        req_data = quiz.quiz_data
-        mapel = quiz.mapel
-        topik = quiz.topik
-        
-        doc = Document()
-        
-        # Title
-        title = doc.add_heading(f"Latihan Soal: {topik}", 0)
-        subtitle = doc.add_paragraph(f"Mata Pelajaran: {mapel}")
-        subtitle.alignment = 1 # Center
-        
-        questions = req_data.get("questions", [])
-        for q in questions:
-            p = doc.add_paragraph()
-            p.add_run(f"{q.get('no', '')}. {q.get('pertanyaan', '')}").bold = True
-            
-            options = q.get("options", {})
-            for key, val in options.items():
-                doc.add_paragraph(f"   {key}. {val}")
-        
-        # Kunci Jawaban at the end
-        doc.add_page_break()
-        doc.add_heading("Kunci Jawaban & Penjelasan", level=1)
-        for q in questions:
-            p = doc.add_paragraph()
-            p.add_run(f"No {q.get('no', '')}: ").bold = True
-            p.add_run(f"{q.get('kunci_jawaban', '')}")
-            
-            penjelasan = q.get('penjelasan', '').strip()
-            if penjelasan and len(penjelasan) > 2:
-                expl = doc.add_paragraph()
-                expl.add_run("Penjelasan: ").italic = True
-                expl.add_run(f"{penjelasan}")
-            
-        file_stream = io.BytesIO()
-        doc.save(file_stream)
-        file_stream.seek(0)
-        
-        return Response(
-            content=file_stream.getvalue(),
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename=Quiz_{topik}.docx"}
+        key = artifact_cache.make_key("quiz-docx-saved", ExportService.RENDERER_VERSION, quiz.quiz_data, quiz.mapel, quiz.topik)
+        return await _export_response(
+            request, key,
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            f"Quiz_{quiz.topik}.docx",
+            lambda: _render(
+                ExportService.build_quiz_docx, quiz.quiz_data, quiz.mapel, quiz.topik,
+                skip_empty_explanations=True
+            )
         )
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Gagal generate Word from Quiz ID: {str(e)}")
@@ -1107,18 +1040,15 @@ async def download_quiz_word_by_id(
 @router.get("/quiz/{quiz_id}/download-pdf")
 async def download_quiz_pdf_by_id(
     quiz_id: int,
+    request: Request,
     user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
     db: AsyncSession = Depends(get_db)
 ):
     from app.models.rpp_data import SavedQuiz
-    from app.models.payment import Subscription
     
     # Gate Check: Any Paid for Soal PDF
-    sub_res = await db.execute(select(Subscription).where(
-        Subscription.user_id == user_id, Subscription.is_active == True, Subscription.end_date > get_jakarta_time()
-    ))
-    sub = sub_res.scalars().first()
-    if not sub or sub.plan_type == "free":
+    if not entitlement.can_export_quiz_pdf:
         raise HTTPException(status_code=403, detail="Download Soal Format PDF hanya tersedia di Paket Berbayar.")
     
     stmt = select(SavedQuiz).where(SavedQuiz.id == quiz_id, SavedQuiz.user_id == user_id)
@@ -1129,88 +1059,14 @@ async def download_quiz_pdf_by_id(
         raise HTTPException(status_code=404, detail="Quiz not found")
         
     try:
-        quiz_data = quiz.quiz_data
-        mapel = quiz.mapel
-        topik = quiz.topik
-        
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # --- HEADER ---
-        pdf.set_y(15)
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_font("Arial", 'B', 11)
-        pdf.cell(190, 10, "LATIHAN SOAL & EVALUASI", ln=True, align='C')
-        
-        pdf.set_font("Arial", 'B', 18)
-        pdf.multi_cell(190, 12, clean_text(topik), align='C')
-        
-        pdf.set_font("Arial", 'I', 10)
-        pdf.cell(190, 8, clean_text(f"Mata Pelajaran: {mapel}"), ln=True, align='C')
-        
-        # Separator Line
-        pdf.ln(2)
-        pdf.set_draw_color(200, 200, 200)
-        pdf.line(20, pdf.get_y(), 190, pdf.get_y())
-        pdf.ln(10)
-        
-        # --- QUESTIONS ---
-        questions = quiz_data.get("questions", [])
-        for q in questions:
-            if pdf.get_y() > 250:
-                pdf.add_page()
-
-            pdf.set_x(10)
-            pdf.set_font("Arial", 'B', 11)
-            no = q.get('no', '')
-            txt = clean_text(f"{no}. {q.get('pertanyaan', '')}")
-            pdf.multi_cell(pdf.epw, 8, txt)
-            
-            pdf.ln(2)
-            pdf.set_font("Arial", '', 10)
-            options = q.get("options", {})
-            for key, val in options.items():
-                pdf.set_x(10)
-                opt_txt = clean_text(f"   {key}. {val}")
-                pdf.multi_cell(pdf.epw, 7, opt_txt)
-            
-            pdf.ln(5)
-
-        # --- ANSWER KEY PAGE ---
-        pdf.add_page()
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, "KUNCI JAWABAN & PENJELASAN", ln=True, align='C')
-        pdf.ln(5)
-        
-        pdf.set_font("Arial", '', 10)
-        for q in questions:
-            if pdf.get_y() > 260:
-                pdf.add_page()
-
-            pdf.set_x(10)
-            pdf.set_font("Arial", 'B', 10)
-            pdf.cell(0, 8, clean_text(f"Nomor {q.get('no', '')}: {q.get('kunci_jawaban', '')}"), ln=True)
-            
-            penjelasan = q.get('penjelasan', '').strip()
-            if penjelasan and len(penjelasan) > 2:
-                pdf.set_x(10)
-                pdf.set_font("Arial", 'I', 9)
-                pdf.set_text_color(80, 80, 80)
-                pdf.multi_cell(pdf.epw, 6, clean_text(f"Penjelasan: {penjelasan}"))
-                pdf.set_text_color(0, 0, 0)
-            
-            pdf.ln(3)
-
-        pdf_bytes = pdf.output()
-        safe_topik = re.sub(r'[^\w\s-]', '', topik).strip().replace(" ", "_")
-        return StreamingResponse(
-            io.BytesIO(pdf_bytes),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=Quiz_{safe_topik}.pdf",
-                "Access-Control-Expose-Headers": "Content-Disposition"
-            }
+        safe_topik = re.sub(r'[^\w\s-]', '', quiz.topik).strip().replace(" ", "_")
+        key = artifact_cache.make_key("quiz-pdf", ExportService.RENDERER_VERSION, quiz.quiz_data, quiz.mapel, quiz.topik)
+        return await _export_response(
+            request, key, "application/pdf", f"Quiz_{safe_topik}.pdf",
+            lambda: _render(ExportService.build_quiz_pdf, quiz.quiz_data, quiz.mapel, quiz.topik)
         )
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Gagal generate Word from Quiz ID: {str(e)}")
@@ -1236,17 +1092,13 @@ async def delete_rpp(
 @router.get("/quiz-history")
 async def get_quiz_history(
     user_id: int = Depends(get_current_user_id),
+    entitlement: Entitlement = Depends(get_entitlement),
     db: AsyncSession = Depends(get_db)
 ):
     from app.models.rpp_data import SavedQuiz
-    from app.models.payment import Subscription
     
     # Gate: Paid Only
-    sub_res = await db.execute(select(Subscription).where(
-        Subscription.user_id == user_id, Subscription.is_active == True, Subscription.end_date > get_jakarta_time()
-    ))
-    sub = sub_res.scalars().first()
-    if not sub or sub.plan_type == "free":
+    if not entitlement.can_view_history:
         return []
         
     stmt = select(SavedQuiz).where(SavedQuiz.user_id == user_id).order_by(SavedQuiz.created_at.desc())
@@ -0,0 +1,41 @@
+from pydantic import BaseModel, field_validator
+from typing import List
+
+LAYOUT_TYPES = ["split", "big_image", "highlight"]
+
+class PPTSlide(BaseModel):
+    """One slide of the AI deck structure; checked as soon as it is streamed."""
+    judul_slide: str
+    konten: List[str] = []
+    keyword_visual: str = ""
+    layout_type: str = "split"
+
+    @field_validator("judul_slide")
+    @classmethod
+    def _not_blank(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("judul_slide kosong")
+        return v
+
+# response_format schema for the deck prompt
+PPT_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "judul_materi": {"type": "string"},
+        "theme": {"type": "string"},
+        "slides": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "judul_slide": {"type": "string"},
+                    "konten": {"type": "array", "items": {"type": "string"}},
+                    "keyword_visual": {"type": "string"},
+                    "layout_type": {"type": "string", "enum": LAYOUT_TYPES}
+                },
+                "required": ["judul_slide", "konten", "keyword_visual", "layout_type"]
+            }
+        }
+    },
+    "required": ["judul_materi", "theme", "slides"]
+}
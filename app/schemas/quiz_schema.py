@@ -0,0 +1,67 @@
+from pydantic import BaseModel, field_validator
+from typing import Dict, Union
+
+OPTION_KEYS = ["A", "B", "C", "D"]
+
+class QuizQuestion(BaseModel):
+    """One multiple-choice question as produced by the quiz prompt."""
+    no: Union[int, str] = 0
+    pertanyaan: str
+    options: Dict[str, str]
+    kunci_jawaban: str
+    penjelasan: str = ""
+
+    @field_validator("pertanyaan")
+    @classmethod
+    def _not_blank(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("pertanyaan kosong")
+        return v.strip()
+
+    @field_validator("options")
+    @classmethod
+    def _four_options(cls, v: Dict[str, str]) -> Dict[str, str]:
+        options = {str(k).strip().upper(): str(val).strip() for k, val in v.items()}
+        if sorted(options) != OPTION_KEYS or not all(options.values()):
+            raise ValueError("options harus berisi A, B, C, D")
+        return {k: options[k] for k in OPTION_KEYS}
+
+    @field_validator("kunci_jawaban")
+    @classmethod
+    def _valid_key(cls, v: str) -> str:
+        key = v.strip().upper()[:1]
+        if key not in OPTION_KEYS:
+            raise ValueError("kunci_jawaban harus A, B, C, atau D")
+        return key
+
+    @field_validator("penjelasan", mode="before")
+    @classmethod
+    def _none_to_empty(cls, v):
+        return v or ""
+
+# response_format schema for the quiz prompt
+QUIZ_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "judul_kuis": {"type": "string"},
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "no": {"type": "integer"},
+                    "pertanyaan": {"type": "string"},
+                    "options": {
+                        "type": "object",
+                        "properties": {key: {"type": "string"} for key in OPTION_KEYS},
+                        "required": OPTION_KEYS
+                    },
+                    "kunci_jawaban": {"type": "string", "enum": OPTION_KEYS},
+                    "penjelasan": {"type": "string"}
+                },
+                "required": ["no", "pertanyaan", "options", "kunci_jawaban", "penjelasan"]
+            }
+        }
+    },
+    "required": ["judul_kuis", "questions"]
+}
@@ -1,7 +1,16 @@
+import asyncio
+import hmac
+import time
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
+from app.config import Config
 
 pwd_context = CryptContext(schemes=["pbkdf2_sha256", "bcrypt_sha256", "bcrypt"], deprecated="auto")
 
+# passlib's default; hashes at or above this are never considered weak
+PBKDF2_MIN_ROUNDS = 29000
+PBKDF2_MAX_ROUNDS = 2_000_000
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -10,8 +19,79 @@ from fastapi import Request, HTTPException
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+class PasswordHasher:
+    """
+    Async facade over pwd_context for request handlers.
+
+    Hashing and verification run on a small dedicated thread pool (hashlib's pbkdf2
+    and bcrypt release the GIL), capped at HASH_CONCURRENCY jobs so a login burst
+    queues here instead of stalling the event loop or the render/default pools.
+    verify_and_update() also upgrades deprecated (bcrypt) or weak hashes on login.
+    """
+
+    def __init__(self, concurrency: int, target_ms: float):
+        self.concurrency = max(1, concurrency)
+        self.target_ms = target_ms
+        self.rounds = None
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    def calibrate(self, rounds=None) -> int:
+        """
+        Pick pbkdf2_sha256 rounds so one hash costs about HASH_TARGET_MS on this machine
+        (PBKDF2_ROUNDS overrides), and make it the default for new and upgraded hashes.
+        """
+        if rounds is None:
+            sample = PBKDF2_MIN_ROUNDS
+            handler = pwd_context.handler("pbkdf2_sha256")
+            best = None
+            for _ in range(3):
+                start = time.perf_counter()
+                handler.using(rounds=sample).hash("calibration")
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            rounds = int(sample * (self.target_ms / 1000) / best)
+        rounds = max(PBKDF2_MIN_ROUNDS, min(int(rounds), PBKDF2_MAX_ROUNDS))
+        pwd_context.update(
+            pbkdf2_sha256__default_rounds=rounds,
+            pbkdf2_sha256__min_rounds=PBKDF2_MIN_ROUNDS
+        )
+        self.rounds = rounds
+        print(f"DEBUG: pbkdf2_sha256 rounds set to {rounds} (target {self.target_ms:.0f} ms)")
+        return rounds
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="pwhash")
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """(valid, new_hash); new_hash is set when the stored hash should be replaced."""
+        return await self._run(pwd_context.verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_hasher = PasswordHasher(concurrency=Config.HASH_CONCURRENCY, target_ms=Config.HASH_TARGET_MS)
+
 async def get_current_user_id(request: Request):
     user_id = request.session.get("user_id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Unauthorized. Please login.")
     return user_id
+
+async def require_admin_key(request: Request):
+    """Operator endpoints: X-Admin-Key must match ADMIN_API_KEY (unset = endpoints disabled)."""
+    if not Config.ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-admin-key", ""), Config.ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid admin key.")
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from app.config import Config
+
+class ArtifactCache:
+    """
+    Content-addressed cache for rendered export files.
+
+    Keys are a SHA-256 over (artifact kind, renderer version, source payload), so a
+    key doubles as a strong ETag. Bytes live in an in-memory LRU bounded by a byte
+    budget, with an optional on-disk tier under EXPORT_CACHE_DIR that survives restarts.
+    Concurrent requests for the same key share a single render.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._disk_bytes = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind: str, version: str, *payload) -> str:
+        raw = json.dumps([kind, version, payload], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- Memory tier ---
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes):
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    # --- Disk tier ---
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _disk_read(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path) # Refresh mtime so pruning is LRU-ish
+            return data
+        except OSError:
+            return None
+
+    def _disk_write(self, key: str, data: bytes):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"DEBUG: Export cache disk write failed: {e}")
+            return
+
+        if self._disk_bytes is None:
+            self._disk_bytes = self._disk_usage()[0]
+        else:
+            self._disk_bytes += len(data)
+        if self._disk_bytes > self.disk_max_bytes:
+            self._disk_prune()
+
+    def _disk_usage(self):
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return total, files
+
+    def _disk_prune(self):
+        total, files = self._disk_usage()
+        # Drop oldest files until we are back under 90% of the budget
+        target = int(self.disk_max_bytes * 0.9)
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    # --- Public API ---
+
+    async def get_or_render(self, key: str, render) -> bytes:
+        """Return cached bytes for `key`, or await `render()` once and cache the result."""
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        if self.disk_dir:
+            data = await asyncio.to_thread(self._disk_read, key)
+            if data is not None:
+                self.disk_hits += 1
+                self.put(key, data)
+                return data
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        # The render runs in its own task: a caller that goes away (client disconnect)
+        # neither cancels it nor the other requests waiting on the same key
+        self.misses += 1
+        task = asyncio.create_task(self._render_and_store(key, render))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._render_done(key, t))
+        return await asyncio.shield(task)
+
+    async def _render_and_store(self, key: str, render) -> bytes:
+        data = await render()
+        self.put(key, data)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_write, key, data)
+        return data
+
+    def _render_done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception() # Nobody may be waiting any more; mark the exception as retrieved
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+artifact_cache = ArtifactCache(
+    max_bytes=Config.EXPORT_CACHE_MAX_BYTES,
+    disk_dir=Config.EXPORT_CACHE_DIR,
+    disk_max_bytes=Config.EXPORT_CACHE_DISK_MAX_BYTES
+)
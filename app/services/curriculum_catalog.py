@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from types import MappingProxyType
+from typing import Optional
+from sqlalchemy import bindparam, text
+from sqlalchemy.future import select
+from app.config import Config
+from app.utils.time_utils import get_jakarta_time
+
+logger = logging.getLogger(__name__)
+
+def _json_body(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def _version_key(version: str) -> tuple:
+    """Order curriculum versions by their numbers ("9" < "10" < "2024"), then as text."""
+    return tuple(int(n) for n in re.findall(r"\d+", version or "")), version or ""
+
+# In-place edits (renamed subject, corrected CP of the same length) do not move counts
+# or max ids, so every UPDATE bumps a `revision` column kept by a trigger and the
+# fingerprint includes max(revision), answered from an index.
+REVISION_COLUMNS = {
+    "subjects": "name, category",
+    "curriculum_goals": "subject_id, phase, element, cp_content, version",
+}
+PG_REVISION_SETUP = [
+    "CREATE SEQUENCE IF NOT EXISTS curriculum_revision_seq",
+    """CREATE OR REPLACE FUNCTION curriculum_bump_revision() RETURNS trigger AS $$
+        BEGIN NEW.revision := nextval('curriculum_revision_seq'); RETURN NEW; END
+    $$ LANGUAGE plpgsql""",
+]
+PG_REVISION_TABLE = [
+    "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS revision bigint NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_{table}_revision ON {table} (revision)",
+    "DROP TRIGGER IF EXISTS {table}_revision ON {table}",
+    """CREATE TRIGGER {table}_revision BEFORE UPDATE OF {columns} ON {table}
+        FOR EACH ROW EXECUTE FUNCTION curriculum_bump_revision()""",
+]
+SQLITE_REVISION_TABLE = [
+    "CREATE INDEX IF NOT EXISTS ix_{table}_revision ON {table} (revision)",
+    """CREATE TRIGGER IF NOT EXISTS {table}_revision AFTER UPDATE OF {columns} ON {table} BEGIN
+        UPDATE {table} SET revision = (SELECT max(revision) FROM {table}) + 1 WHERE id = new.id;
+    END""",
+]
+
+class CatalogSnapshot:
+    """
+    One immutable load of subjects + curriculum goals.
+
+    Response bodies are serialized once per load, so the endpoints only pick
+    bytes and a strong ETag out of a dict. Indexes:
+      - goals_by_subject_phase: (subject_id, phase) -> (body, etag)
+      - cp_by_name: (subject_name, phase, element) -> cp_content
+    """
+
+    __slots__ = ("fingerprint", "loaded_at", "subjects_body", "subjects_etag",
+                 "goals_by_subject_phase", "cp_by_name", "subject_count", "goal_count")
+
+    def __init__(self, fingerprint: tuple, subjects: list, goals: list):
+        self.fingerprint = fingerprint
+        self.loaded_at = get_jakarta_time()
+        self.subject_count = len(subjects)
+        self.goal_count = len(goals)
+
+        self.subjects_body = _json_body(subjects)
+        self.subjects_etag = _etag(self.subjects_body)
+
+        # Only the newest curriculum version of each (subject, phase, element) is served
+        latest = {}
+        for goal in goals: # Ordered by id: the first goal of an equal version wins
+            key = (goal["subject_id"], goal["phase"], goal["element"])
+            if key not in latest or _version_key(goal["version"]) > _version_key(latest[key]["version"]):
+                latest[key] = goal
+
+        names = {s["id"]: s["name"] for s in subjects}
+        grouped = {}
+        cp_by_name = {}
+        for goal in sorted(latest.values(), key=lambda g: g["id"]):
+            subject_id = goal.pop("subject_id")
+            goal.pop("version")
+            grouped.setdefault((subject_id, goal["phase"]), []).append(goal)
+            cp_by_name[(names.get(subject_id), goal["phase"], goal["element"])] = goal["cp_content"]
+
+        goals_index = {}
+        for key, items in grouped.items():
+            body = _json_body(items)
+            goals_index[key] = (body, _etag(body))
+        self.goals_by_subject_phase = MappingProxyType(goals_index)
+        self.cp_by_name = MappingProxyType(cp_by_name)
+
+    def goals(self, subject_id: int, phase: str) -> tuple:
+        """(body, etag) for /goals; an unknown pair is an empty list."""
+        return self.goals_by_subject_phase.get((subject_id, phase), EMPTY_GOALS)
+
+    def cp_content(self, subject_name: str, phase: str, element: str) -> Optional[str]:
+        return self.cp_by_name.get((subject_name, phase, element))
+
+EMPTY_GOALS = (b"[]", _etag(b"[]"))
+
+class CurriculumCatalog:
+    """
+    In-memory curriculum served to the RPP form and used for the CP lookup in
+    /generate. The snapshot is loaded at startup and swapped whole (readers never
+    see a half-built catalog). Every CURRICULUM_RELOAD_SECONDS a cheap fingerprint
+    query (row counts, max ids and max trigger-maintained revision) decides
+    whether to reload; writers in this process can call reload() directly.
+    """
+
+    def __init__(self, reload_seconds: int):
+        self.reload_seconds = reload_seconds
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = asyncio.Lock()
+        self._task = None
+        self.reloads = 0
+        self.track_revisions = False # revision columns + triggers in place (see setup)
+
+    async def setup(self, engine):
+        """Add the revision columns, indexes and triggers if missing (idempotent, runs at startup)."""
+        dialect = engine.dialect.name
+        try:
+            if dialect == "postgresql":
+                await self._setup_postgres(engine)
+            elif dialect == "sqlite":
+                await self._setup_sqlite(engine)
+            else:
+                print(f"DEBUG: Curriculum revision tracking not supported on {dialect}")
+                return
+            self.track_revisions = True
+        except Exception as e:
+            # Still reloads on added/removed rows, just not on in-place edits
+            logger.warning(f"Curriculum revision tracking setup failed: {e}")
+
+    async def _setup_postgres(self, engine):
+        async with engine.begin() as conn:
+            res = await conn.execute(
+                text("SELECT count(*) FROM pg_trigger WHERE tgname IN :names").bindparams(bindparam("names", expanding=True)),
+                {"names": [f"{table}_revision" for table in REVISION_COLUMNS]}
+            )
+            if res.scalar() == len(REVISION_COLUMNS):
+                return
+            for statement in PG_REVISION_SETUP:
+                await conn.execute(text(statement))
+            for table, columns in REVISION_COLUMNS.items():
+                for statement in PG_REVISION_TABLE:
+                    await conn.execute(text(statement.format(table=table, columns=columns)))
+
+    async def _setup_sqlite(self, engine):
+        async with engine.begin() as conn:
+            for table, columns in REVISION_COLUMNS.items():
+                res = await conn.execute(text(f"SELECT 1 FROM pragma_table_info('{table}') WHERE name = 'revision'"))
+                if res.scalar() is None:
+                    await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"))
+                for statement in SQLITE_REVISION_TABLE:
+                    await conn.execute(text(statement.format(table=table, columns=columns)))
+
+    async def _fingerprint(self, session) -> tuple:
+        fingerprint = ()
+        for table in REVISION_COLUMNS:
+            revision = "max(revision)" if self.track_revisions else "NULL"
+            row = (await session.execute(text(f"SELECT count(id), max(id), {revision} FROM {table}"))).one()
+            fingerprint += tuple(row)
+        return fingerprint
+
+    @staticmethod
+    async def _read_rows(session):
+        from app.models.curriculum import Subject, CurriculumGoal
+        subjects = [
+            {"id": r.id, "name": r.name, "category": r.category}
+            for r in (await session.execute(
+                select(Subject.id, Subject.name, Subject.category).order_by(Subject.id)
+            )).all()
+        ]
+        goals = [
+            {"id": r.id, "subject_id": r.subject_id, "phase": r.phase, "element": r.element,
+             "cp_content": r.cp_content, "version": r.version or ""}
+            for r in (await session.execute(
+                select(CurriculumGoal.id, CurriculumGoal.subject_id, CurriculumGoal.phase,
+                       CurriculumGoal.element, CurriculumGoal.cp_content, CurriculumGoal.version)
+                .order_by(CurriculumGoal.id)
+            )).all()
+        ]
+        return subjects, goals
+
+    async def reload(self, force: bool = True) -> bool:
+        """Rebuild the snapshot (only if the fingerprint changed unless force). Returns True if swapped."""
+        from app.database import SessionLocal
+        async with self._lock:
+            async with SessionLocal() as session:
+                fingerprint = await self._fingerprint(session)
+                if not force and self._snapshot is not None and self._snapshot.fingerprint == fingerprint:
+                    return False
+                subjects, goals = await self._read_rows(session)
+            self._snapshot = CatalogSnapshot(fingerprint, subjects, goals)
+            self.reloads += 1
+        print(f"DEBUG: Curriculum catalog loaded ({len(subjects)} subjects, {len(goals)} goals)")
+        return True
+
+    async def snapshot(self) -> CatalogSnapshot:
+        if self._snapshot is None:
+            await self.reload(force=False) # Startup load failed or has not run yet
+        return self._snapshot
+
+    async def start(self):
+        from app.database import engine
+        await self.setup(engine)
+        try:
+            await self.reload()
+        except Exception as e:
+            # Serve from the first successful lazy load instead of failing startup
+            logger.warning(f"Curriculum catalog load failed: {e}")
+        self._task = asyncio.create_task(self._reload_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                await self.reload(force=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep serving the last good snapshot
+                logger.warning(f"Curriculum catalog reload failed: {e}")
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        return {
+            "loaded": snap is not None,
+            "subjects": snap.subject_count if snap else 0,
+            "goals": snap.goal_count if snap else 0,
+            "loaded_at": snap.loaded_at.isoformat() if snap else None,
+            "reloads": self.reloads,
+        }
+
+curriculum_catalog = CurriculumCatalog(reload_seconds=Config.CURRICULUM_RELOAD_SECONDS)
@@ -0,0 +1,181 @@
+import csv
+import json
+import time
+from typing import Iterator, Optional
+from sqlalchemy.future import select
+from app.models.curriculum import Subject, CurriculumGoal
+
+PHASES = {"FONDASI", "A", "B", "C", "D", "E", "F"}
+DEFAULT_VERSION = "2024"
+DEFAULT_CATEGORY = "Umum"
+
+class RowError(ValueError):
+    """A source row that fails validation; carries the line number."""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+def _insert_for(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Unsupported database dialect: {dialect}")
+    return insert
+
+def read_rows(path: str, fmt: Optional[str] = None) -> Iterator[tuple]:
+    """Yield (line_number, raw dict) from a CSV (header row) or JSONL file without loading it whole."""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError as e:
+                    yield line_no, RowError(line_no, f"invalid JSON ({e})")
+
+def normalize_row(line: int, raw: dict, default_version: str = DEFAULT_VERSION) -> dict:
+    """
+    Validate one source row. Accepted columns: subject (or mapel), category,
+    phase (or fase; "B" / "Fase B"), element (or elemen), cp_content (or cp), version.
+    """
+    if isinstance(raw, RowError):
+        raise raw
+    if not isinstance(raw, dict):
+        raise RowError(line, "row is not an object")
+
+    def field(*names) -> str:
+        for name in names:
+            value = raw.get(name)
+            if value is not None and str(value).strip():
+                return " ".join(str(value).split())
+        return ""
+
+    subject = field("subject", "mapel")
+    phase = field("phase", "fase").upper()
+    if phase.startswith("FASE "):
+        phase = phase[5:].strip()
+    element = field("element", "elemen")
+    cp_content = str(raw.get("cp_content") or raw.get("cp") or "").strip()
+    version = field("version") or default_version
+
+    if not subject:
+        raise RowError(line, "subject is empty")
+    if phase not in PHASES:
+        raise RowError(line, f"unknown phase '{phase}'")
+    if not element:
+        raise RowError(line, "element is empty")
+    if not cp_content:
+        raise RowError(line, "cp_content is empty")
+
+    return {
+        "subject": subject,
+        "category": field("category", "kategori") or DEFAULT_CATEGORY,
+        "phase": "Fondasi" if phase == "FONDASI" else phase,
+        "element": element,
+        "cp_content": cp_content,
+        "version": version,
+    }
+
+class CurriculumImporter:
+    """
+    Streams validated rows into subjects/curriculum_goals in batches.
+
+    Each batch is one transaction: missing subjects are inserted (ON CONFLICT
+    DO NOTHING on name), then goals are upserted with a multi-row INSERT ... ON
+    CONFLICT (subject_id, phase, element, version) DO UPDATE that only touches
+    rows whose CP text changed. Re-running the same file writes nothing.
+    """
+
+    def __init__(self, engine, batch_size: int = 1000, default_version: str = DEFAULT_VERSION, dry_run: bool = False):
+        self.engine = engine
+        self.batch_size = max(1, batch_size)
+        self.default_version = default_version
+        self.dry_run = dry_run
+        self.insert = _insert_for(engine.dialect.name)
+        self._subject_ids = {}
+        self.stats = {"rows": 0, "valid": 0, "invalid": 0, "written": 0, "unchanged": 0, "subjects_created": 0, "seconds": 0.0}
+        self.errors = []
+
+    async def _subject_ids_for(self, conn, batch: list) -> dict:
+        categories = {}
+        for row in batch:
+            if row["subject"] not in self._subject_ids:
+                categories.setdefault(row["subject"], row["category"])
+        if categories:
+            res = await conn.execute(
+                self.insert(Subject)
+                .values([{"name": name, "category": category} for name, category in categories.items()])
+                .on_conflict_do_nothing(index_elements=["name"])
+            )
+            self.stats["subjects_created"] += max(res.rowcount, 0)
+            found = await conn.execute(select(Subject.id, Subject.name).where(Subject.name.in_(list(categories))))
+            self._subject_ids.update({r.name: r.id for r in found.all()})
+        return self._subject_ids
+
+    async def _write_batch(self, batch: list):
+        # Last occurrence wins inside a batch: Postgres rejects ON CONFLICT touching one row twice
+        unique = {}
+        for row in batch:
+            unique[(row["subject"], row["phase"], row["element"], row["version"])] = row
+        batch = list(unique.values())
+
+        async with self.engine.connect() as conn:
+            trans = await conn.begin()
+            subject_ids = await self._subject_ids_for(conn, batch)
+            stmt = self.insert(CurriculumGoal).values([
+                {
+                    "subject_id": subject_ids[row["subject"]],
+                    "phase": row["phase"],
+                    "element": row["element"],
+                    "cp_content": row["cp_content"],
+                    "version": row["version"],
+                }
+                for row in batch
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["subject_id", "phase", "element", "version"],
+                set_={"cp_content": stmt.excluded.cp_content},
+                where=CurriculumGoal.cp_content != stmt.excluded.cp_content
+            )
+            res = await conn.execute(stmt)
+            written = max(res.rowcount, 0)
+            if self.dry_run:
+                await trans.rollback()
+                self._subject_ids = {} # Subjects created in this batch are gone again
+            else:
+                await trans.commit()
+        self.stats["written"] += written
+        self.stats["unchanged"] += len(batch) - written
+
+    async def run(self, path: str, fmt: Optional[str] = None, max_errors: int = 100, progress=print) -> dict:
+        start = time.perf_counter()
+        batch = []
+        for line, raw in read_rows(path, fmt):
+            self.stats["rows"] += 1
+            try:
+                batch.append(normalize_row(line, raw, self.default_version))
+                self.stats["valid"] += 1
+            except RowError as e:
+                self.stats["invalid"] += 1
+                if len(self.errors) < max_errors:
+                    self.errors.append(str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                await self._write_batch(batch)
+                batch = []
+                elapsed = time.perf_counter() - start
+                progress(f"  {self.stats['valid']} rows ({self.stats['valid'] / elapsed:.0f} rows/s)")
+        if batch:
+            await self._write_batch(batch)
+
+        self.stats["seconds"] = round(time.perf_counter() - start, 3)
+        return self.stats
@@ -0,0 +1,160 @@
+import time
+from datetime import datetime
+from typing import Optional
+from fastapi import Depends
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import Config
+from app.database import get_db
+from app.security import get_current_user_id
+from app.utils.time_utils import get_jakarta_time
+from app.metrics import stage_timer
+
+# Monthly Modul Ajar quota per plan
+RPP_LIMITS = {
+    "free": 2,
+    "standard": 10,
+    "pro": 25,
+    "premium": 60,
+    # Legacy/Other
+    "monthly": 25,
+    "yearly": 300,
+    "school": 1000
+}
+DEFAULT_RPP_LIMIT = 2 # Free limit
+
+PPT_PLANS = ["pro", "premium", "school", "yearly"]
+QUIZ_WORD_PLANS = ["premium", "school"]
+NO_EXPLANATION_PLANS = ["standard", "standar"]
+
+class Entitlement(BaseModel):
+    plan_type: str = "free"
+    end_date: Optional[datetime] = None
+    rpp_limit: int = DEFAULT_RPP_LIMIT
+    is_paid: bool = False
+    can_generate_ppt: bool = False
+    can_generate_quiz: bool = False
+    quiz_explanations: bool = False
+    can_export_rpp_word: bool = False
+    can_export_quiz_pdf: bool = False
+    can_export_quiz_word: bool = False
+    can_view_history: bool = False
+
+    @classmethod
+    def for_plan(cls, plan_type: str, end_date: Optional[datetime] = None) -> "Entitlement":
+        is_paid = plan_type != "free"
+        return cls(
+            plan_type=plan_type,
+            end_date=end_date,
+            rpp_limit=RPP_LIMITS.get(plan_type, DEFAULT_RPP_LIMIT),
+            is_paid=is_paid,
+            can_generate_ppt=plan_type in PPT_PLANS,
+            can_generate_quiz=is_paid,
+            quiz_explanations=is_paid and plan_type not in NO_EXPLANATION_PLANS,
+            can_export_rpp_word=is_paid,
+            can_export_quiz_pdf=is_paid,
+            can_export_quiz_word=plan_type in QUIZ_WORD_PLANS,
+            can_view_history=is_paid
+        )
+
+class MemoryEntitlementBackend:
+    """
+    Per-process TTL store. Any object with the same async get/set/delete methods
+    (e.g. a Redis wrapper storing the dicts as JSON) can be passed to the resolver
+    so invalidations are shared between workers.
+    """
+
+    def __init__(self):
+        self._entries = {} # key -> (expires_at, value)
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key: str, value: dict, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+class EntitlementResolver:
+    """
+    Resolves the active subscription of a user into an Entitlement (plan + feature flags).
+
+    Results are cached for ENTITLEMENT_CACHE_TTL seconds, never past the subscription's
+    end_date, and payment_callback invalidates the entry when a plan is activated or extended.
+    """
+
+    def __init__(self, ttl_seconds: int, backend=None):
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend or MemoryEntitlementBackend()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(user_id) -> str:
+        return f"entitlement:{user_id}"
+
+    async def resolve(self, db: AsyncSession, user_id: int) -> Entitlement:
+        with stage_timer("subscription_check"):
+            return await self._resolve(db, user_id)
+
+    async def _resolve(self, db: AsyncSession, user_id: int) -> Entitlement:
+        from app.models.payment import Subscription
+
+        key = self._key(user_id)
+        cached = await self.backend.get(key)
+        if cached is not None:
+            entitlement = Entitlement.model_validate(cached)
+            if entitlement.end_date is None or entitlement.end_date > get_jakarta_time():
+                self.hits += 1
+                return entitlement
+        self.misses += 1
+
+        now = get_jakarta_time()
+        sub_res = await db.execute(
+            select(Subscription).where(
+                Subscription.user_id == user_id,
+                Subscription.is_active == True,
+                Subscription.end_date > now
+            )
+        )
+        subscription = sub_res.scalars().first()
+        if subscription:
+            entitlement = Entitlement.for_plan(subscription.plan_type, subscription.end_date)
+        else:
+            entitlement = Entitlement.for_plan("free")
+
+        ttl = self.ttl_seconds
+        if entitlement.end_date is not None:
+            ttl = min(ttl, (entitlement.end_date - now).total_seconds())
+        if ttl > 0:
+            await self.backend.set(key, entitlement.model_dump(mode="json"), ttl)
+        return entitlement
+
+    async def invalidate(self, user_id: int):
+        await self.backend.delete(self._key(user_id))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+entitlement_resolver = EntitlementResolver(ttl_seconds=Config.ENTITLEMENT_CACHE_TTL)
+
+async def get_entitlement(
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+) -> Entitlement:
+    """FastAPI dependency: the logged-in user's current Entitlement."""
+    return await entitlement_resolver.resolve(db, user_id)
@@ -0,0 +1,380 @@
+import io
+from fpdf import FPDF
+from docx import Document
+from docx.shared import Pt, RGBColor
+
+def clean_text(text: str) -> str:
+    """Clean text to be compatible with FPDF's default latin-1 fonts."""
+    if not text:
+        return ""
+    # Standardize spaces and common unicode characters
+    text = str(text)
+    text = text.replace('\r', '')
+    text = text.replace('\u2013', '-').replace('\u2014', '-').replace('\u2019', "'").replace('\u2018', "'")
+    text = text.replace('\u201c', '"').replace('\u201d', '"').replace('\u2022', '\x95')
+    # Force to latin-1, replacing anything else with '?'
+    # This prevents UnicodeEncodeError in fpdf2
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+def clean_markdown_symbols(text: str) -> str:
+    """Extra robust function to remove markdown symbols like **, *, etc."""
+    if not text: return ""
+    # Remove bold/italic markers
+    text = text.replace('***', '').replace('**', '').replace('*', '')
+    # Remove underline markers if any
+    text = text.replace('__', '').replace('_', '')
+    return text.strip()
+
+def _add_docx_runs(paragraph, runs):
+    """Append [text, is_bold] runs to a python-docx paragraph in black."""
+    for text, bold in runs:
+        r = paragraph.add_run(text)
+        if bold:
+            r.bold = True
+        r.font.color.rgb = RGBColor(0, 0, 0)
+
+class ExportService:
+    """
+    Synchronous document builders for RPP and quiz exports.
+
+    Every builder takes plain data and returns the finished file as bytes so it
+    can run on the render executor (thread or process pool) without touching
+    the event loop, the DB session or any request object. RPP builders take the
+    block list from app.utils.markdown_ast instead of raw markdown so one parse
+    serves both formats.
+    """
+    # Bump whenever builder output changes so cached exports are not reused
+    RENDERER_VERSION = "2"
+
+    @staticmethod
+    def build_rpp_pdf(topik: str, mapel: str, kelas: str, blocks) -> bytes:
+        pdf = FPDF()
+        pdf.add_page()
+
+        # --- HEADER (Matches Word/Modal) ---
+        pdf.set_y(15)
+        pdf.set_x(10)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Arial", 'B', 11)
+        pdf.cell(190, 10, "MODUL AJAR (RPP)", ln=True, align='C')
+
+        pdf.set_font("Arial", 'B', 18)
+        pdf.set_x(10)
+        pdf.multi_cell(190, 12, clean_text(clean_markdown_symbols(topik)), align='C')
+
+        pdf.set_font("Arial", 'I', 10)
+        pdf.set_x(10)
+        meta_text_clean = clean_markdown_symbols(f"{mapel} | Kelas {kelas}")
+        pdf.cell(190, 8, clean_text(meta_text_clean), ln=True, align='C')
+
+        # Separator Line
+        pdf.ln(2)
+        pdf.set_draw_color(200, 200, 200)
+        pdf.line(20, pdf.get_y(), 190, pdf.get_y())
+        pdf.ln(10)
+
+        # Content Rendering (blocks from app.utils.markdown_ast)
+        pdf.set_font("Arial", '', 11)
+
+        for block in blocks:
+            kind = block["type"]
+
+            if kind == "table":
+                headers = [clean_text(clean_markdown_symbols(c)) for c in block["headers"]]
+                table_data = [[clean_text(clean_markdown_symbols(c)) for c in row] for row in block["rows"]]
+                is_identity = block["identity"]
+
+                pdf.ln(2)
+                if is_identity:
+                    pdf.set_line_width(0)
+                else:
+                    pdf.set_line_width(0.1)
+
+                with pdf.table(width=190, padding=2, line_height=7) as table:
+                    if headers and not is_identity:
+                        header_row = table.row()
+                        pdf.set_font("Arial", 'B', 10)
+                        pdf.set_fill_color(245, 245, 245)
+                        for h in headers: header_row.cell(h)
+
+                    pdf.set_font("Arial", '', 10)
+                    for r_data in table_data:
+                        row = table.row()
+                        for r_idx, c in enumerate(r_data):
+                            if is_identity and r_idx == 0:
+                                pdf.set_font("Arial", 'B', 10)
+                            row.cell(c)
+                            if is_identity: pdf.set_font("Arial", '', 10)
+                pdf.ln(2)
+
+            elif kind == "blank":
+                pdf.ln(2)
+
+            # Header handling (Hierarchy)
+            elif kind == "heading":
+                level = block["level"]
+                clean_header = clean_markdown_symbols(block["text"])
+
+                if level == 3: # Level A, B, C
+                    pdf.ln(4)
+                    pdf.set_font("Arial", 'B', 12)
+                elif level == 2: # Level I, II, III
+                    pdf.ln(6)
+                    pdf.set_font("Arial", 'B', 14)
+                    # Draw a thin line above main sections
+                    pdf.set_draw_color(230, 230, 230)
+                    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+                    pdf.ln(2)
+                else: # Title #
+                    pdf.set_font("Arial", 'B', 16)
+                    pdf.ln(5)
+
+                pdf.set_x(10)
+                # Auto center the main title if it's level 1
+                align = 'C' if level == 1 else 'L'
+                pdf.multi_cell(0, 8, clean_text(clean_header), align=align)
+                pdf.set_font("Arial", '', 11)
+
+            # Ordered List handling (Roman/Alpha/Numeric)
+            elif kind == "ordered":
+                text = clean_markdown_symbols(block["text"])
+                indent = 10 if block["indent"] else 0
+                pdf.set_x(15 + indent)
+                pdf.multi_cell(0, 7, clean_text(f"{block['marker']}. {text}"))
+                pdf.set_x(10)
+
+            # Unordered List handling
+            elif kind == "bullet":
+                text = clean_markdown_symbols(block["text"])
+                indent = 20 if block["indent"] else 15
+                pdf.set_x(indent)
+                pdf.multi_cell(0, 7, clean_text(f"\x95 {text}"))
+                pdf.set_x(10)
+
+            # Regular text
+            else:
+                text = clean_markdown_symbols(block["text"])
+                pdf.set_x(10)
+                pdf.multi_cell(0, 7, clean_text(text))
+
+        return bytes(pdf.output())
+
+    @staticmethod
+    def build_rpp_docx(topik: str, mapel: str, kelas: str, blocks) -> bytes:
+        doc = Document()
+
+        # Title Section (Styled as Modal)
+        h0 = doc.add_heading("MODUL AJAR (RPP)", 0)
+        h0.alignment = 1
+        for run in h0.runs: run.font.color.rgb = RGBColor(0, 0, 0)
+
+        p_topik = doc.add_paragraph()
+        p_topik.alignment = 1
+        run_topik = p_topik.add_run(topik)
+        run_topik.bold = True
+        run_topik.font.size = Pt(18)
+        run_topik.font.color.rgb = RGBColor(0, 0, 0)
+
+        p_meta = doc.add_paragraph()
+        p_meta.alignment = 1
+        run_mapel = p_meta.add_run(f" {mapel} ")
+        run_mapel.font.size = Pt(10)
+        run_mapel.italic = True
+        run_mapel.font.color.rgb = RGBColor(0, 0, 0)
+
+        run_kelas = p_meta.add_run(f" | Kelas {kelas} ")
+        run_kelas.font.size = Pt(10)
+        run_kelas.italic = True
+        run_kelas.font.color.rgb = RGBColor(0, 0, 0)
+
+        doc.add_paragraph("_" * 60).alignment = 1
+
+        # Content Rendering with Table Support (blocks from app.utils.markdown_ast)
+        for block in blocks:
+            kind = block["type"]
+
+            if kind == "table":
+                headers = [c.replace('**', '') for c in block["headers"]]
+                rows = [[c.replace('**', '') for c in row] for row in block["rows"]]
+                is_identity = block["identity"]
+
+                table = doc.add_table(rows=0, cols=len(headers))
+                if not is_identity:
+                    table.style = 'Table Grid'
+
+                if headers and not is_identity:
+                    header_row = table.add_row().cells
+                    for idx, hs in enumerate(headers):
+                        p = header_row[idx].paragraphs[0]
+                        r = p.add_run(hs)
+                        r.bold = True
+                        r.font.color.rgb = RGBColor(0, 0, 0)
+
+                for row_data in rows:
+                    cells = table.add_row().cells
+                    for idx, val in enumerate(row_data):
+                        p = cells[idx].paragraphs[0]
+                        r = p.add_run(val)
+                        if is_identity and idx == 0:
+                            r.bold = True
+                        r.font.color.rgb = RGBColor(0, 0, 0)
+
+                doc.add_paragraph() # Add space after table
+
+            elif kind == "blank":
+                continue
+
+            # Header handling (Hierarchy)
+            elif kind == "heading":
+                level = block["level"]
+                h = doc.add_heading(block["text"], level=level)
+                if level == 1:
+                    h.alignment = 1 # Center main title
+
+                # Set heading color to black
+                for run in h.runs:
+                    run.font.color.rgb = RGBColor(0, 0, 0)
+
+            # Ordered List handling (Roman/Alpha/Numeric)
+            elif kind == "ordered":
+                # We use a custom paragraph for nested lists as docx styles can be finicky
+                p = doc.add_paragraph()
+                p.paragraph_format.left_indent = Pt(36) if block["indent"] else Pt(18)
+
+                # Roman (I., II.) or Alpha (A., B.) markers look like headings
+                r_marker = p.add_run(f"{block['marker']}. ")
+                if block["emphasis"]:
+                    r_marker.bold = True
+                _add_docx_runs(p, block["runs"])
+
+            # Unordered List handling (Bullets)
+            elif kind == "bullet":
+                p = doc.add_paragraph(style='List Bullet')
+                if block["indent"]:
+                    p.paragraph_format.left_indent = Pt(54)
+                _add_docx_runs(p, block["runs"])
+
+            # Regular text
+            else:
+                p = doc.add_paragraph()
+                _add_docx_runs(p, block["runs"])
+
+        file_stream = io.BytesIO()
+        doc.save(file_stream)
+        return file_stream.getvalue()
+
+    @staticmethod
+    def build_quiz_pdf(quiz_data: dict, mapel: str, topik: str) -> bytes:
+        pdf = FPDF()
+        pdf.add_page()
+
+        # --- HEADER ---
+        pdf.set_y(15)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Arial", 'B', 11)
+        pdf.cell(190, 10, "LATIHAN SOAL & EVALUASI", ln=True, align='C')
+
+        pdf.set_font("Arial", 'B', 18)
+        pdf.multi_cell(190, 12, clean_text(topik), align='C')
+
+        pdf.set_font("Arial", 'I', 10)
+        pdf.cell(190, 8, clean_text(f"Mata Pelajaran: {mapel}"), ln=True, align='C')
+
+        # Separator Line
+        pdf.ln(2)
+        pdf.set_draw_color(200, 200, 200)
+        pdf.line(20, pdf.get_y(), 190, pdf.get_y())
+        pdf.ln(10)
+
+        # --- QUESTIONS ---
+        questions = quiz_data.get("questions", [])
+        for q in questions:
+            # Check for page break space
+            if pdf.get_y() > 250:
+                pdf.add_page()
+
+            pdf.set_x(10) # Ensure we are at the left margin
+            pdf.set_font("Arial", 'B', 11)
+            # Question Number and Text
+            no = q.get('no', '')
+            txt = clean_text(f"{no}. {q.get('pertanyaan', '')}")
+            # Use explicit width pdf.epw instead of 0 to avoid calculation errors
+            pdf.multi_cell(pdf.epw, 8, txt)
+
+            pdf.ln(2)
+            pdf.set_font("Arial", '', 10)
+            options = q.get("options", {})
+            for key, val in options.items():
+                pdf.set_x(10) # Reset X before each option
+                # Option text
+                opt_txt = clean_text(f"   {key}. {val}")
+                pdf.multi_cell(pdf.epw, 7, opt_txt)
+
+            pdf.ln(5)
+
+        # --- ANSWER KEY PAGE ---
+        pdf.add_page()
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, "KUNCI JAWABAN & PENJELASAN", ln=True, align='C')
+        pdf.ln(5)
+
+        pdf.set_font("Arial", '', 10)
+        for q in questions:
+            if pdf.get_y() > 260:
+                pdf.add_page()
+
+            pdf.set_x(10) # Start from margin
+            pdf.set_font("Arial", 'B', 10)
+            pdf.cell(0, 8, clean_text(f"Nomor {q.get('no', '')}: {q.get('kunci_jawaban', '')}"), ln=True)
+
+            penjelasan = q.get('penjelasan', '').strip()
+            # Only show if not empty and not just a placeholder
+            if penjelasan and len(penjelasan) > 2:
+                pdf.set_x(10) # Ensure description also starts from margin
+                pdf.set_font("Arial", 'I', 9)
+                pdf.set_text_color(80, 80, 80)
+                pdf.multi_cell(pdf.epw, 6, clean_text(f"Penjelasan: {penjelasan}"))
+                pdf.set_text_color(0, 0, 0)
+
+            pdf.ln(3)
+
+        return bytes(pdf.output())
+
+    @staticmethod
+    def build_quiz_docx(quiz_data: dict, mapel: str, topik: str, skip_empty_explanations: bool = False) -> bytes:
+        doc = Document()
+
+        # Title
+        doc.add_heading(f"Latihan Soal: {topik}", 0)
+        subtitle = doc.add_paragraph(f"Mata Pelajaran: {mapel}")
+        subtitle.alignment = 1 # Center
+
+        questions = quiz_data.get("questions", [])
+        for q in questions:
+            p = doc.add_paragraph()
+            p.add_run(f"{q.get('no', '')}. {q.get('pertanyaan', '')}").bold = True
+
+            options = q.get("options", {})
+            for key, val in options.items():
+                doc.add_paragraph(f"   {key}. {val}")
+
+        # Kunci Jawaban at the end
+        doc.add_page_break()
+        doc.add_heading("Kunci Jawaban & Penjelasan", level=1)
+        for q in questions:
+            p = doc.add_paragraph()
+            p.add_run(f"No {q.get('no', '')}: ").bold = True
+            p.add_run(f"{q.get('kunci_jawaban', '')}")
+
+            penjelasan = q.get('penjelasan', '')
+            if skip_empty_explanations:
+                penjelasan = penjelasan.strip()
+                if not penjelasan or len(penjelasan) <= 2:
+                    continue
+            expl = doc.add_paragraph()
+            expl.add_run("Penjelasan: ").italic = True
+            expl.add_run(f"{penjelasan}")
+
+        file_stream = io.BytesIO()
+        doc.save(file_stream)
+        return file_stream.getvalue()
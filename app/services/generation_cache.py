@@ -0,0 +1,127 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.config import Config
+from app.prompts.rpp_prompt import build_rpp_prompt
+from app.schemas.rpp_schema import RPPRequest
+
+# Identity fields are swapped for tokens before hashing and storing, so teachers
+# who differ only in name/school share one cached Modul Ajar.
+IDENTITY_TOKENS = {
+    "nama_guru": "⟦NAMA_GURU⟧",
+    "nama_sekolah": "⟦NAMA_SEKOLAH⟧",
+}
+# Defaults from RPPRequest; too generic to search-and-replace in the body text
+GENERIC_IDENTITY_VALUES = {"guru", "sekolah", ""}
+
+WHITESPACE_RE = re.compile(r'\s+')
+# | **Penyusun** | Budi |  /  | **Instansi** | SDN 1 |
+IDENTITY_ROW_RE = {
+    "nama_guru": re.compile(r'^(\|\s*\*\*Penyusun\*\*\s*\|)[^|\n]*(\|)', re.MULTILINE),
+    "nama_sekolah": re.compile(r'^(\|\s*\*\*Instansi\*\*\s*\|)[^|\n]*(\|)', re.MULTILINE),
+}
+# | **(...)** | **Budi** |  (signature row of the closing table)
+SIGNATURE_ROW_RE = re.compile(r'^(\|\s*\*\*\(\.\.\.\)\*\*\s*\|\s*\*\*)[^*|\n]*(\*\*\s*\|)', re.MULTILINE)
+
+class GenerationCache:
+    """
+    Cache of generated Modul Ajar markdown keyed by a normalized prompt hash.
+
+    The key is the build_rpp_prompt output with identity fields replaced by tokens,
+    whitespace-collapsed and hashed together with the model id. Stored markdown is
+    templatized the same way and re-filled with the caller's identity on a hit.
+    Entries expire after GEN_CACHE_TTL_SECONDS and the LRU is capped at
+    GEN_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # key -> (expires_at, template)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(request: RPPRequest, db_cp_content: Optional[str], model: str) -> str:
+        anonymous = request.model_copy(update=IDENTITY_TOKENS)
+        prompt = build_rpp_prompt(anonymous, db_cp_content)
+        normalized = WHITESPACE_RE.sub(" ", prompt).strip()
+        return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _templatize(markdown: str, request: RPPRequest) -> Optional[str]:
+        """
+        Swap the requester's identity for tokens. Returns None if it cannot be removed safely.
+
+        Only the identity rows and the signature row are rewritten; free text is never
+        search-and-replaced ("Budi" would also hit "Budidaya"). A name left anywhere
+        else in the body means the document is not cached.
+        """
+        template = markdown
+        for field, token in IDENTITY_TOKENS.items():
+            template = IDENTITY_ROW_RE[field].sub(lambda m: f"{m.group(1)} {token} {m.group(2)}", template)
+        template = SIGNATURE_ROW_RE.sub(lambda m: f"{m.group(1)}{IDENTITY_TOKENS['nama_guru']}{m.group(2)}", template)
+
+        # Never cache a document that still carries someone's name (in the text, upper-cased by the model, ...)
+        lowered = template.lower()
+        for field in IDENTITY_TOKENS:
+            value = (getattr(request, field) or "").strip().lower()
+            if value not in GENERIC_IDENTITY_VALUES and value in lowered:
+                return None
+        return template
+
+    @staticmethod
+    def _fill(template: str, request: RPPRequest) -> str:
+        result = template
+        for field, token in IDENTITY_TOKENS.items():
+            result = result.replace(token, getattr(request, field) or "")
+        return result
+
+    def get(self, key: str, request: RPPRequest) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, template = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._fill(template, request)
+
+    def put(self, key: str, request: RPPRequest, markdown: str):
+        template = self._templatize(markdown, request)
+        if template is None:
+            self.skipped += 1
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, template)
+        self._entries.move_to_end(key)
+        self.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "skipped_unsafe": self.skipped,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+generation_cache = GenerationCache(
+    ttl_seconds=Config.GEN_CACHE_TTL_SECONDS,
+    max_entries=Config.GEN_CACHE_MAX_ENTRIES
+)
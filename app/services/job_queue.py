@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import json
+import uuid
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import delete, update
+from sqlalchemy.future import select
+from app.config import Config
+from app.utils.time_utils import get_jakarta_time
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# A 'running' job not updated for this long belongs to a dead worker and is re-queued
+STALE_RUNNING = timedelta(minutes=10)
+
+def make_dedup_key(kind: str, *inputs) -> str:
+    raw = json.dumps([kind, inputs], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class MemoryJobStore:
+    """Jobs in a dict; lost on restart. Fine for a single process."""
+
+    def __init__(self):
+        self._jobs = {}
+
+    async def create(self, job: dict):
+        self._jobs[job["id"]] = dict(job)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def find_reusable(self, user_id: int, kind: str, dedup_key: str, since) -> Optional[dict]:
+        matches = [
+            j for j in self._jobs.values()
+            if j["user_id"] == user_id and j["kind"] == kind and j["dedup_key"] == dedup_key
+            and j["status"] != JOB_FAILED and j["created_at"] >= since
+        ]
+        return dict(max(matches, key=lambda j: j["created_at"])) if matches else None
+
+    async def _set(self, job_id: str, when_status=None, **values) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or (when_status is not None and job["status"] != when_status):
+            return False
+        job.update(values, updated_at=get_jakarta_time())
+        return True
+
+    async def claim(self, job_id: str) -> bool:
+        return await self._set(job_id, when_status=JOB_QUEUED, status=JOB_RUNNING)
+
+    async def finish(self, job_id: str, result: dict):
+        await self._set(job_id, status=JOB_DONE, result=result, error=None)
+
+    async def fail(self, job_id: str, error: str):
+        await self._set(job_id, status=JOB_FAILED, error=error)
+
+    async def requeue(self, job_id: str):
+        await self._set(job_id, when_status=JOB_RUNNING, status=JOB_QUEUED)
+
+    async def recover(self) -> list:
+        stale = get_jakarta_time() - STALE_RUNNING
+        for job in self._jobs.values():
+            if job["status"] == JOB_RUNNING and job["updated_at"] < stale:
+                job["status"] = JOB_QUEUED
+        return [j["id"] for j in sorted(self._jobs.values(), key=lambda j: j["created_at"]) if j["status"] == JOB_QUEUED]
+
+    async def prune(self, before):
+        for job_id in [j["id"] for j in self._jobs.values() if j["updated_at"] < before and j["status"] in (JOB_DONE, JOB_FAILED)]:
+            del self._jobs[job_id]
+
+class DatabaseJobStore:
+    """Jobs in the `jobs` table (SQLite/Postgres); queued jobs survive restarts and claims are atomic."""
+
+    COLUMNS = ("id", "kind", "user_id", "dedup_key", "status", "payload", "result", "error", "created_at", "updated_at")
+
+    def _row(self, job) -> dict:
+        return {c: getattr(job, c) for c in self.COLUMNS}
+
+    async def create(self, job: dict):
+        from app.database import SessionLocal
+        from app.models.job import Job
+        async with SessionLocal() as session:
+            session.add(Job(**job))
+            await session.commit()
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        from app.database import SessionLocal
+        from app.models.job import Job
+        async with SessionLocal() as session:
+            job = await session.get(Job, job_id)
+            return self._row(job) if job else None
+
+    async def find_reusable(self, user_id: int, kind: str, dedup_key: str, since) -> Optional[dict]:
+        from app.database import SessionLocal
+        from app.models.job import Job
+        async with SessionLocal() as session:
+            res = await session.execute(
+                select(Job).where(
+                    Job.user_id == user_id, Job.kind == kind, Job.dedup_key == dedup_key,
+                    Job.status != JOB_FAILED, Job.created_at >= since
+                ).order_by(Job.created_at.desc()).limit(1)
+            )
+            job = res.scalars().first()
+            return self._row(job) if job else None
+
+    async def _set(self, job_id: str, when_status=None, **values) -> bool:
+        from app.database import SessionLocal
+        from app.models.job import Job
+        stmt = update(Job).where(Job.id == job_id)
+        if when_status is not None:
+            stmt = stmt.where(Job.status == when_status)
+        async with SessionLocal() as session:
+            res = await session.execute(stmt.values(updated_at=get_jakarta_time(), **values))
+            await session.commit()
+            return res.rowcount == 1
+
+    async def claim(self, job_id: str) -> bool:
+        return await self._set(job_id, when_status=JOB_QUEUED, status=JOB_RUNNING)
+
+    async def finish(self, job_id: str, result: dict):
+        await self._set(job_id, status=JOB_DONE, result=result, error=None)
+
+    async def fail(self, job_id: str, error: str):
+        await self._set(job_id, status=JOB_FAILED, error=error)
+
+    async def requeue(self, job_id: str):
+        await self._set(job_id, when_status=JOB_RUNNING, status=JOB_QUEUED)
+
+    async def recover(self) -> list:
+        from app.database import SessionLocal
+        from app.models.job import Job
+        async with SessionLocal() as session:
+            await session.execute(
+                update(Job).where(
+                    Job.status == JOB_RUNNING, Job.updated_at < get_jakarta_time() - STALE_RUNNING
+                ).values(status=JOB_QUEUED)
+            )
+            res = await session.execute(
+                select(Job.id).where(Job.status == JOB_QUEUED).order_by(Job.created_at)
+            )
+            await session.commit()
+            return list(res.scalars().all())
+
+    async def prune(self, before):
+        from app.database import SessionLocal
+        from app.models.job import Job
+        async with SessionLocal() as session:
+            await session.execute(
+                delete(Job).where(Job.updated_at < before, Job.status.in_([JOB_DONE, JOB_FAILED]))
+            )
+            await session.commit()
+
+class JobQueue:
+    """
+    Background jobs with a fixed pool of asyncio workers.
+
+    submit() returns immediately; a job with the same (user, kind, inputs) that is
+    queued, running or finished within JOB_TTL_SECONDS is returned instead of
+    starting a new one. Handlers are async callables registered per kind; they get
+    the job dict and return a JSON-serializable result. An exception marks the job
+    failed (HTTPException.detail is kept as the error message).
+    """
+
+    def __init__(self, store, workers: int, ttl_seconds: int):
+        self.store = store
+        self.workers = max(1, workers)
+        self.ttl_seconds = ttl_seconds
+        self.handlers = {}
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._submit_lock = asyncio.Lock()
+
+    def register(self, kind: str, handler):
+        self.handlers[kind] = handler
+
+    async def start(self):
+        await self.store.prune(get_jakarta_time() - timedelta(seconds=self.ttl_seconds))
+        for job_id in await self.store.recover():
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, user_id: int, payload: dict, dedup_key: str):
+        """Returns (job, deduplicated)."""
+        async with self._submit_lock:
+            since = get_jakarta_time() - timedelta(seconds=self.ttl_seconds)
+            existing = await self.store.find_reusable(user_id, kind, dedup_key, since)
+            if existing:
+                return existing, True
+
+            now = get_jakarta_time()
+            job = {
+                "id": uuid.uuid4().hex,
+                "kind": kind,
+                "user_id": user_id,
+                "dedup_key": dedup_key,
+                "status": JOB_QUEUED,
+                "payload": payload,
+                "result": None,
+                "error": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            await self.store.create(job)
+        self._queue.put_nowait(job["id"])
+        return job, False
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.store.get(job_id)
+
+    @property
+    def backlog(self) -> int:
+        return self._queue.qsize()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"DEBUG: Job {job_id} crashed the worker: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        if not await self.store.claim(job_id):
+            return # Taken by another worker/process, or no longer queued
+        job = await self.store.get(job_id)
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await self.store.fail(job_id, f"Unknown job kind: {job['kind']}")
+            return
+        try:
+            result = await handler(job)
+        except asyncio.CancelledError:
+            # Shutting down: leave it for the next start (database store)
+            await asyncio.shield(self.store.requeue(job_id))
+            raise
+        except Exception as e:
+            await self.store.fail(job_id, str(getattr(e, "detail", None) or e))
+            return
+        await self.store.finish(job_id, result)
+
+job_queue = JobQueue(
+    store=DatabaseJobStore() if Config.JOB_STORE == "database" else MemoryJobStore(),
+    workers=Config.JOB_WORKERS,
+    ttl_seconds=Config.JOB_TTL_SECONDS
+)
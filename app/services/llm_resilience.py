@@ -0,0 +1,201 @@
+import email.utils
+import random
+import time
+import openai
+from app.config import Config
+from app.metrics import llm_circuit_state, llm_circuit_transitions
+
+# Error kinds worth another attempt (same or another backend, after a backoff)
+RETRYABLE = ("rate_limit", "overloaded", "timeout", "connection", "provider_error")
+# ...and the subset that means the backend itself is unhealthy (counts towards its breaker).
+# A 429 only says "slow down", so it neither trips nor heals a breaker.
+OUTAGE = ("overloaded", "timeout", "connection", "provider_error")
+
+# Total time budget per feature: attempts, backoff sleeps and re-queueing, counted
+# from the first scheduler slot (queue time before that is the scheduler's business).
+# Streams are only bounded until their first token.
+DEADLINES = {
+    "rpp": Config.LLM_DEADLINE_RPP,
+    "ppt": Config.LLM_DEADLINE_PPT,
+    "quiz": Config.LLM_DEADLINE_QUIZ,
+}
+
+class CircuitOpenError(Exception):
+    """No backend accepts calls right now; `retry_after` = seconds until one may."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"All LLM backends unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class LLMErrorInfo:
+    __slots__ = ("kind", "status", "retry_after", "message")
+
+    def __init__(self, kind: str, status=None, retry_after=None, message: str = ""):
+        self.kind = kind
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE
+
+    @property
+    def outage(self) -> bool:
+        return self.kind in OUTAGE
+
+def parse_retry_after(headers) -> float:
+    """Seconds from retry-after-ms / Retry-After (seconds or HTTP date), None if absent or invalid."""
+    if not headers:
+        return None
+    for header, divisor in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(float(value) / divisor, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            parsed = email.utils.parsedate_tz(value)
+            if parsed is not None:
+                return max(email.utils.mktime_tz(parsed) - time.time(), 0.0)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return None
+
+def classify_error(exc: BaseException) -> LLMErrorInfo:
+    """Map an exception from the OpenAI SDK (or our own layers) to an LLMErrorInfo."""
+    message = str(exc)
+    if isinstance(exc, CircuitOpenError):
+        return LLMErrorInfo("circuit_open", retry_after=exc.retry_after, message=message)
+    if isinstance(exc, TimeoutError): # asyncio.timeout around the attempt: the deadline ran out
+        return LLMErrorInfo("deadline", message=message)
+    if isinstance(exc, openai.APITimeoutError): # Subclass of APIConnectionError, check first
+        return LLMErrorInfo("timeout", message=message)
+    if isinstance(exc, openai.APIConnectionError):
+        return LLMErrorInfo("connection", message=message)
+    if isinstance(exc, openai.APIStatusError):
+        status = exc.status_code
+        retry_after = parse_retry_after(exc.response.headers if exc.response is not None else None)
+        if isinstance(exc, openai.RateLimitError) or status == 429:
+            return LLMErrorInfo("rate_limit", status, retry_after, message)
+        if isinstance(exc, openai.InternalServerError) or status >= 500 or status == 408:
+            return LLMErrorInfo("overloaded", status, retry_after, message)
+        if status == 400 and "response_format" in message:
+            # Provider/model without structured output support names the parameter
+            return LLMErrorInfo("response_format", status, message=message)
+        return LLMErrorInfo("rejected", status, message=message) # Auth, bad request, unknown model...
+    if isinstance(exc, openai.APIError):
+        # Error event inside a 200 stream (OpenRouter reports upstream failures this way)
+        return LLMErrorInfo("provider_error", message=message)
+    return LLMErrorInfo("internal", message=message)
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(max, base * 2^attempt))."""
+    return random.uniform(0, min(Config.LLM_BACKOFF_MAX, Config.LLM_BACKOFF_BASE * (2 ** attempt)))
+
+class RetryPolicy:
+    """
+    Attempts and deadline of one LLM request.
+
+    next_delay() says how long to sleep before the next attempt, or None to give
+    up: the error is not retryable, attempts are used up, or waiting (Retry-After
+    included) would run past the deadline.
+    """
+
+    def __init__(self, feature: str, max_attempts: int = None):
+        self.budget = DEADLINES.get(feature, Config.LLM_DEADLINE_DEFAULT)
+        self.max_attempts = max_attempts or Config.LLM_MAX_ATTEMPTS
+        self.attempt = 0
+        self._deadline = None
+
+    def start(self):
+        """Start the clock (first call only)."""
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.budget
+
+    def remaining(self) -> float:
+        if self._deadline is None:
+            return self.budget
+        return self._deadline - time.monotonic()
+
+    def next_delay(self, error: LLMErrorInfo):
+        self.attempt += 1
+        if not error.retryable or self.attempt >= self.max_attempts:
+            return None
+        delay = backoff_delay(self.attempt - 1)
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        if delay + Config.LLM_MIN_ATTEMPT_SECONDS > self.remaining():
+            return None
+        return delay
+
+class CircuitBreaker:
+    """
+    Per-backend breaker: closed -> open after `failure_threshold` consecutive
+    outage errors; open -> half_open once the cooldown (or a longer Retry-After)
+    has passed; half_open lets one probe through, which closes the breaker on
+    success or re-opens it with a doubled cooldown (up to `max_cooldown`).
+    """
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float, max_cooldown: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_until = 0.0
+        self.probing = False
+        llm_circuit_state.set(0, backend=name)
+
+    def _move(self, state: str):
+        if state != self.state:
+            print(f"DEBUG: LLM circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+            llm_circuit_state.set(self.STATES[state], backend=self.name)
+            llm_circuit_transitions.inc(backend=self.name, state=state)
+
+    def available(self) -> bool:
+        if self.state == "open" and time.monotonic() >= self.opened_until:
+            self._move("half_open")
+        if self.state == "half_open":
+            return not self.probing
+        return self.state == "closed"
+
+    def retry_in(self) -> float:
+        return max(self.opened_until - time.monotonic(), 0.0) if self.state == "open" else 0.0
+
+    def on_launch(self):
+        if self.state == "half_open":
+            self.probing = True
+
+    def record_success(self):
+        self.probing = False
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self._move("closed")
+
+    def record_failure(self, retry_after: float = None):
+        self.probing = False
+        self.failures += 1
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        elif self.failures < self.failure_threshold:
+            return
+        self.opened_until = time.monotonic() + max(self.cooldown, min(retry_after or 0, self.max_cooldown))
+        self._move("open")
+
+    def release(self):
+        """Call ended without a verdict (cancelled, rate limited): free the half-open probe."""
+        self.probing = False
+
+    def stats(self) -> dict:
+        self.available() # Roll open -> half_open if the cooldown is over
+        return {"state": self.state, "failures": self.failures, "retry_in_seconds": round(self.retry_in(), 1)}
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+import httpx
+from openai import AsyncOpenAI
+from app.metrics import llm_backend_calls, llm_hedges
+from app.services.llm_scheduler import llm_scheduler
+from app.services.llm_resilience import CircuitBreaker, CircuitOpenError, classify_error
+
+MODES = ("complete", "stream") # stream latency = time to first token
+ERROR_PENALTY = 4.0 # Score multiplier per unit of error rate (50% errors -> 3x slower)
+ROUTING_EXPONENT = 2 # Share of primary traffic ~ (1/score)^2; a 2x slower backend gets ~20%
+
+class BackendProfile:
+    """Rolling latency samples per mode and success/error outcomes of one backend."""
+
+    def __init__(self, window: int, min_samples: int):
+        self.min_samples = max(1, min_samples)
+        self.latency = {mode: deque(maxlen=window) for mode in MODES}
+        self.errors = deque(maxlen=window) # True = failed call
+        self.in_flight = 0
+
+    def observe(self, mode: str, seconds: float, ok: bool = True):
+        self.latency[mode].append(seconds)
+        self.errors.append(not ok)
+
+    def observe_slow(self, mode: str, seconds: float):
+        # Lost a hedge race: the real latency is at least `seconds`, keep it as a lower bound
+        self.latency[mode].append(seconds)
+
+    def record_error(self):
+        self.errors.append(True)
+
+    def quantile(self, mode: str, q: float):
+        """Latency quantile in seconds, None until min_samples are in."""
+        samples = self.latency[mode]
+        if len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.errors) / len(self.errors) if self.errors else 0.0
+
+class LLMBackend:
+    """One OpenAI-compatible endpoint + model (OpenRouter, Google AI Studio, a local server...)."""
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str, weight: float,
+                 profile: BackendProfile, breaker: CircuitBreaker, timeout: httpx.Timeout):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.weight = max(weight, 0.001) # Static preference; < 1 keeps a backend mostly as hedge/failover
+        self.profile = profile
+        self.breaker = breaker
+        # Retries are ours (GeminiClient + RetryPolicy), not the SDK's
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+
+def load_backends(raw: str, default: dict, window: int, min_samples: int, breaker: dict, timeout: httpx.Timeout) -> list:
+    """
+    Build backends from LLM_BACKENDS (JSON list), falling back to `default`.
+
+    Each entry: {"name", "model", "base_url"?, "api_key"? or "api_key_env"?, "weight"?}.
+    Missing base_url/api key mean OpenRouter (default's). Entries without a key are skipped.
+    `breaker` holds the CircuitBreaker settings every backend gets its own breaker with.
+    """
+    entries = [default]
+    if raw:
+        try:
+            entries = json.loads(raw)
+        except ValueError as e:
+            print(f"Warning: LLM_BACKENDS is not valid JSON, using {default['name']} only: {e}")
+    backends = []
+    for entry in entries:
+        api_key = entry.get("api_key") or (os.getenv(entry["api_key_env"]) if entry.get("api_key_env") else default["api_key"])
+        name = entry.get("name") or entry["model"]
+        if not api_key:
+            print(f"Warning: LLM backend {name} has no API key, skipped")
+            continue
+        backends.append(LLMBackend(
+            name=name,
+            base_url=entry.get("base_url") or default["base_url"],
+            api_key=api_key,
+            model=entry["model"],
+            weight=float(entry.get("weight", 1.0)),
+            profile=BackendProfile(window, min_samples),
+            breaker=CircuitBreaker(name, **breaker),
+            timeout=timeout,
+        ))
+    return backends
+
+class LLMRouter:
+    """
+    Latency-aware routing with hedged requests across LLM backends.
+
+    - The primary is drawn at random with probability ~ (weight / score)^2, where
+      score is the backend's median latency inflated by its recent error rate, so
+      traffic drifts towards whatever is fastest right now while slower backends
+      keep getting enough calls to notice when they recover.
+    - If the primary has not answered (stream: first token) by its observed p90,
+      one hedged request goes to the next-best backend; the first answer wins and
+      the other call is cancelled. Hedges are capped at max_hedge_ratio of recent
+      calls so a slowdown everywhere does not double the load, and each hedge
+      takes its own scheduler slot (skipped if none is free), so upstream
+      concurrency stays within LLM_MAX_CONCURRENCY.
+    - A primary that fails outright fails over to the next backend immediately.
+    - Backends whose circuit breaker is open are left out; with none left the
+      call fails fast with CircuitOpenError.
+    """
+
+    def __init__(self, backends: list, hedge: bool, hedge_quantile: float, min_delay: float,
+                 default_delay: dict, max_hedge_ratio: float, window: int):
+        self.backends = backends
+        self.hedge = hedge and len(backends) > 1
+        self.hedge_quantile = hedge_quantile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self._recent_hedges = deque(maxlen=window)
+
+    @property
+    def primary(self):
+        return self.backends[0] if self.backends else None
+
+    def score(self, backend: LLMBackend, mode: str) -> float:
+        median = backend.profile.quantile(mode, 0.5)
+        expected = median if median is not None else self.default_delay[mode] / 2 # Untested: assume average
+        return expected * (1 + ERROR_PENALTY * backend.profile.error_rate) / backend.weight
+
+    def weights(self, mode: str) -> dict:
+        """Probability of each backend being picked as primary."""
+        raw = {b.name: (1 / max(self.score(b, mode), 1e-3)) ** ROUTING_EXPONENT for b in self.backends}
+        total = sum(raw.values()) or 1.0
+        return {name: w / total for name, w in raw.items()}
+
+    def plan(self, mode: str) -> list:
+        """Available backends in the order they will be tried: sampled primary, then best score first."""
+        candidates = [b for b in self.backends if b.breaker.available()]
+        if not candidates:
+            raise CircuitOpenError(min((b.breaker.retry_in() for b in self.backends), default=0.0))
+        if len(candidates) < 2:
+            return candidates
+        weights = self.weights(mode)
+        primary = random.choices(candidates, weights=[weights[b.name] for b in candidates])[0]
+        rest = sorted((b for b in candidates if b is not primary), key=lambda b: self.score(b, mode))
+        return [primary] + rest
+
+    def retry_after(self) -> float:
+        """0 if some backend takes calls, else seconds until a breaker lets a probe through."""
+        if any(b.breaker.available() for b in self.backends) or not self.backends:
+            return 0.0
+        return min(b.breaker.retry_in() for b in self.backends)
+
+    def hedge_delay(self, backend: LLMBackend, mode: str) -> float:
+        observed = backend.profile.quantile(mode, self.hedge_quantile)
+        return max(self.min_delay, observed) if observed is not None else self.default_delay[mode]
+
+    def _hedge_allowed(self) -> bool:
+        if not self._recent_hedges:
+            return True
+        return sum(self._recent_hedges) / len(self._recent_hedges) < self.max_hedge_ratio
+
+    async def race(self, mode: str, call, discard=None):
+        """
+        Run `await call(backend)` on the planned backends as described above and
+        return (result, backend) of the first success. `discard(result)` is awaited
+        for a success that lost the race (e.g. to close a second open stream).
+        If every backend fails, the primary's exception is raised.
+        """
+        if not self.backends:
+            raise RuntimeError("No LLM backend configured")
+        order = self.plan(mode)
+        spare = order[1:]
+        running = {} # task -> (backend, started)
+        errors = []
+        hedged = checked = False # checked: the hedge point has passed (fired or over budget)
+
+        def launch(backend, extra_slot: bool = False):
+            backend.breaker.on_launch()
+            backend.profile.in_flight += 1
+            task = asyncio.create_task(call(backend))
+            if extra_slot:
+                task.add_done_callback(lambda t: llm_scheduler.release())
+            running[task] = (backend, time.monotonic())
+
+        def next_spare():
+            # A spare's breaker may have opened (or its probe been taken) since plan()
+            while spare:
+                backend = spare.pop(0)
+                if backend.breaker.available():
+                    return backend
+            return None
+
+        launch(order[0])
+        delay = self.hedge_delay(order[0], mode)
+        try:
+            while running:
+                can_hedge = self.hedge and spare and not checked
+                done, _ = await asyncio.wait(running, timeout=delay if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is past its p90: hedge once (if the budget allows)
+                    checked = True
+                    if not self._hedge_allowed():
+                        llm_hedges.inc(outcome="skipped_budget")
+                    elif not llm_scheduler.try_acquire():
+                        llm_hedges.inc(outcome="skipped_capacity")
+                    else:
+                        backup = next_spare()
+                        if backup is not None:
+                            hedged = True
+                            print(f"DEBUG: LLM {order[0].name} slower than {delay:.1f}s, hedging to {backup.name}")
+                            llm_hedges.inc(outcome="fired")
+                            launch(backup, extra_slot=True)
+                        else:
+                            llm_scheduler.release()
+                    continue
+
+                for task in done:
+                    backend, started = running.pop(task)
+                    backend.profile.in_flight -= 1
+                    elapsed = time.monotonic() - started
+                    if task.exception() is not None:
+                        error = classify_error(task.exception())
+                        if error.outage:
+                            backend.breaker.record_failure(error.retry_after)
+                        else:
+                            backend.breaker.release() # Rate limited or rejected: the backend itself is up
+                        backend.profile.observe(mode, elapsed, ok=False)
+                        llm_backend_calls.inc(backend=backend.name, mode=mode, outcome="error")
+                        errors.append(task.exception())
+                        continue
+                    backend.breaker.record_success()
+                    backend.profile.observe(mode, elapsed)
+                    llm_backend_calls.inc(backend=backend.name, mode=mode, outcome="ok")
+                    for other in done - {task}: # Both finished in the same tick
+                        if other not in running: # Already handled above (failed)
+                            continue
+                        other_backend, _ = running.pop(other)
+                        other_backend.profile.in_flight -= 1
+                        other_backend.breaker.release()
+                        if other.exception() is None and discard is not None:
+                            await discard(other.result())
+                    if len(order) > 1:
+                        self._recent_hedges.append(hedged)
+                        if hedged:
+                            llm_hedges.inc(outcome="primary_won" if backend is order[0] else "hedge_won")
+                    return task.result(), backend
+
+                backup = next_spare() if not running else None
+                if backup is not None:
+                    # Everything launched so far failed: fail over without waiting
+                    print(f"DEBUG: LLM backend failed ({str(errors[-1])[:100]}), failing over to {backup.name}")
+                    llm_hedges.inc(outcome="failover")
+                    launch(backup)
+                    delay = self.hedge_delay(order[0], mode)
+            raise errors[0]
+        finally:
+            # Cancel the loser (or everything, if our caller was cancelled)
+            for task, (backend, started) in running.items():
+                task.cancel()
+                backend.breaker.release()
+                backend.profile.in_flight -= 1
+                backend.profile.observe_slow(mode, time.monotonic() - started)
+                llm_backend_calls.inc(backend=backend.name, mode=mode, outcome="cancelled")
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    def stats(self) -> list:
+        weights = {mode: self.weights(mode) for mode in MODES}
+        return [{
+            "name": b.name,
+            "model": b.model,
+            "base_url": b.base_url,
+            "weight": b.weight,
+            "in_flight": b.profile.in_flight,
+            "error_rate": round(b.profile.error_rate, 4),
+            "circuit": b.breaker.stats(),
+            "samples": {mode: len(b.profile.latency[mode]) for mode in MODES},
+            "p50_seconds": {mode: b.profile.quantile(mode, 0.5) for mode in MODES},
+            "hedge_delay_seconds": {mode: round(self.hedge_delay(b, mode), 3) for mode in MODES},
+            "routing_share": {mode: round(weights[mode][b.name], 4) for mode in MODES},
+        } for b in self.backends]
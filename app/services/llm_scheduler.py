@@ -0,0 +1,210 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from app.config import Config
+from app.metrics import stage_timer, stage_duration
+
+# Lower lane number = served first
+PLAN_LANES = {
+    "premium": 0,
+    "school": 0,
+    "yearly": 0,
+    "pro": 1,
+    "monthly": 1,
+    "standard": 1,
+    "free": 2,
+}
+DEFAULT_LANE = 2
+LANE_COUNT = 3
+
+class _Waiter:
+    __slots__ = ("future", "user_id", "lane", "enqueued_at")
+
+    def __init__(self, future, user_id, lane):
+        self.future = future
+        self.user_id = user_id
+        self.lane = lane
+        self.enqueued_at = time.monotonic()
+
+class LLMScheduler:
+    """
+    Admission control in front of the LLM provider.
+
+    - A global cap on in-flight calls (LLM_MAX_CONCURRENCY) keeps us under the
+      provider's rate limits instead of collecting 429s.
+    - Waiters are grouped into plan lanes (premium/school, then paid, then free).
+    - Inside a lane, users are served round-robin so one account with many
+      parallel requests cannot starve everyone else.
+    - Waiters age up one lane every LLM_AGING_SECONDS so free users still progress
+      under sustained paid load.
+    """
+
+    def __init__(self, max_inflight: int, aging_seconds: float):
+        self.max_inflight = max(1, max_inflight)
+        self.aging_seconds = aging_seconds
+        self.in_flight = 0
+        # lane -> OrderedDict(user_id -> deque[_Waiter]); dict order is the round-robin order
+        self._lanes = [OrderedDict() for _ in range(LANE_COUNT)]
+        self._waiting = 0
+        self._avg_service = 20.0 # Seconds, EWMA of slot hold time
+        self.admitted = 0
+        self.queued = 0
+
+    @staticmethod
+    def lane_for(plan_type: str) -> int:
+        return PLAN_LANES.get(plan_type or "free", DEFAULT_LANE)
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    # --- Queue internals ---
+
+    def _enqueue(self, waiter: _Waiter):
+        lane = self._lanes[waiter.lane]
+        if waiter.user_id not in lane:
+            lane[waiter.user_id] = deque()
+        lane[waiter.user_id].append(waiter)
+        self._waiting += 1
+
+    def _remove(self, waiter: _Waiter):
+        lane = self._lanes[waiter.lane]
+        queue = lane.get(waiter.user_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+            self._waiting -= 1
+        except ValueError:
+            return
+        if not queue:
+            del lane[waiter.user_id]
+
+    def _pick_lane(self):
+        now = time.monotonic()
+        best_lane, best_rank = None, None
+        for idx, lane in enumerate(self._lanes):
+            if not lane:
+                continue
+            head_queue = next(iter(lane.values()))
+            waited = now - head_queue[0].enqueued_at
+            boost = int(waited // self.aging_seconds) if self.aging_seconds > 0 else 0
+            rank = (idx - boost, idx)
+            if best_rank is None or rank < best_rank:
+                best_lane, best_rank = idx, rank
+        return best_lane
+
+    def _dispatch(self):
+        while self.in_flight < self.max_inflight and self._waiting:
+            lane_idx = self._pick_lane()
+            lane = self._lanes[lane_idx]
+            user_id, queue = next(iter(lane.items()))
+            waiter = queue.popleft()
+            self._waiting -= 1
+            # Rotate this user to the back of the lane (round-robin between users)
+            del lane[user_id]
+            if queue:
+                lane[user_id] = queue
+            if waiter.future.done():
+                continue
+            self.in_flight += 1
+            waiter.future.set_result(True)
+
+    # --- Public API ---
+
+    async def acquire(self, user_id=None, plan_type: str = "free"):
+        if self.in_flight < self.max_inflight and not self._waiting:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), user_id, self.lane_for(plan_type))
+        self._enqueue(waiter)
+        self.queued += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just before cancellation; hand it on
+                self.release()
+            else:
+                self._remove(waiter)
+            raise
+        self.admitted += 1
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now and nobody is queued (hedged requests)."""
+        if self.in_flight < self.max_inflight and not self._waiting:
+            self.in_flight += 1
+            return True
+        return False
+
+    def release(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id=None, plan_type: str = "free"):
+        """Hold one LLM slot for the duration of the block."""
+        with stage_timer("llm_queue_wait"):
+            await self.acquire(user_id, plan_type)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            self._avg_service = 0.8 * self._avg_service + 0.2 * held
+            stage_duration.observe(held, stage="llm_call")
+            self.release()
+
+    def position(self, user_id, plan_type: str = "free") -> int:
+        """
+        Approximate 1-based queue position of the user's oldest waiting request
+        (0 if the user has nothing queued).
+        """
+        lane_idx = self.lane_for(plan_type)
+        lane = self._lanes[lane_idx]
+        if user_id not in lane:
+            return 0
+        ahead = sum(len(q) for l in self._lanes[:lane_idx] for q in l.values())
+        # Users ahead in the rotation are each served once before us
+        for other_id in lane:
+            if other_id == user_id:
+                break
+            ahead += 1
+        return ahead + 1
+
+    def estimate(self, user_id=None, plan_type: str = "free") -> dict:
+        """Queue position and ETA for the user, or for a new arrival if nothing is queued."""
+        position = self.position(user_id, plan_type) if user_id is not None else 0
+        if not position:
+            lane_idx = self.lane_for(plan_type)
+            ahead = sum(len(q) for l in self._lanes[:lane_idx + 1] for q in l.values())
+            position = ahead + 1 if (ahead or self.in_flight >= self.max_inflight) else 0
+        eta = 0.0
+        if position:
+            eta = (position / self.max_inflight) * self._avg_service
+        return {
+            "position": position,
+            "eta_seconds": round(eta, 1),
+            "in_flight": self.in_flight,
+            "capacity": self.max_inflight,
+            "waiting": self._waiting,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "capacity": self.max_inflight,
+            "waiting": self._waiting,
+            "waiting_by_lane": [sum(len(q) for q in lane.values()) for lane in self._lanes],
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "avg_service_seconds": round(self._avg_service, 2),
+        }
+
+llm_scheduler = LLMScheduler(
+    max_inflight=Config.LLM_MAX_CONCURRENCY,
+    aging_seconds=Config.LLM_AGING_SECONDS
+)
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+from datetime import timedelta
+from sqlalchemy import case, func, insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import Config
+from app.utils.time_utils import get_jakarta_time
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4 # Rough average for Indonesian/English text
+GROUP_COLUMNS = ("plan", "feature", "model", "user", "status", "day")
+STRING_WIDTHS = {"plan_type": 16, "feature": 16, "model": 64} # Column widths of LLMUsage
+
+def estimate_tokens(chars: int) -> int:
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def usage_cost(prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> float:
+    """USD for one call at the configured LLM_PRICE_* (cached prompt tokens at the cached rate)."""
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (
+        uncached * Config.LLM_PRICE_INPUT_PER_M
+        + cached_tokens * Config.LLM_PRICE_CACHED_PER_M
+        + completion_tokens * Config.LLM_PRICE_OUTPUT_PER_M
+    ) / 1_000_000
+
+class LLMUsageRecorder:
+    """
+    Buffers one row per LLM call and writes them to llm_usage in batches.
+
+    record() never touches the database, so the LLM path pays only a dict
+    append. A background task flushes every LLM_USAGE_FLUSH_SECONDS, or sooner
+    once LLM_USAGE_BATCH_SIZE rows are waiting, with a single multi-row INSERT.
+    If the write fails the rows go back into the buffer (bounded by max_buffer;
+    the oldest are dropped first) and are retried on the next flush. A batch
+    rejected for its data (IntegrityError/DataError, e.g. a deleted user) is
+    retried row by row instead, and only the offending rows are dropped.
+    """
+
+    def __init__(self, flush_seconds: float, batch_size: int, max_buffer: int):
+        self.flush_seconds = flush_seconds
+        self.batch_size = max(1, batch_size)
+        self.max_buffer = max(self.batch_size, max_buffer)
+        self._buffer = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, **row):
+        for field, width in STRING_WIDTHS.items():
+            if row.get(field) and len(row[field]) > width:
+                row[field] = row[field][:width]
+        row["cost_usd"] = usage_cost(row["prompt_tokens"], row["completion_tokens"], row["cached_tokens"])
+        row["created_at"] = get_jakarta_time()
+        self._buffer.append(row)
+        if len(self._buffer) > self.max_buffer:
+            overflow = len(self._buffer) - self.max_buffer
+            del self._buffer[:overflow]
+            self.dropped += overflow
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of rows written."""
+        from app.database import engine
+        from app.models.rpp_data import LLMUsage
+
+        async with self._flush_lock:
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(insert(LLMUsage), rows)
+                written = len(rows)
+            except (IntegrityError, DataError) as e:
+                # Retrying the same batch would fail forever; find the bad rows instead
+                logger.warning(f"LLM usage batch rejected, inserting {len(rows)} rows one by one: {e}")
+                written = await self._insert_each(engine, LLMUsage, rows)
+            except Exception:
+                self._buffer[:0] = rows # Keep order; record() trims the front if we stay down
+                raise
+            self.written += written
+            return written
+
+    async def _insert_each(self, engine, table, rows: list) -> int:
+        written = 0
+        for idx, row in enumerate(rows):
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(insert(table), [row])
+                written += 1
+            except (IntegrityError, DataError) as e:
+                self.dropped += 1
+                logger.warning(f"LLM usage row dropped (feature={row.get('feature')}, user_id={row.get('user_id')}): {e}")
+            except Exception:
+                self._buffer[:0] = rows[idx:] # Database went away mid-way; retry the rest later
+                self.written += written
+                raise
+        return written
+
+    async def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"LLM usage final flush failed, {len(self._buffer)} rows lost: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"LLM usage flush failed ({len(self._buffer)} rows buffered): {e}")
+
+    def stats(self) -> dict:
+        return {"buffered": len(self._buffer), "written": self.written, "dropped": self.dropped}
+
+    @staticmethod
+    async def summarize(db: AsyncSession, days: int, group_by: list) -> dict:
+        """
+        Token, cost and throughput totals over the last `days`, grouped by any of
+        GROUP_COLUMNS. tokens_per_sec is completion tokens over slot time of the
+        calls that produced output (ok/abandoned); failed counts error/empty.
+        """
+        from app.models.rpp_data import LLMUsage
+
+        columns = {
+            "plan": func.coalesce(LLMUsage.plan_type, "none"),
+            "feature": LLMUsage.feature,
+            "model": LLMUsage.model,
+            "user": LLMUsage.user_id,
+            "status": LLMUsage.status,
+            "day": func.date(LLMUsage.created_at),
+        }
+        since = get_jakarta_time() - timedelta(days=days)
+        keys = [columns[name].label(name) for name in group_by]
+        finished = LLMUsage.status.in_(("ok", "abandoned")) # abandoned = caller stopped reading, output was fine
+        stmt = (
+            select(
+                *keys,
+                func.count(LLMUsage.id).label("calls"),
+                func.sum(case((finished, 0), else_=1)).label("failed"),
+                func.sum(LLMUsage.retries).label("retries"),
+                func.sum(LLMUsage.prompt_tokens).label("prompt_tokens"),
+                func.sum(LLMUsage.cached_tokens).label("cached_tokens"),
+                func.sum(LLMUsage.completion_tokens).label("completion_tokens"),
+                func.sum(case((LLMUsage.usage_estimated, 1), else_=0)).label("estimated"),
+                func.sum(LLMUsage.cost_usd).label("cost_usd"),
+                func.sum(LLMUsage.latency_ms).label("latency_ms"),
+                func.sum(case((finished, LLMUsage.completion_tokens), else_=0)).label("ok_completion_tokens"),
+                func.sum(case((finished, LLMUsage.latency_ms), else_=0)).label("ok_latency_ms"),
+            )
+            .where(LLMUsage.created_at >= since)
+        )
+        if keys:
+            stmt = stmt.group_by(*keys).order_by(func.sum(LLMUsage.cost_usd).desc())
+
+        rows = []
+        for r in (await db.execute(stmt)).mappings().all():
+            calls = r["calls"] or 0
+            if not calls:
+                continue
+            ok_seconds = (r["ok_latency_ms"] or 0) / 1000
+            row = {name: (str(r[name]) if name == "day" else r[name]) for name in group_by}
+            row.update({
+                "calls": calls,
+                "failed": r["failed"] or 0,
+                "retries": r["retries"] or 0,
+                "prompt_tokens": r["prompt_tokens"] or 0,
+                "cached_tokens": r["cached_tokens"] or 0,
+                "completion_tokens": r["completion_tokens"] or 0,
+                "estimated_calls": r["estimated"] or 0,
+                "cost_usd": round(r["cost_usd"] or 0, 6),
+                "cost_per_call_usd": round((r["cost_usd"] or 0) / calls, 6),
+                "avg_latency_ms": round((r["latency_ms"] or 0) / calls),
+                "tokens_per_sec": round((r["ok_completion_tokens"] or 0) / ok_seconds, 1) if ok_seconds else 0.0,
+            })
+            rows.append(row)
+        return {"since": since.isoformat(), "days": days, "group_by": group_by, "rows": rows}
+
+llm_usage_recorder = LLMUsageRecorder(
+    flush_seconds=Config.LLM_USAGE_FLUSH_SECONDS,
+    batch_size=Config.LLM_USAGE_BATCH_SIZE,
+    max_buffer=Config.LLM_USAGE_MAX_BUFFER
+)
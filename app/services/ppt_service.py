@@ -5,9 +5,95 @@ from pptx.util import Inches, Pt
 from pptx.dml.color import RGBColor
 import copy
 import os
+import re
+import threading
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from app.services.render_executor import render_executor
+from app.services.artifact_cache import artifact_cache
+
+TEMPLATE_DIR = "app/templates"
+PLACEHOLDER_RE = re.compile(r'\{\{\w+\}\}')
+
+class PPTTemplate:
+    """
+    One theme held in memory: the raw .pptx bytes plus, for every slide, a map of
+    placeholder ("{{konten}}") -> shape paths. A path is the index chain through
+    slide.shapes and nested group shapes, so a fresh copy can jump straight to it.
+    """
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.data = data
+        self.slide_maps = [self._index_shapes(slide.shapes) for slide in Presentation(BytesIO(data)).slides]
+
+    @classmethod
+    def _index_shapes(cls, shapes, prefix=(), index=None) -> dict:
+        index = {} if index is None else index
+        for i, shape in enumerate(shapes):
+            path = prefix + (i,)
+            if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+                cls._index_shapes(shape.shapes, path, index)
+                continue
+            if not shape.has_text_frame:
+                continue
+            for p in shape.text_frame.paragraphs:
+                for placeholder in PLACEHOLDER_RE.findall("".join(r.text for r in p.runs)):
+                    paths = index.setdefault(placeholder, [])
+                    if path not in paths:
+                        paths.append(path)
+        return index
+
+    def open(self):
+        """A fresh, independent Presentation parsed from the in-memory bytes."""
+        return Presentation(BytesIO(self.data))
+
+class PPTTemplateRegistry:
+    """
+    Loads every theme under TEMPLATE_DIR once (at startup via preload(), or lazily on
+    first use inside render worker processes) so requests never touch the disk.
+    """
+    FALLBACK_THEMES = ["Ceria", "Formal"]
+
+    def __init__(self, template_dir: str):
+        self.template_dir = template_dir
+        self._templates = None
+        self._lock = threading.Lock()
+
+    def preload(self):
+        with self._lock:
+            if self._templates is not None:
+                return self._templates
+            templates = {}
+            for filename in sorted(os.listdir(self.template_dir)):
+                name, ext = os.path.splitext(filename)
+                if ext.lower() != ".pptx":
+                    continue
+                with open(os.path.join(self.template_dir, filename), "rb") as f:
+                    templates[name] = PPTTemplate(name, f.read())
+            print(f"DEBUG: Loaded PPT templates: {', '.join(templates) or '-'}")
+            self._templates = templates
+            return templates
+
+    def get(self, theme_name: str) -> PPTTemplate:
+        templates = self._templates if self._templates is not None else self.preload()
+        if theme_name in templates:
+            return templates[theme_name]
+        for fallback in self.FALLBACK_THEMES:
+            if fallback in templates:
+                print(f"Template {theme_name} not found, using {fallback}")
+                return templates[fallback]
+        if not templates:
+            raise FileNotFoundError(f"No .pptx templates found in {self.template_dir}")
+        name = next(iter(templates))
+        print(f"Template {theme_name} not found, using {name}")
+        return templates[name]
+
+ppt_templates = PPTTemplateRegistry(TEMPLATE_DIR)
 
 class PPTService:
-    TEMPLATE_DIR = "app/templates"
+    TEMPLATE_DIR = TEMPLATE_DIR
+    # Bump whenever build_ppt output changes so cached decks are not reused
+    RENDERER_VERSION = "1"
 
     @staticmethod
     def _replace_text_in_shape(shape, replacements):
@@ -74,23 +160,37 @@ class PPTService:
     
     @classmethod
     async def generate_ppt(cls, json_data: dict) -> BytesIO:
+        ppt_bytes, _ = await cls.render_ppt(json_data)
+        return BytesIO(ppt_bytes)
+
+    @classmethod
+    def cache_key(cls, json_data: dict) -> str:
+        return artifact_cache.make_key("pptx", cls.RENDERER_VERSION, json_data)
+
+    @classmethod
+    async def render_ppt(cls, json_data: dict):
+        """Return (pptx bytes, etag), building on the render pool only on a cache miss."""
+        key = cls.cache_key(json_data)
+        # python-pptx work is CPU heavy, build it on the render pool
+        ppt_bytes = await artifact_cache.get_or_render(
+            key, lambda: render_executor.run(cls.build_ppt, json_data)
+        )
+        return ppt_bytes, key
+
+    @classmethod
+    def build_ppt(cls, json_data: dict) -> bytes:
         theme_name = json_data.get("theme", "Ceria")
-        template_filename = f"{theme_name}.pptx"
-        template_path = os.path.join(cls.TEMPLATE_DIR, template_filename)
         
-        # Fallback to Ceria if specific theme not found
-        if not os.path.exists(template_path):
-            print(f"Template {theme_name} not found, using Ceria")
-            template_path = os.path.join(cls.TEMPLATE_DIR, "Ceria.pptx")
-            
-        print(f"DEBUG: Loading template from {template_path}")
-        prs = Presentation(template_path)
+        # In-memory template (falls back to Ceria/Formal if the theme does not exist)
+        template = ppt_templates.get(theme_name)
+        print(f"DEBUG: Using template {template.name}")
+        prs = template.open()
         
         # --- SLIDE 1: TITLE (Index 0) ---
         if len(prs.slides) > 0:
             title_slide = prs.slides[0]
             shape_map_title = {}
-            cls._replace_text_in_shape_recursive(title_slide, {
+            cls._replace_placeholders(title_slide, template.slide_maps[0], {
                 "{{judul_materi}}": json_data.get("judul_materi", ""),
                 "{{theme}}": json_data.get("theme", "")
             }, shape_map=shape_map_title)
@@ -137,7 +237,7 @@ class PPTService:
                 shape_map = {}
                 slide_content = "\n".join([f"• {x}" for x in slide_data.get("konten", [])])
                 
-                cls._replace_text_in_shape_recursive(target_slide, {
+                cls._replace_placeholders(target_slide, template.slide_maps[idx + 1], {
                     "{{judul_slide}}": slide_data.get("judul_slide", ""),
                     "{{konten}}": slide_content
                 }, shape_map=shape_map)
@@ -213,14 +313,26 @@ class PPTService:
 
         ppt_output = BytesIO()
         prs.save(ppt_output)
-        ppt_output.seek(0)
-        return ppt_output
+        return ppt_output.getvalue()
+
+    @classmethod
+    def _replace_placeholders(cls, slide, slide_map, replacements, shape_map=None):
+        """Replace placeholders using the template's precomputed shape paths (no tree walk)."""
+        done = set()
+        for placeholder in replacements:
+            for path in slide_map.get(placeholder, []):
+                if path in done:
+                    continue
+                done.add(path)
+                shape = slide.shapes[path[0]]
+                for i in path[1:]:
+                    shape = shape.shapes[i]
+                cls._replace_text_in_text_shape(shape, replacements, shape_map)
 
     @staticmethod
     def _replace_text_in_shape_recursive(slide_or_group, replacements, shape_map=None):
         # Handle both Slide and Group objects which have .shapes to iterate
         shapes = slide_or_group.shapes
-        from pptx.enum.shapes import MSO_SHAPE_TYPE
 
         for shape in shapes:
             # 1. Check if it's a Group -> Recurse
@@ -229,53 +341,57 @@ class PPTService:
                 continue
             
             # 2. Check if it has text frame
-            if shape.has_text_frame:
-                # Iterate paragraphs
-                for p in shape.text_frame.paragraphs:
-                    full_text = "".join(r.text for r in p.runs)
-                    if not full_text.strip():
-                        continue
+            PPTService._replace_text_in_text_shape(shape, replacements, shape_map)
 
-                    original = full_text
-                    modified = False
-                    
-                    for k, v in replacements.items():
-                        if k in full_text:
-                            full_text = full_text.replace(k, str(v))
-                            modified = True
-                            # Track matched shape
-                            if shape_map is not None:
-                                shape_map[k] = shape
-                            
-                    if modified:
-                        # Capture style from the FIRST run
-                        first_run_font_size = None
-                        first_run_font_color = None
-                        first_run_bold = None
-                        
-                        if p.runs:
-                            r0 = p.runs[0]
-                            first_run_font_size = r0.font.size
-                            first_run_bold = r0.font.bold
-                            try:
-                                first_run_color = r0.font.color.rgb
-                            except:
-                                first_run_color = None
+    @staticmethod
+    def _replace_text_in_text_shape(shape, replacements, shape_map=None):
+        if shape.has_text_frame:
+            # Iterate paragraphs
+            for p in shape.text_frame.paragraphs:
+                full_text = "".join(r.text for r in p.runs)
+                if not full_text.strip():
+                    continue
 
-                        # CRITICAL FIX: Clear ALL runs in the paragraph to prevent overlapping/appending
-                        p.clear() 
-                        
-                        # Add new run with the FULL replaced text
-                        new_run = p.add_run()
-                        new_run.text = full_text
+                original = full_text
+                modified = False
+                
+                for k, v in replacements.items():
+                    if k in full_text:
+                        full_text = full_text.replace(k, str(v))
+                        modified = True
+                        # Track matched shape
+                        if shape_map is not None:
+                            shape_map[k] = shape
                         
-                        # Restore style
-                        if first_run_font_size:
-                            new_run.font.size = first_run_font_size
-                        if first_run_font_color:
-                            new_run.font.color.rgb = first_run_color
-                        if first_run_bold is not None:
-                            new_run.font.bold = first_run_bold
+                if modified:
+                    # Capture style from the FIRST run
+                    first_run_font_size = None
+                    first_run_font_color = None
+                    first_run_bold = None
+                    
+                    if p.runs:
+                        r0 = p.runs[0]
+                        first_run_font_size = r0.font.size
+                        first_run_bold = r0.font.bold
+                        try:
+                            first_run_color = r0.font.color.rgb
+                        except:
+                            first_run_color = None
+
+                    # CRITICAL FIX: Clear ALL runs in the paragraph to prevent overlapping/appending
+                    p.clear() 
+                    
+                    # Add new run with the FULL replaced text
+                    new_run = p.add_run()
+                    new_run.text = full_text
+                    
+                    # Restore style
+                    if first_run_font_size:
+                        new_run.font.size = first_run_font_size
+                    if first_run_font_color:
+                        new_run.font.color.rgb = first_run_color
+                    if first_run_bold is not None:
+                        new_run.font.bold = first_run_bold
 
     @staticmethod
     def _duplicate_slide_native(prs, source_slide):
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import re
+from contextlib import aclosing
+from typing import List, Optional, Tuple
+from pydantic import ValidationError
+from app.config import Config
+from app.gemini_client import gemini_client, GeminiStreamError, json_response_format
+from app.prompts.quiz_prompt import build_quiz_prompt
+from app.schemas.quiz_schema import QuizQuestion, QUIZ_JSON_SCHEMA
+from app.utils.json_stream import JSONStreamParser
+
+WHITESPACE_RE = re.compile(r'\s+')
+TITLE_RE = re.compile(r'"judul_kuis"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+class QuizGenerationError(Exception):
+    """Raised when not a single valid question could be generated."""
+
+def _normalize(text: str) -> str:
+    return WHITESPACE_RE.sub(" ", text).strip().lower().rstrip("?.!")
+
+class QuizService:
+    """
+    Multiple-choice quiz generation split into chunks of QUIZ_CHUNK_SIZE questions.
+
+    Chunks run concurrently (at most QUIZ_MAX_PARALLEL per quiz; the LLM scheduler
+    still applies its global cap and per-user fairness), so 20 questions take about
+    as long as 5. Every question is validated on its own; a chunk that comes back
+    short or malformed is re-asked only for the missing questions, up to
+    QUIZ_CHUNK_RETRIES times. Merged questions are de-duplicated by normalized text
+    and renumbered.
+
+    Chunks are requested in JSON mode and streamed: each question is validated as
+    soon as its object closes, and a chunk stops reading once it has enough.
+    """
+
+    @staticmethod
+    def plan_chunks(total: int, chunk_size: int) -> List[int]:
+        """20 by 5 -> [5, 5, 5, 5]; 7 by 5 -> [4, 3] (balanced, never a chunk of 1 next to a full one)."""
+        if total <= 0:
+            return []
+        parts = -(-total // max(1, chunk_size))
+        base, extra = divmod(total, parts)
+        return [base + (1 if i < extra else 0) for i in range(parts)]
+
+    @staticmethod
+    def _partial_title(text: str) -> Optional[str]:
+        """judul_kuis from a possibly unfinished response (it comes before the questions)."""
+        match = TITLE_RE.search(text)
+        if not match:
+            return None
+        try:
+            return json.loads(f'"{match.group(1)}"')
+        except ValueError:
+            return None
+
+    @classmethod
+    async def _generate_chunk(
+        cls,
+        semaphore: asyncio.Semaphore,
+        rpp_content: str,
+        count: int,
+        tingkat_kesulitan: str,
+        with_explanation: bool,
+        start_no: int,
+        part: int,
+        total_parts: int,
+        user_id,
+        plan_type: str,
+        retries: int,
+        avoid: List[str] = None
+    ) -> Tuple[Optional[str], List[QuizQuestion], Optional[str]]:
+        """
+        Returns (title, questions, last_error). Only the missing questions are re-asked;
+        questions in `avoid` (already generated elsewhere) are neither requested nor kept.
+        """
+        avoid = list(avoid or [])
+        title = None
+        questions = []
+        seen = {_normalize(q) for q in avoid}
+        last_error = None
+
+        for attempt in range(retries + 1):
+            missing = count - len(questions)
+            if missing <= 0:
+                break
+            prompt = build_quiz_prompt(
+                rpp_content, missing, tingkat_kesulitan, with_explanation,
+                start_no=start_no + len(questions),
+                part=part, total_parts=total_parts,
+                avoid_questions=avoid + [q.pertanyaan for q in questions]
+            )
+            parser = JSONStreamParser("questions")
+            added = 0
+            try:
+                async with semaphore:
+                    stream = gemini_client.stream_json(
+                        prompt, parser, user_id=user_id, plan_type=plan_type, feature="quiz",
+                        response_format=json_response_format("quiz", QUIZ_JSON_SCHEMA)
+                    )
+                    async with aclosing(stream) as items:
+                        async for item in items:
+                            try:
+                                q = QuizQuestion.model_validate(item)
+                            except ValidationError:
+                                continue
+                            key = _normalize(q.pertanyaan)
+                            if key in seen:
+                                continue
+                            seen.add(key)
+                            questions.append(q)
+                            added += 1
+                            if len(questions) == count:
+                                break # Enough; stop reading the stream
+            except GeminiStreamError as e:
+                last_error = str(e)
+                print(f"DEBUG: Quiz chunk {part}/{total_parts} failed (attempt {attempt + 1}): {last_error[:100]}")
+                continue
+            except ValueError as e:
+                # Broken JSON: keep the questions that closed before it
+                print(f"DEBUG: Quiz chunk {part}/{total_parts} malformed JSON after {added} questions: {e}")
+
+            if title is None:
+                title = cls._partial_title(parser.text)
+            if len(questions) < count:
+                last_error = "AI tidak memberikan format data yang benar."
+                print(f"DEBUG: Quiz chunk {part}/{total_parts} returned {len(questions)}/{count} valid questions (attempt {attempt + 1})")
+
+        return title, questions, last_error
+
+    @classmethod
+    async def generate(
+        cls,
+        rpp_content: str,
+        jumlah_soal: int,
+        tingkat_kesulitan: str,
+        with_explanation: bool,
+        user_id=None,
+        plan_type: str = "free",
+        batched: bool = True
+    ) -> dict:
+        """
+        Returns quiz_data in the shape the exports expect:
+        {"judul_kuis": ..., "questions": [{"no", "pertanyaan", "options", "kunci_jawaban", "penjelasan"}]}.
+        May hold fewer than jumlah_soal questions if some could not be generated after retries.
+        """
+        chunk_size = Config.QUIZ_CHUNK_SIZE if batched else jumlah_soal
+        sizes = cls.plan_chunks(jumlah_soal, chunk_size)
+        semaphore = asyncio.Semaphore(max(1, Config.QUIZ_MAX_PARALLEL))
+
+        tasks = []
+        start_no = 1
+        for part, size in enumerate(sizes, start=1):
+            tasks.append(cls._generate_chunk(
+                semaphore, rpp_content, size, tingkat_kesulitan, with_explanation,
+                start_no, part, len(sizes), user_id, plan_type, Config.QUIZ_CHUNK_RETRIES
+            ))
+            start_no += size
+        results = await asyncio.gather(*tasks)
+
+        # Merge in chunk order, dropping questions another chunk already asked
+        title = None
+        merged = []
+        seen = set()
+        errors = []
+        for chunk_title, questions, error in results:
+            title = title or chunk_title
+            if error:
+                errors.append(error)
+            for q in questions:
+                key = _normalize(q.pertanyaan)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(q)
+
+        # Top up what de-duplication removed (one sequential chunk)
+        missing = jumlah_soal - len(merged)
+        if merged and missing > 0 and len(results) > 1:
+            _, extra, error = await cls._generate_chunk(
+                semaphore, rpp_content, missing, tingkat_kesulitan, with_explanation,
+                len(merged) + 1, 1, 1, user_id, plan_type, Config.QUIZ_CHUNK_RETRIES,
+                avoid=[q.pertanyaan for q in merged]
+            )
+            if error:
+                errors.append(error)
+            for q in extra:
+                key = _normalize(q.pertanyaan)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(q)
+
+        if not merged:
+            raise QuizGenerationError(errors[0] if errors else "AI tidak memberikan format data yang benar.")
+        if len(merged) < jumlah_soal:
+            print(f"DEBUG: Quiz generated {len(merged)}/{jumlah_soal} questions")
+
+        questions = []
+        for no, q in enumerate(merged[:jumlah_soal], start=1):
+            item = q.model_dump()
+            item["no"] = no
+            if not with_explanation:
+                item["penjelasan"] = ""
+            questions.append(item)
+
+        return {
+            "judul_kuis": title or "Kuis",
+            "questions": questions
+        }
@@ -0,0 +1,83 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from app.config import Config
+from app.metrics import registry, stage_duration
+
+render_duration = registry.histogram(
+    "render_duration_seconds", "Document build time including pool wait, by builder.", ("builder",)
+)
+
+class RenderQueueFull(Exception):
+    """Raised when the render pool is saturated and the waiting queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Render queue is full")
+        self.retry_after = retry_after
+
+class RenderExecutor:
+    """
+    Bounded worker pool for CPU-heavy document building (FPDF, python-docx, python-pptx).
+
+    Jobs run on a thread or process pool so a large export never blocks the event loop.
+    At most `max_workers + max_queue` jobs are admitted at once; anything beyond that is
+    rejected immediately with RenderQueueFull so routes can answer 503 + Retry-After
+    instead of letting requests pile up.
+    """
+
+    def __init__(self, mode: str, max_workers: int, max_queue: int, retry_after: int):
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self._pool = None
+        self._pending = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="render")
+        return self._pool
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` on the pool. `fn` must be picklable in process mode."""
+        start = time.perf_counter()
+        result = await self._run(fn, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage="render")
+        render_duration.observe(elapsed, builder=getattr(fn, "__name__", "unknown"))
+        return result
+
+    async def _run(self, fn, *args, **kwargs):
+        if self.mode == "inline":
+            # Debug/benchmark baseline: build on the event loop like before
+            return fn(*args, **kwargs)
+
+        if self._pending >= self.max_workers + self.max_queue:
+            raise RenderQueueFull(self.retry_after)
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), functools.partial(fn, *args, **kwargs))
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+render_executor = RenderExecutor(
+    mode=Config.RENDER_EXECUTOR,
+    max_workers=Config.RENDER_WORKERS,
+    max_queue=Config.RENDER_QUEUE_LIMIT,
+    retry_after=Config.RENDER_RETRY_AFTER
+)
@@ -0,0 +1,280 @@
+import re
+import html
+from typing import Optional
+from sqlalchemy import text
+from app.config import Config
+
+# Highlight markers in snippets. The database wraps matches in private-use sentinels;
+# render_snippet() HTML-escapes the user/AI text and only then turns them into tags.
+SENTINEL_START = "\ue000"
+SENTINEL_END = "\ue001"
+MARK_START = "<mark>"
+MARK_END = "</mark>"
+MAX_QUERY_TERMS = 10
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+REGCONFIG_RE = re.compile(r"'(\w+)'::regconfig")
+
+# --- Postgres: generated tsvector columns + GIN ---
+
+PG_RPP_VECTOR = """
+    setweight(to_tsvector('{cfg}'::regconfig, coalesce(topik, '')), 'A') ||
+    setweight(to_tsvector('{cfg}'::regconfig, coalesce(mapel, '') || ' ' || coalesce(kelas, '')), 'B') ||
+    setweight(to_tsvector('{cfg}'::regconfig, coalesce(content_markdown, '')), 'D')
+"""
+PG_QUIZ_VECTOR = """
+    setweight(to_tsvector('{cfg}'::regconfig, coalesce(topik, '')), 'A') ||
+    setweight(to_tsvector('{cfg}'::regconfig, coalesce(mapel, '')), 'B') ||
+    setweight(jsonb_to_tsvector('{cfg}'::regconfig,
+        jsonb_path_query_array(quiz_data::jsonb, '$.questions[*].pertanyaan'), '["string"]'), 'C')
+"""
+PG_HEADLINE_OPTIONS = f"StartSel=\"{SENTINEL_START}\", StopSel=\"{SENTINEL_END}\", MaxWords=30, MinWords=12, MaxFragments=2, FragmentDelimiter=\" … \""
+
+# --- SQLite: FTS5 tables kept in sync by triggers ---
+
+SQLITE_TOKENIZER = "unicode61 remove_diacritics 2"
+SQLITE_QUIZ_QUESTIONS = "(SELECT group_concat(json_extract(value, '$.pertanyaan'), ' … ') FROM json_each({row}.quiz_data, '$.questions'))"
+SQLITE_SETUP = [
+    # External-content table over saved_rpps (no second copy of the markdown)
+    f"""CREATE VIRTUAL TABLE saved_rpps_fts USING fts5(
+        topik, mapel, kelas, content_markdown,
+        content='saved_rpps', content_rowid='id', tokenize='{SQLITE_TOKENIZER}')""",
+    """CREATE TRIGGER saved_rpps_fts_ai AFTER INSERT ON saved_rpps BEGIN
+        INSERT INTO saved_rpps_fts(rowid, topik, mapel, kelas, content_markdown)
+        VALUES (new.id, new.topik, new.mapel, new.kelas, new.content_markdown);
+    END""",
+    """CREATE TRIGGER saved_rpps_fts_ad AFTER DELETE ON saved_rpps BEGIN
+        INSERT INTO saved_rpps_fts(saved_rpps_fts, rowid, topik, mapel, kelas, content_markdown)
+        VALUES ('delete', old.id, old.topik, old.mapel, old.kelas, old.content_markdown);
+    END""",
+    """CREATE TRIGGER saved_rpps_fts_au AFTER UPDATE OF topik, mapel, kelas, content_markdown ON saved_rpps BEGIN
+        INSERT INTO saved_rpps_fts(saved_rpps_fts, rowid, topik, mapel, kelas, content_markdown)
+        VALUES ('delete', old.id, old.topik, old.mapel, old.kelas, old.content_markdown);
+        INSERT INTO saved_rpps_fts(rowid, topik, mapel, kelas, content_markdown)
+        VALUES (new.id, new.topik, new.mapel, new.kelas, new.content_markdown);
+    END""",
+    "INSERT INTO saved_rpps_fts(saved_rpps_fts) VALUES ('rebuild')",
+    # Quiz questions are extracted from JSON, so this one stores its own text
+    f"CREATE VIRTUAL TABLE saved_quizzes_fts USING fts5(topik, mapel, questions, tokenize='{SQLITE_TOKENIZER}')",
+    f"""CREATE TRIGGER saved_quizzes_fts_ai AFTER INSERT ON saved_quizzes BEGIN
+        INSERT INTO saved_quizzes_fts(rowid, topik, mapel, questions)
+        VALUES (new.id, new.topik, new.mapel, {SQLITE_QUIZ_QUESTIONS.format(row="new")});
+    END""",
+    """CREATE TRIGGER saved_quizzes_fts_ad AFTER DELETE ON saved_quizzes BEGIN
+        DELETE FROM saved_quizzes_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER saved_quizzes_fts_au AFTER UPDATE OF topik, mapel, quiz_data ON saved_quizzes BEGIN
+        DELETE FROM saved_quizzes_fts WHERE rowid = old.id;
+        INSERT INTO saved_quizzes_fts(rowid, topik, mapel, questions)
+        VALUES (new.id, new.topik, new.mapel, {SQLITE_QUIZ_QUESTIONS.format(row="new")});
+    END""",
+    f"""INSERT INTO saved_quizzes_fts(rowid, topik, mapel, questions)
+        SELECT q.id, q.topik, q.mapel, {SQLITE_QUIZ_QUESTIONS.format(row="q")} FROM saved_quizzes q""",
+]
+
+def render_snippet(snippet: Optional[str]) -> Optional[str]:
+    """Database snippet -> safe HTML: everything escaped, matches wrapped in <mark>."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(SENTINEL_START, MARK_START).replace(SENTINEL_END, MARK_END)
+
+class SearchIndex:
+    """
+    Full-text search over a user's saved RPPs and quizzes.
+
+    Postgres: STORED generated tsvector columns (topik weighted A, mapel/kelas B,
+    quiz questions C, RPP body D) with GIN indexes, queried with
+    websearch_to_tsquery and ranked by ts_rank_cd. The text search config is
+    SEARCH_TS_CONFIG ('indonesian' stemming) when the server has it, else 'simple';
+    an existing column keeps the config it was built with.
+
+    SQLite (local/tests): FTS5 tables maintained by triggers, ranked by bm25 with
+    the same column weights. Prefix queries are not offered: a short prefix
+    expands to hundreds of terms and blows the latency budget on big histories.
+
+    setup() is idempotent and runs at startup; the first run on a large Postgres
+    table rewrites it to fill the generated columns.
+    """
+
+    def __init__(self, ts_config: str):
+        self.preferred_config = ts_config
+        self.ts_config = None # Config actually used by the Postgres columns
+        self.backend = None # 'postgresql', 'sqlite' or None (search unavailable)
+
+    # --- Setup ---
+
+    async def setup(self, engine):
+        dialect = engine.dialect.name
+        try:
+            if dialect == "postgresql":
+                await self._setup_postgres(engine)
+            elif dialect == "sqlite":
+                await self._setup_sqlite(engine)
+            else:
+                print(f"DEBUG: Full-text search not supported on {dialect}")
+                return
+            self.backend = dialect
+            print(f"DEBUG: Full-text search ready ({dialect}{', ' + self.ts_config if self.ts_config else ''})")
+        except Exception as e:
+            print(f"DEBUG: Full-text search setup failed: {e}")
+
+    async def _pg_column_config(self, conn, table: str) -> Optional[str]:
+        res = await conn.execute(text("""
+            SELECT pg_get_expr(d.adbin, d.adrelid)
+            FROM pg_attribute a JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+            WHERE a.attrelid = CAST(:table AS regclass) AND a.attname = 'search_vector'
+        """), {"table": table})
+        expr = res.scalar()
+        if expr is None:
+            return None
+        match = REGCONFIG_RE.search(expr)
+        return match.group(1) if match else "simple"
+
+    async def _setup_postgres(self, engine):
+        async with engine.begin() as conn:
+            existing = await self._pg_column_config(conn, "saved_rpps")
+            if existing:
+                cfg = existing
+            else:
+                found = await conn.execute(
+                    text("SELECT 1 FROM pg_ts_config WHERE cfgname = :cfg"), {"cfg": self.preferred_config}
+                )
+                cfg = self.preferred_config if found.scalar() else "simple"
+                if cfg != self.preferred_config:
+                    print(f"DEBUG: Text search config '{self.preferred_config}' not installed, using 'simple'")
+
+        # btree_gin lets one GIN index serve both the tenant filter and the match
+        tenant_gin = True
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+        except Exception as e:
+            tenant_gin = False
+            print(f"DEBUG: btree_gin unavailable, indexing search_vector alone: {e}")
+
+        async with engine.begin() as conn:
+            for table, vector in (("saved_rpps", PG_RPP_VECTOR), ("saved_quizzes", PG_QUIZ_VECTOR)):
+                if await self._pg_column_config(conn, table) is None:
+                    print(f"Adding {table}.search_vector...")
+                    await conn.execute(text(
+                        f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+                        f"GENERATED ALWAYS AS ({vector.format(cfg=cfg)}) STORED"
+                    ))
+                columns = "user_id, search_vector" if tenant_gin else "search_vector"
+                await conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} USING GIN ({columns})"
+                ))
+        self.ts_config = cfg
+
+    async def _setup_sqlite(self, engine):
+        async with engine.begin() as conn:
+            res = await conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE name IN ('saved_rpps_fts', 'saved_quizzes_fts')"
+            ))
+            if len(res.all()) == 2:
+                return
+            for statement in SQLITE_SETUP:
+                await conn.execute(text(statement))
+
+    # --- Queries ---
+
+    @staticmethod
+    def fts5_query(q: str) -> Optional[str]:
+        """User input -> FTS5 MATCH expression: every term required, each quoted (no operators)."""
+        terms = TOKEN_RE.findall(q)[:MAX_QUERY_TERMS]
+        if not terms:
+            return None
+        return " ".join(f'"{t}"' for t in terms)
+
+    async def _search_postgres(self, db, kind: str, user_id: int, q: str, limit: int, offset: int) -> list:
+        if kind == "rpp":
+            page = """
+                SELECT r.id, r.mapel, r.kelas, r.topik, r.created_at,
+                       ts_rank_cd(r.search_vector, query) AS score, query
+                FROM saved_rpps r, websearch_to_tsquery(CAST(:cfg AS regconfig), :q) query
+                WHERE r.user_id = :user_id AND r.search_vector @@ query
+                ORDER BY score DESC, r.id DESC LIMIT :limit OFFSET :offset
+            """
+            body = "r.content_markdown"
+            table = "saved_rpps"
+        else:
+            page = """
+                SELECT r.id, r.mapel, NULL AS kelas, r.topik, r.created_at,
+                       ts_rank_cd(r.search_vector, query) AS score, query
+                FROM saved_quizzes r, websearch_to_tsquery(CAST(:cfg AS regconfig), :q) query
+                WHERE r.user_id = :user_id AND r.search_vector @@ query
+                ORDER BY score DESC, r.id DESC LIMIT :limit OFFSET :offset
+            """
+            body = "(SELECT string_agg(x ->> 'pertanyaan', ' … ') FROM jsonb_array_elements(r.quiz_data::jsonb -> 'questions') x)"
+            table = "saved_quizzes"
+
+        # Headlines are expensive: only for the rows of this page
+        stmt = text(f"""
+            SELECT p.id, p.mapel, p.kelas, p.topik, p.created_at, p.score,
+                   ts_headline(CAST(:cfg AS regconfig), {body}, p.query, :opts) AS snippet
+            FROM ({page}) p JOIN {table} r ON r.id = p.id
+            ORDER BY p.score DESC, p.id DESC
+        """)
+        res = await db.execute(stmt, {
+            "cfg": self.ts_config, "q": q, "user_id": user_id,
+            "limit": limit, "offset": offset, "opts": PG_HEADLINE_OPTIONS
+        })
+        return [dict(row) for row in res.mappings().all()]
+
+    async def _search_sqlite(self, db, kind: str, user_id: int, q: str, limit: int, offset: int) -> list:
+        match = self.fts5_query(q)
+        if match is None:
+            return []
+        if kind == "rpp":
+            stmt = text(f"""
+                SELECT r.id, r.mapel, r.kelas, r.topik, r.created_at,
+                       -bm25(saved_rpps_fts, 10.0, 4.0, 4.0, 1.0) AS score,
+                       snippet(saved_rpps_fts, -1, '{SENTINEL_START}', '{SENTINEL_END}', ' … ', 24) AS snippet
+                FROM saved_rpps_fts JOIN saved_rpps r ON r.id = saved_rpps_fts.rowid
+                WHERE saved_rpps_fts MATCH :q AND r.user_id = :user_id
+                ORDER BY score DESC, r.id DESC LIMIT :limit OFFSET :offset
+            """)
+        else:
+            stmt = text(f"""
+                SELECT r.id, r.mapel, NULL AS kelas, r.topik, r.created_at,
+                       -bm25(saved_quizzes_fts, 10.0, 4.0, 2.0) AS score,
+                       snippet(saved_quizzes_fts, -1, '{SENTINEL_START}', '{SENTINEL_END}', ' … ', 24) AS snippet
+                FROM saved_quizzes_fts JOIN saved_quizzes r ON r.id = saved_quizzes_fts.rowid
+                WHERE saved_quizzes_fts MATCH :q AND r.user_id = :user_id
+                ORDER BY score DESC, r.id DESC LIMIT :limit OFFSET :offset
+            """)
+        res = await db.execute(stmt, {"q": match, "user_id": user_id, "limit": limit, "offset": offset})
+        return [dict(row) for row in res.mappings().all()]
+
+    async def search(self, db, user_id: int, q: str, kinds: list, page: int, page_size: int) -> dict:
+        """
+        One page of hits, best first. With several kinds, each is queried for the
+        first page * page_size + 1 hits and the lists are merged by score.
+        """
+        run = self._search_postgres if self.backend == "postgresql" else self._search_sqlite
+        offset = (page - 1) * page_size
+
+        if len(kinds) == 1:
+            hits = await run(db, kinds[0], user_id, q, page_size + 1, offset)
+            for hit in hits:
+                hit["type"] = kinds[0]
+        else:
+            hits = []
+            for kind in kinds:
+                for hit in await run(db, kind, user_id, q, offset + page_size + 1, 0):
+                    hit["type"] = kind
+                    hits.append(hit)
+            hits.sort(key=lambda h: (h["score"], h["id"]), reverse=True)
+            hits = hits[offset:]
+
+        items = hits[:page_size]
+        for item in items:
+            item["score"] = float(item["score"])
+            item["snippet"] = render_snippet(item["snippet"])
+        return {
+            "items": items,
+            "page": page,
+            "page_size": page_size,
+            "has_more": len(hits) > page_size
+        }
+
+search_index = SearchIndex(ts_config=Config.SEARCH_TS_CONFIG)
@@ -1,10 +1,16 @@
+import asyncio
 import hmac
 import hashlib
+import importlib.util
 import json
+import logging
+import time
 import httpx
 from datetime import datetime
 from app.config import Config
 
+logger = logging.getLogger(__name__)
+
 class TripayService:
     BASE_URL_SANDBOX = "https://tripay.co.id/api-sandbox"
     BASE_URL_PROD = "https://tripay.co.id/api"
@@ -14,7 +20,55 @@ class TripayService:
         self.private_key = Config.TRIPAY_PRIVATE_KEY
         self.merchant_code = Config.TRIPAY_MERCHANT_CODE
         self.is_production = Config.TRIPAY_MODE == "PRODUCTION"
-        self.base_url = self.BASE_URL_PROD if self.is_production else self.BASE_URL_SANDBOX
+        self.base_url = Config.TRIPAY_BASE_URL or (self.BASE_URL_PROD if self.is_production else self.BASE_URL_SANDBOX)
+        self.channels_ttl = Config.TRIPAY_CHANNELS_TTL
+        self.channels_retry = Config.TRIPAY_CHANNELS_RETRY
+
+        # Shared keep-alive client; opened by the app lifespan (start/close)
+        self._client = None
+        # Payment channel cache (channel list + fee table), refreshed in the background
+        self._channels = None
+        self._channels_fetched_at = 0.0
+        self._channels_error = None # Last failed fetch, while nothing is cached
+        self._channels_failed_at = 0.0
+        self._channels_lock = asyncio.Lock()
+        self._refresh_task = None
+
+    # --- HTTP client lifecycle ---
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # HTTP/2 needs the optional `h2` package (pip install httpx[http2])
+        http2 = importlib.util.find_spec("h2") is not None
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(Config.TRIPAY_TIMEOUT, connect=Config.TRIPAY_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+            headers={"Authorization": f"Bearer {self.api_key}"}
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            # Used outside the app lifespan (scripts); still one client per service
+            self._client = self._build_client()
+        return self._client
+
+    async def start(self):
+        """Open the pooled client and warm the channel cache without blocking startup."""
+        self._client = self._build_client()
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     def _generate_signature(self, merchant_ref: str, amount: int) -> str:
         """
@@ -60,37 +114,84 @@ class TripayService:
             "signature": signature
         }
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
+        response = await self.client.post(
+            f"{self.base_url}/transaction/create",
+            json=payload
+        )
+        
+        if response.status_code != 200:
+            raise Exception(f"Tripay Error: {response.text}")
+        
+        return response.json()
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/transaction/create",
-                json=payload,
-                headers=headers
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Tripay Error: {response.text}")
-            
-            return response.json()
+    async def fetch_payment_channels(self):
+        """
+        Fetch available payment channels from Tripay (always a network call).
+        """
+        response = await self.client.get(f"{self.base_url}/merchant/payment-channel")
+        
+        if response.status_code != 200:
+            raise Exception(f"Tripay Error: {response.text}")
+        
+        return response.json()
+
+    async def refresh_channels(self):
+        async with self._channels_lock:
+            return await self._store_channels()
+
+    async def _store_channels(self):
+        try:
+            channels = await self.fetch_payment_channels()
+        except Exception as e:
+            self._channels_error = e
+            self._channels_failed_at = time.monotonic()
+            raise
+        self._channels = channels
+        self._channels_fetched_at = time.monotonic()
+        self._channels_error = None
+        return channels
+
+    def _raise_recent_failure(self):
+        # Tripay just failed and nothing is cached: fail fast instead of every caller waiting out its own timeout
+        if self._channels_error is not None and time.monotonic() - self._channels_failed_at < self.channels_retry:
+            raise Exception(f"Payment channels unavailable: {self._channels_error}")
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh_channels()
+                delay = self.channels_ttl
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep serving the last good list; retry sooner
+                logger.warning(f"Payment channel refresh failed: {e}")
+                delay = min(60, self.channels_ttl)
+            await asyncio.sleep(delay)
 
     async def get_payment_channels(self):
         """
-        Fetch available payment channels from Tripay.
+        Payment channels (with fee table) from the cache.
+        Only the very first call, before the background refresh has finished, waits on Tripay.
+        While nothing is cached, a failed fetch makes callers fail at once for
+        TRIPAY_CHANNELS_RETRY seconds (the background loop keeps retrying).
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
+        if self._channels is None:
+            self._raise_recent_failure()
+            async with self._channels_lock:
+                # Concurrent first callers share one fetch; if it failed, they fail with it
+                if self._channels is None:
+                    self._raise_recent_failure()
+                    await self._store_channels()
+            return self._channels
+        if time.monotonic() - self._channels_fetched_at > self.channels_ttl * 2 and self._refresh_task is None:
+            # No background loop (outside the lifespan): refresh stale data inline
+            return await self.refresh_channels()
+        return self._channels
+
+    async def get_channel(self, code: str):
+        """Cached channel entry for a payment method code, or None."""
+        channels_res = await self.get_payment_channels()
+        return next((c for c in channels_res.get("data", []) if c.get("code") == code), None)
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/merchant/payment-channel",
-                headers=headers
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Tripay Error: {response.text}")
-            
-            return response.json()
+tripay_service = TripayService()
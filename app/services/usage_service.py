@@ -0,0 +1,116 @@
+from datetime import datetime
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models.rpp_data import GenerationLog, UsageCounter
+from app.utils.time_utils import get_jakarta_time
+
+class UsageService:
+    """
+    Monthly RPP quota backed by the usage_counters table (one row per user per month).
+
+    - get_usage() is the cheap pre-check before calling the AI.
+    - consume() is the authoritative check-and-increment: a single conditional
+      UPDATE ... SET count = count + 1 WHERE count < limit, run in the caller's
+      transaction together with the GenerationLog insert. Two parallel generations
+      can no longer both slip past the limit.
+    - A missing row is seeded from generation_logs once, so months that started
+      before the counter existed are still counted correctly.
+    """
+
+    @staticmethod
+    def current_period(now: datetime = None) -> str:
+        return (now or get_jakarta_time()).strftime("%Y-%m")
+
+    @staticmethod
+    def _period_start(period: str) -> datetime:
+        return datetime.strptime(period, "%Y-%m")
+
+    @staticmethod
+    def _insert(db: AsyncSession):
+        dialect = db.bind.dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            return None
+        return insert(UsageCounter)
+
+    @classmethod
+    async def _count_logs(cls, db: AsyncSession, user_id: int, period: str) -> int:
+        start = cls._period_start(period)
+        res = await db.execute(
+            select(func.count(GenerationLog.id)).where(
+                GenerationLog.user_id == user_id,
+                GenerationLog.created_at >= start
+            )
+        )
+        return res.scalar() or 0
+
+    @classmethod
+    async def _ensure_counter(cls, db: AsyncSession, user_id: int, period: str):
+        """Create the user's counter row for `period` if it does not exist yet."""
+        exists = await db.execute(
+            select(UsageCounter.id).where(UsageCounter.user_id == user_id, UsageCounter.period == period)
+        )
+        if exists.scalar() is not None:
+            return
+
+        initial = await cls._count_logs(db, user_id, period)
+        values = {"user_id": user_id, "period": period, "count": initial, "updated_at": get_jakarta_time()}
+        stmt = cls._insert(db)
+        if stmt is not None:
+            await db.execute(stmt.values(**values).on_conflict_do_nothing(index_elements=["user_id", "period"]))
+            return
+
+        # Other dialects: plain insert, losing the race to a parallel request is fine
+        try:
+            async with db.begin_nested():
+                db.add(UsageCounter(**values))
+        except IntegrityError:
+            pass
+
+    @classmethod
+    async def get_usage(cls, db: AsyncSession, user_id: int) -> int:
+        period = cls.current_period()
+        res = await db.execute(
+            select(UsageCounter.count).where(UsageCounter.user_id == user_id, UsageCounter.period == period)
+        )
+        count = res.scalar()
+        if count is None:
+            # No counter yet this month; fall back to the (indexed) log count
+            count = await cls._count_logs(db, user_id, period)
+        return count
+
+    @classmethod
+    async def consume(cls, db: AsyncSession, user_id: int, limit: int) -> bool:
+        """
+        Take one generation from the user's monthly quota.
+        Returns False (and changes nothing) if the quota is already used up.
+        Does not commit; the caller commits together with its GenerationLog row.
+        """
+        period = cls.current_period()
+        await cls._ensure_counter(db, user_id, period)
+        res = await db.execute(
+            update(UsageCounter)
+            .where(
+                UsageCounter.user_id == user_id,
+                UsageCounter.period == period,
+                UsageCounter.count < limit
+            )
+            .values(count=UsageCounter.count + 1, updated_at=get_jakarta_time())
+            .execution_options(synchronize_session=False)
+        )
+        return res.rowcount == 1
+
+    @classmethod
+    async def record_generation(cls, db: AsyncSession, user_id: int, plan_type: str, limit: int) -> bool:
+        """consume() plus the GenerationLog insert, committed as one transaction."""
+        if not await cls.consume(db, user_id, limit):
+            await db.rollback()
+            return False
+        db.add(GenerationLog(user_id=user_id, plan_type=plan_type))
+        await db.commit()
+        return True
@@ -0,0 +1,190 @@
+import math
+import re
+from app.utils.markdown_ast import parse_markdown_cached
+
+# Local token estimate: words cost ~1 token per 4 characters (SentencePiece-style
+# splitting of Indonesian words), every punctuation mark / table pipe costs one.
+TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+MARKER_RE = re.compile(r"^\s*(?:[IVX]+|[A-Z]|\d+)[.)]\s*")
+ROMAN_RE = re.compile(r"^[IVX]+$")
+
+def count_tokens(text: str) -> int:
+    """Approximate LLM token count of `text` without a tokenizer download."""
+    return sum(max(1, math.ceil(len(p) / 4)) if p[0].isalnum() or p[0] == "_" else 1
+               for p in TOKEN_PIECE_RE.findall(text or ""))
+
+# Section title keywords -> category (first match wins, checked in this order)
+SECTION_KEYWORDS = [
+    ("objectives", ("tujuan pembelajaran", "capaian pembelajaran")),
+    ("understanding", ("pemahaman bermakna",)),
+    ("questions", ("pertanyaan pemantik",)),
+    ("activities", ("kegiatan", "langkah pembelajaran", "langkah-langkah", "pendahuluan", "penutup", "sintaks")),
+    ("material", ("bahan bacaan", "materi", "ringkasan")),
+    ("glossary", ("glosarium",)),
+    ("worksheet", ("lkpd", "lembar kerja")),
+    ("assessment", ("asesmen", "penilaian", "rubrik")),
+    ("enrichment", ("pengayaan", "remedial")),
+    ("general", ("informasi umum", "identitas", "kompetensi awal", "profil pelajar", "sarana",
+                 "target peserta", "model pembelajaran", "komponen inti")),
+    ("drop", ("daftar pustaka", "mengetahui", "lampiran", "modul ajar")),
+]
+
+# What each task needs, most important first; lower entries are cut first under the budget
+TASK_SECTIONS = {
+    "ppt": ["objectives", "material", "understanding", "activities", "questions", "glossary"],
+    "quiz": ["objectives", "activities", "material", "understanding", "questions", "glossary"],
+}
+
+SUBJECT_KEYS = ("Mata Pelajaran", "Topik", "Jenjang / Kelas", "Fase / Elemen")
+
+def _classify(title: str):
+    text = MARKER_RE.sub("", title.replace("**", "")).lower()
+    for category, keywords in SECTION_KEYWORDS:
+        if any(k in text for k in keywords):
+            return category
+    return None
+
+def _section_start(block: dict):
+    """(level, title) if the block opens a section, else None."""
+    if block["type"] == "heading":
+        return block["level"], block["text"]
+    if block["type"] == "ordered" and block["emphasis"] and not block["indent"]:
+        # "A. Tujuan Pembelajaran" / "II. KOMPONEN INTI" written as list items
+        level = 2 if ROMAN_RE.match(block["marker"]) and block["text"].isupper() else 3
+        return level, f"{block['marker']}. {block['text']}"
+    if block["type"] == "paragraph" and block["text"].startswith("**") and block["text"].endswith("**"):
+        return 4, block["text"]
+    return None
+
+def split_sections(blocks) -> list:
+    """
+    Group AST blocks into sections: [{"title", "level", "category", "blocks"}].
+    A section whose title matches no keyword inherits its parent's category,
+    so "2. Kegiatan Inti" details stay with "D. Kegiatan Pembelajaran".
+    """
+    sections = [{"title": "", "level": 0, "category": "general", "blocks": []}]
+    stack = [] # (level, category) of open parents
+    for block in blocks:
+        start = _section_start(block)
+        if start is None:
+            sections[-1]["blocks"].append(block)
+            continue
+        level, title = start
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        category = _classify(title) or (stack[-1][1] if stack else "other")
+        stack.append((level, category))
+        sections.append({"title": title, "level": level, "category": category, "blocks": []})
+    return sections
+
+def _render_block(block: dict) -> str:
+    kind = block["type"]
+    if kind == "table":
+        if block["identity"]:
+            return ""
+        rows = [block["headers"]] + block["rows"]
+        return "\n".join(" | ".join(c for c in row if c) for row in rows if any(row))
+    if kind == "ordered":
+        return ("  " if block["indent"] else "") + f"{block['marker']}. {block['text']}"
+    if kind == "bullet":
+        return ("  " if block["indent"] else "") + f"- {block['text']}"
+    if kind == "paragraph":
+        return block["text"]
+    return ""
+
+def _render_section(section: dict) -> list:
+    lines = [f"## {section['title'].replace('**', '')}"] if section["title"] else []
+    lines += [line for line in (_render_block(b) for b in section["blocks"]) if line]
+    return lines
+
+def _subject_line(blocks) -> str:
+    """Mapel / topik / kelas from the identity table, as one short line."""
+    for block in blocks:
+        if block["type"] == "table" and block["identity"]:
+            found = {}
+            for row in block["rows"]:
+                if len(row) >= 2:
+                    key = row[0].replace("**", "").strip()
+                    if key in SUBJECT_KEYS and row[1].strip():
+                        found[key] = row[1].strip()
+            return "; ".join(f"{k}: {found[k]}" for k in SUBJECT_KEYS if k in found)
+    return ""
+
+def _truncate_lines(lines: list, budget: int) -> list:
+    """Whole lines while they fit; the first one that does not is cut at a word boundary."""
+    kept, used = [], 0
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            # LLM output often puts a whole paragraph on one line: keep its start
+            partial = _truncate_text(line, budget - used - 1)
+            if partial:
+                kept.append(partial)
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+def _truncate_text(text: str, budget: int) -> str:
+    used, end = 0, 0
+    for match in re.finditer(r"\S+\s*", text):
+        used += count_tokens(match.group())
+        if used > budget:
+            break
+        end = match.end()
+    return text[:end].rstrip()
+
+def compact_context(rpp_content: str, task: str, budget: int) -> dict:
+    """
+    Cut a Modul Ajar down to what `task` ("ppt" or "quiz") needs, within `budget` tokens.
+
+    Sections are picked by priority (TASK_SECTIONS) and emitted in document order;
+    the identity table, signatures, assessment rubrics and appendices are dropped.
+    The lowest-priority section that does not fit is cut line by line, its last
+    line at a word boundary. If no known section is found the original text is
+    kept, trimmed to the budget.
+
+    Returns {"text", "original_tokens", "context_tokens", "saved_tokens", "sections"}.
+    """
+    original_tokens = count_tokens(rpp_content)
+    blocks = parse_markdown_cached(rpp_content or "")
+    sections = split_sections(blocks)
+    priorities = TASK_SECTIONS[task]
+
+    header = _subject_line(blocks)
+    remaining = budget - (count_tokens(header) + 1 if header else 0)
+    chosen = {} # section index -> rendered lines
+    for category in priorities:
+        for idx, section in enumerate(sections):
+            if section["category"] != category or remaining <= 0:
+                continue
+            lines = _render_section(section)
+            if len(lines) <= (1 if section["title"] else 0):
+                continue # Heading only; its content sits in subsections
+            cost = sum(count_tokens(line) + 1 for line in lines)
+            if cost > remaining:
+                lines = _truncate_lines(lines, remaining)
+                cost = sum(count_tokens(line) + 1 for line in lines)
+            if len(lines) > (1 if section["title"] else 0): # Skip a heading cut off from all its content
+                chosen[idx] = lines
+                remaining -= cost
+
+    if chosen:
+        parts = ([header] if header else []) + [line for idx in sorted(chosen) for line in chosen[idx]]
+        kept = sorted({sections[idx]["category"] for idx in chosen}, key=priorities.index)
+    else:
+        parts = [_truncate_text(rpp_content or "", budget)]
+        kept = []
+    text = "\n".join(parts)
+
+    # Never hand back more than we were given
+    if count_tokens(text) >= original_tokens and original_tokens <= budget:
+        text, kept = rpp_content, ["all"]
+    context_tokens = count_tokens(text)
+    return {
+        "text": text,
+        "original_tokens": original_tokens,
+        "context_tokens": context_tokens,
+        "saved_tokens": max(original_tokens - context_tokens, 0),
+        "sections": kept,
+    }
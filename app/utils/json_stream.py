@@ -0,0 +1,134 @@
+import json
+from typing import Any, List, Optional
+
+_decoder = json.JSONDecoder()
+
+def extract_json(text: str) -> Any:
+    """
+    Decode the first JSON object/array in `text` (model output may wrap it in
+    ```json fences or chatter). raw_decode stops at the end of that value, so
+    trailing text containing braces does not break it. Raises ValueError.
+    """
+    pos = 0
+    while True:
+        starts = [i for i in (text.find("{", pos), text.find("[", pos)) if i != -1]
+        if not starts:
+            raise ValueError("No JSON value found")
+        start = min(starts)
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            return value
+        except ValueError:
+            pos = start + 1
+
+class JSONStreamParser:
+    """
+    Incremental parser for a streamed JSON document.
+
+    feed() takes text deltas and returns the elements of the array under
+    `array_key` (e.g. "slides", "questions") that were completed by this delta,
+    so callers can act on each item before the response ends. With
+    array_key=None the elements of a top-level array are returned. Text before
+    the first '{' / '[' (```json fences) is skipped. Every character is scanned
+    once; result() decodes the whole document after the stream has finished.
+
+    A completed element that is not valid JSON raises ValueError immediately.
+    """
+
+    def __init__(self, array_key: Optional[str] = "slides"):
+        self.array_key = array_key
+        self._text = ""
+        self._pos = 0
+        self._root = -1 # Offset of the first '{' / '['
+        self._stack = [] # Open containers: '{' or '['
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string = None # Most recent string literal (candidate object key)
+        self._key = None # Key of the value being parsed in the current object
+        self._array_depth = -1 # Stack depth of the target array once found
+        self._item_start = -1
+        self.items_seen = 0
+
+    def feed(self, delta: str) -> List[Any]:
+        self._text += delta
+        text = self._text
+        completed = []
+
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._root == -1:
+                if ch not in "{[":
+                    continue
+                self._root = i
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":":
+                self._key = self._last_string
+            elif ch == ",":
+                self._key = None
+            elif ch in "{[":
+                if self._is_target_array(ch):
+                    self._array_depth = len(self._stack) + 1
+                elif self._array_depth != -1 and len(self._stack) == self._array_depth and self._item_start == -1:
+                    self._item_start = i
+                self._stack.append(ch)
+                self._key = None
+            elif ch in "}]":
+                if not self._stack:
+                    raise ValueError(f"Unexpected '{ch}' at offset {i}")
+                opener = self._stack.pop()
+                if (opener == "{") != (ch == "}"):
+                    raise ValueError(f"Mismatched '{ch}' at offset {i}")
+                depth = len(self._stack)
+                if self._item_start != -1 and depth == self._array_depth:
+                    completed.append(self._decode_item(text[self._item_start:i + 1]))
+                    self._item_start = -1
+                elif depth + 1 == self._array_depth:
+                    self._array_depth = -2 # Target array closed; ignore later arrays
+                self._key = None
+
+        self._pos = len(text)
+        return completed
+
+    def _is_target_array(self, ch: str) -> bool:
+        if ch != "[" or self._array_depth != -1:
+            return False
+        if self.array_key is None:
+            return not self._stack
+        return len(self._stack) == 1 and self._stack[0] == "{" and self._key == self.array_key
+
+    def _decode_item(self, raw: str) -> Any:
+        try:
+            item = json.loads(raw)
+        except ValueError as e:
+            raise ValueError(f"Invalid item #{self.items_seen + 1}: {e}") from e
+        self.items_seen += 1
+        return item
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    @property
+    def complete(self) -> bool:
+        return self._root != -1 and not self._stack
+
+    def result(self) -> Any:
+        """The whole document; raises ValueError if it is missing or incomplete."""
+        if self._root == -1:
+            raise ValueError("No JSON value found")
+        value, _ = _decoder.raw_decode(self._text, self._root)
+        return value
@@ -0,0 +1,126 @@
+import hashlib
+import re
+from functools import lru_cache
+
+# Block grammar of the Modul Ajar markdown produced by build_rpp_prompt.
+# Compiled once; the exporters used to re-run these with re.match on every line.
+TABLE_SEP_RE = re.compile(r'^\s*\|?[:\-\s|]+\|?[:\-\s|]*\s*$')
+HEADING_PREFIX_RE = re.compile(r'^#+\s*')
+ORDERED_RE = re.compile(r'^\s*(\d+|[a-zA-Z]|[ivxIVX]+)\.\s+(.*)')
+BULLET_RE = re.compile(r'^\s*[\-\*•]\s*')
+BOLD_SPLIT_RE = re.compile(r'(\*\*.*?\*\*)')
+ROMAN_MARKER_RE = re.compile(r'^[IVX]+$')
+ALPHA_MARKER_RE = re.compile(r'^[A-Z]$')
+
+IDENTITY_KEYS = ["Penyusun", "Instansi"]
+
+# Bump when the block shapes below change; stored ASTs with another version are re-parsed
+AST_VERSION = 1
+
+def parse_inline(text: str) -> list:
+    """Split text into [text, is_bold] runs on **bold** markers."""
+    runs = []
+    for part in BOLD_SPLIT_RE.split(text):
+        if not part:
+            continue
+        if part.startswith('**') and part.endswith('**') and len(part) >= 4:
+            runs.append([part[2:-2], True])
+        else:
+            runs.append([part, False])
+    return runs
+
+def parse_markdown(content_markdown: str) -> list:
+    """
+    Parse Modul Ajar markdown into a flat list of block dicts in a single pass.
+
+    Block shapes (all JSON-serializable):
+        {"type": "heading", "level": 1-3, "text": str}
+        {"type": "table", "headers": [str], "rows": [[str]], "identity": bool}
+        {"type": "ordered", "marker": str, "text": str, "runs": [[str, bool]], "indent": bool, "emphasis": bool}
+        {"type": "bullet", "text": str, "runs": [[str, bool]], "indent": bool}
+        {"type": "paragraph", "text": str, "runs": [[str, bool]]}
+        {"type": "blank"}
+
+    Text keeps its markdown markers; each renderer decides how to clean it.
+    """
+    blocks = []
+    lines = (content_markdown or "").split('\n')
+    n = len(lines)
+    i = 0
+    while i < n:
+        raw = lines[i]
+        line = raw.strip()
+
+        # Table: a row with pipes followed by a separator row
+        if '|' in line and i + 1 < n and TABLE_SEP_RE.match(lines[i + 1]):
+            headers = [c.strip() for c in line.strip('|').split('|')]
+            rows = []
+            i += 2
+            while i < n:
+                row_line = lines[i].strip()
+                if '|' not in row_line:
+                    break
+                row = [c.strip() for c in row_line.strip('|').split('|')]
+                while len(row) < len(headers): row.append("")
+                rows.append(row[:len(headers)])
+                i += 1
+
+            plain_headers = [h.replace('**', '') for h in headers]
+            is_identity = any("Identitas" in h for h in plain_headers) or (
+                len(plain_headers) == 2 and any(k in plain_headers[0] for k in IDENTITY_KEYS)
+            )
+            blocks.append({"type": "table", "headers": headers, "rows": rows, "identity": is_identity})
+            continue
+
+        i += 1
+        if not line:
+            blocks.append({"type": "blank"})
+            continue
+
+        if line.startswith('#'):
+            level = 3 if line.startswith('###') else 2 if line.startswith('##') else 1
+            blocks.append({"type": "heading", "level": level, "text": HEADING_PREFIX_RE.sub('', line)})
+            continue
+
+        indent = raw.startswith('   ')
+
+        match = ORDERED_RE.match(line)
+        if match:
+            marker, text = match.group(1), match.group(2)
+            blocks.append({
+                "type": "ordered",
+                "marker": marker,
+                "text": text,
+                "runs": parse_inline(text),
+                "indent": indent,
+                "emphasis": bool(ROMAN_MARKER_RE.match(marker) or ALPHA_MARKER_RE.match(marker))
+            })
+            continue
+
+        match = BULLET_RE.match(line)
+        if match:
+            text = line[match.end():]
+            blocks.append({"type": "bullet", "text": text, "runs": parse_inline(text), "indent": indent})
+            continue
+
+        blocks.append({"type": "paragraph", "text": line, "runs": parse_inline(line)})
+
+    return blocks
+
+@lru_cache(maxsize=64)
+def parse_markdown_cached(content_markdown: str) -> tuple:
+    """
+    Memoized parse_markdown keyed by the document text.
+
+    PDF and Word downloads of the same SavedRPP share one parse. The returned
+    blocks are shared between callers and must be treated as read-only.
+    """
+    return tuple(parse_markdown(content_markdown))
+
+def content_hash(content_markdown: str) -> str:
+    """SHA-256 of the markdown; identifies a document across saves, exports and caches."""
+    return hashlib.sha256((content_markdown or "").encode("utf-8")).hexdigest()
+
+def build_content_ast(content_markdown: str) -> dict:
+    """Versioned, JSON-serializable parse stored alongside SavedRPP (content_ast column)."""
+    return {"v": AST_VERSION, "blocks": parse_markdown(content_markdown)}
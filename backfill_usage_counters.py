@@ -0,0 +1,68 @@
+import asyncio
+import sys
+import os
+
+# Add current directory to path so imports work
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, select
+from app.database import engine, Base
+from app.models import user, curriculum, rpp_data, payment
+from app.models.rpp_data import GenerationLog, UsageCounter
+from app.utils.time_utils import get_jakarta_time
+
+def period_expr(dialect: str):
+    """created_at -> 'YYYY-MM' in SQL for the active database."""
+    if dialect == "postgresql":
+        return func.to_char(GenerationLog.created_at, "YYYY-MM")
+    return func.strftime("%Y-%m", GenerationLog.created_at)
+
+async def backfill():
+    """
+    Create usage_counters and the generation_logs (user_id, created_at) index if
+    missing, then rebuild every counter from generation_logs. Safe to re-run:
+    existing counters are overwritten with the counted value.
+    """
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        print(f"❌ Unsupported database dialect: {dialect}")
+        return
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[UsageCounter.__table__])
+        for index in GenerationLog.__table__.indexes:
+            await conn.run_sync(lambda sync_conn: index.create(sync_conn, checkfirst=True))
+    print("usage_counters table and generation_logs index ready.")
+
+    period = period_expr(dialect).label("period")
+    stmt = (
+        select(GenerationLog.user_id, period, func.count(GenerationLog.id).label("total"))
+        .group_by(GenerationLog.user_id, period)
+    )
+
+    start = asyncio.get_running_loop().time()
+    async with engine.begin() as conn:
+        rows = (await conn.execute(stmt)).all()
+        now = get_jakarta_time()
+        values = [
+            {"user_id": r.user_id, "period": r.period, "count": r.total, "updated_at": now}
+            for r in rows if r.period
+        ]
+        # Upsert in batches
+        for offset in range(0, len(values), 1000):
+            batch = insert(UsageCounter).values(values[offset:offset + 1000])
+            batch = batch.on_conflict_do_update(
+                index_elements=["user_id", "period"],
+                set_={"count": batch.excluded.count, "updated_at": batch.excluded.updated_at}
+            )
+            await conn.execute(batch)
+
+    elapsed = asyncio.get_running_loop().time() - start
+    print(f"✅ Backfilled {len(values)} usage counters in {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -0,0 +1,177 @@
+"""
+Stand-ins for the external services, served on localhost during a benchmark.
+
+- make_llm_app(): OpenAI-compatible /v1/chat/completions (plain and stream=True)
+  with a configurable time to first token and token rate. It answers the three
+  prompt kinds the app sends: Modul Ajar markdown, slide JSON and quiz JSON.
+- make_tripay_app(): the two Tripay endpoints the app calls.
+"""
+import asyncio
+import json
+import re
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CHARS_PER_TOKEN = 4
+
+def _rpp_markdown(topik: str) -> str:
+    rows = "\n".join(f"| {i} | Kegiatan {i} tentang {topik} | {5 * i} menit |" for i in range(1, 9))
+    steps = "\n".join(f"{i}. Guru membimbing siswa mengerjakan langkah {i} materi **{topik}**." for i in range(1, 13))
+    return f"""# MODUL AJAR: {topik.upper()}
+
+## A. INFORMASI UMUM
+
+| Komponen | Keterangan |
+| --- | --- |
+| **Penyusun** | Guru |
+| **Instansi** | Sekolah |
+| **Fase / Kelas** | B / 4 |
+| **Alokasi Waktu** | 2 JP |
+
+## B. TUJUAN PEMBELAJARAN
+Peserta didik mampu menjelaskan konsep {topik} dan menerapkannya dalam soal sehari-hari.
+
+## C. LANGKAH PEMBELAJARAN
+
+### Pendahuluan
+{steps}
+
+### Kegiatan Inti
+| No | Kegiatan | Waktu |
+| --- | --- | --- |
+{rows}
+
+### Penutup
+- Refleksi bersama tentang {topik}.
+- Guru memberikan umpan balik.
+
+## D. ASESMEN
+1. Asesmen diagnostik di awal pertemuan.
+2. Asesmen formatif selama kegiatan inti.
+3. Asesmen sumatif berupa tes tertulis.
+"""
+
+def _deck_json() -> str:
+    layouts = ["split", "big_image", "highlight"]
+    slides = [
+        {
+            "judul_slide": f"Bagian {i}",
+            "konten": [f"Poin {i}.{j} yang penting untuk dipahami siswa" for j in range(1, 5)],
+            "keyword_visual": "classroom",
+            "layout_type": layouts[i % 3],
+        }
+        for i in range(1, 9)
+    ]
+    return json.dumps({"judul_materi": "Materi Pembelajaran", "theme": "Formal", "slides": slides}, ensure_ascii=False)
+
+def _quiz_json(prompt: str) -> str:
+    count = int((re.search(r"Buatkan (\d+) soal", prompt) or re.search(r"(\d+)", "5")).group(1))
+    start = int((re.search(r'"no": (\d+)', prompt) or re.search(r"(\d+)", "1")).group(1))
+    questions = [
+        {
+            "no": start + i,
+            "pertanyaan": f"Pertanyaan nomor {start + i} ({uuid.uuid4().hex[:6]})?",
+            "options": {k: f"Pilihan {k}" for k in "ABCD"},
+            "kunci_jawaban": "ABCD"[i % 4],
+            "penjelasan": "",
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"judul_kuis": "Kuis Latihan", "questions": questions}, ensure_ascii=False)
+
+def fake_completion(prompt: str) -> str:
+    if "STRUKTUR JSON" in prompt and "slides" in prompt:
+        return _deck_json()
+    if "soal pilihan ganda" in prompt:
+        return _quiz_json(prompt)
+    topik = re.search(r"[Tt]opik[^:\n]*:\s*([^\n]+)", prompt)
+    return _rpp_markdown(topik.group(1).strip(" *") if topik else "Materi")
+
+def make_llm_app(latency: float, token_rate: float, stats: dict = None) -> FastAPI:
+    """latency: seconds to the first token; token_rate: tokens/second after that (0 = instant)."""
+    app = FastAPI()
+    stats = stats if stats is not None else {}
+    stats.setdefault("calls", 0)
+    stats.setdefault("in_flight_max", 0)
+    state = {"in_flight": 0}
+
+    def _usage(prompt: str, text: str) -> dict:
+        prompt_tokens, completion_tokens = len(prompt) // CHARS_PER_TOKEN, len(text) // CHARS_PER_TOKEN
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _envelope(content=None, delta=None):
+        choice = {"index": 0, "finish_reason": None if delta is not None else "stop"}
+        if delta is not None:
+            choice["delta"] = {"content": delta}
+        else:
+            choice["message"] = {"role": "assistant", "content": content}
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion.chunk" if delta is not None else "chat.completion",
+            "created": int(time.time()), "model": "fake", "choices": [choice],
+            "usage": None,
+        }
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        text = fake_completion(prompt)
+        tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        stats["calls"] += 1
+        state["in_flight"] += 1
+        stats["in_flight_max"] = max(stats["in_flight_max"], state["in_flight"])
+
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(latency + (tokens / token_rate if token_rate else 0))
+            finally:
+                state["in_flight"] -= 1
+            return JSONResponse({**_envelope(content=text), "usage": _usage(prompt, text)})
+
+        async def events():
+            try:
+                await asyncio.sleep(latency)
+                step = 8 * CHARS_PER_TOKEN # 8 tokens per chunk
+                for i in range(0, len(text), step):
+                    if token_rate:
+                        await asyncio.sleep(8 / token_rate)
+                    yield f"data: {json.dumps(_envelope(delta=text[i:i + step]))}\n\n"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    final = {**_envelope(delta=""), "choices": [], "usage": _usage(prompt, text)}
+                    yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                state["in_flight"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def make_tripay_app(latency: float = 0.05) -> FastAPI:
+    app = FastAPI()
+    channels = [
+        {"group": "Virtual Account", "code": code, "name": name, "type": "direct", "active": True,
+         "fee_merchant": {"flat": 4250, "percent": 0}, "fee_customer": {"flat": 0, "percent": 0}, "total_fee": {"flat": 4250, "percent": "0.00"}}
+        for code, name in [("BRIVA", "BRI Virtual Account"), ("BNIVA", "BNI Virtual Account"), ("QRIS", "QRIS")]
+    ]
+
+    @app.get("/merchant/payment-channel")
+    async def payment_channels():
+        await asyncio.sleep(latency)
+        return {"success": True, "message": "Success", "data": channels}
+
+    @app.post("/transaction/create")
+    async def create_transaction(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        reference = f"DEV-T{uuid.uuid4().hex[:10].upper()}"
+        return {"success": True, "message": "", "data": {
+            "reference": reference, "merchant_ref": body.get("merchant_ref"), "payment_method": body.get("method"),
+            "amount": body.get("amount"), "status": "UNPAID",
+            "checkout_url": f"https://tripay.invalid/checkout/{reference}",
+        }}
+
+    return app
@@ -0,0 +1,144 @@
+"""
+Render executor benchmark.
+
+Fires concurrent /api/rpp/export-pdf requests with a large Modul Ajar while probing
+an unrelated endpoint ("/") on a fixed interval, then reports the probe latency
+percentiles. Each render mode runs in its own subprocess so the executor config is
+picked up fresh:
+
+    python benchmarks/render_latency.py                 # compares inline, thread, process
+    python benchmarks/render_latency.py --modes thread --exporters 8
+
+With RENDER_EXECUTOR=inline the builders run on the event loop (old behaviour) and the
+probe p99 climbs to the length of a whole export; with thread/process it stays flat.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SECTION = """
+## II. KOMPONEN INTI
+
+### A. Tujuan Pembelajaran
+1. Peserta didik dapat mengidentifikasi **pecahan senilai** menggunakan alat peraga.
+2. Peserta didik dapat membandingkan dua pecahan dengan penyebut berbeda.
+   - Menggunakan garis bilangan
+   - Menggunakan **gambar arsiran**
+
+| No | Kegiatan | Waktu |
+| :--- | :--- | :--- |
+| 1 | Pendahuluan dan apersepsi | 10 menit |
+| 2 | Diskusi kelompok dengan LKPD | 40 menit |
+| 3 | Presentasi hasil dan refleksi | 20 menit |
+
+Guru membimbing peserta didik yang membutuhkan bantuan dengan strategi scaffolding,
+memberikan contoh konkret menggunakan benda di sekitar kelas, lalu meminta peserta
+didik menuliskan kesimpulan dengan bahasa mereka sendiri.
+"""
+
+def build_markdown(sections: int) -> str:
+    header = """# MODUL AJAR KURIKULUM MERDEKA
+
+## I. INFORMASI UMUM
+
+| Identitas Modul | |
+| :--- | :--- |
+| **Penyusun** | Guru Benchmark |
+| **Instansi** | SD Negeri 1 |
+"""
+    return header + SECTION * sections
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+async def run_once(exporters: int, duration: float, sections: int, probe_interval: float) -> dict:
+    import httpx
+    from app.main import app
+
+    payload = {
+        "content_markdown": build_markdown(sections),
+        "mapel": "Matematika",
+        "topik": "Pecahan Senilai",
+        "kelas": "4"
+    }
+    transport = httpx.ASGITransport(app=app)
+    probe_latencies = []
+    export_latencies = []
+    rejected = 0
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def exporter():
+            nonlocal rejected
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                res = await client.post("/api/rpp/export-pdf", json=payload)
+                if res.status_code == 503:
+                    rejected += 1
+                    await asyncio.sleep(0.05)
+                    continue
+                export_latencies.append(time.perf_counter() - start)
+
+        async def prober():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(probe_interval)
+
+        await asyncio.gather(prober(), *[exporter() for _ in range(exporters)])
+
+    return {
+        "probe_count": len(probe_latencies),
+        "probe_p50_ms": round(percentile(probe_latencies, 50) * 1000, 2),
+        "probe_p99_ms": round(percentile(probe_latencies, 99) * 1000, 2),
+        "probe_max_ms": round(max(probe_latencies, default=0) * 1000, 2),
+        "exports_done": len(export_latencies),
+        "export_p50_ms": round(percentile(export_latencies, 50) * 1000, 2),
+        "exports_rejected": rejected,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Probe latency while exports run")
+    parser.add_argument("--modes", default="inline,thread,process")
+    parser.add_argument("--exporters", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--sections", type=int, default=40)
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = asyncio.run(run_once(args.exporters, args.duration, args.sections, args.probe_interval))
+        print(json.dumps(result))
+        return
+
+    results = {}
+    for mode in args.modes.split(","):
+        env = dict(os.environ)
+        env["RENDER_EXECUTOR"] = mode
+        env.setdefault("DATABASE_URL", "sqlite+aiosqlite:///./bench.db")
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child",
+             "--exporters", str(args.exporters), "--duration", str(args.duration),
+             "--sections", str(args.sections), "--probe-interval", str(args.probe_interval)],
+            env=env, capture_output=True, text=True
+        )
+        if out.returncode != 0:
+            print(out.stderr)
+            continue
+        results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{mode:>8}: {results[mode]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import asyncio
+import sys
+import os
+
+# Add current directory to path so imports work
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect
+from app.database import engine, Base
+from app.models import user, curriculum, rpp_data, payment, job
+
+async def create_indexes():
+    """
+    create_all() only creates indexes together with new tables. This adds any
+    index declared on the models that an existing database is still missing.
+    """
+    def _create(sync_conn):
+        inspector = inspect(sync_conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue # Created with all its indexes by create_tables.py
+            for index in table.indexes:
+                index.create(sync_conn, checkfirst=True)
+                print(f"  {table.name}: {index.name}")
+
+    print("Creating missing indexes...")
+    async with engine.begin() as conn:
+        await conn.run_sync(_create)
+    print("✅ Indexes ready.")
+
+if __name__ == "__main__":
+    asyncio.run(create_indexes())
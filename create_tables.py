@@ -7,7 +7,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.database import init_db
 # Import Models to register them with Base
-from app.models import user, curriculum, rpp_data, payment
+from app.models import user, curriculum, rpp_data, payment, job
 
 async def main():
     print("Initializing Database Tables...")
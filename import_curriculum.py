@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import sys
+import os
+
+# Add current directory to path so imports work
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine, Base
+from app.models import user, curriculum, rpp_data, payment
+from app.models.curriculum import Subject, CurriculumGoal
+from app.services.curriculum_import import CurriculumImporter, DEFAULT_VERSION
+
+async def import_curriculum(args):
+    """
+    Load a Kurikulum Merdeka CP dataset (CSV with a header row, or JSONL) into
+    subjects/curriculum_goals. Safe to re-run: rows are upserted on
+    (subject, phase, element, version) and unchanged rows are not rewritten.
+    Running servers pick the new data up on their next catalog fingerprint check.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[Subject.__table__, CurriculumGoal.__table__])
+        for table in (Subject.__table__, CurriculumGoal.__table__):
+            for index in table.indexes:
+                # Fails if the table still holds duplicates of the upsert key
+                await conn.run_sync(lambda sync_conn: index.create(sync_conn, checkfirst=True))
+    print("subjects/curriculum_goals upsert keys ready.")
+
+    importer = CurriculumImporter(engine, batch_size=args.batch_size, default_version=args.version, dry_run=args.dry_run)
+    print(f"Importing {args.path}{' (dry run)' if args.dry_run else ''}...")
+    stats = await importer.run(args.path, fmt=args.format)
+
+    for error in importer.errors:
+        print(f"  ⚠️ {error}")
+    rate = stats["valid"] / stats["seconds"] if stats["seconds"] else 0
+    print(
+        f"✅ {stats['rows']} rows read, {stats['valid']} valid, {stats['invalid']} invalid; "
+        f"{stats['written']} written, {stats['unchanged']} unchanged, "
+        f"{stats['subjects_created']} new subjects in {stats['seconds']:.2f}s ({rate:.0f} rows/s)"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import curriculum goals (CP) from CSV/JSONL")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="Default: from the file extension")
+    parser.add_argument("--version", default=DEFAULT_VERSION, help="Version for rows without one")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Validate and upsert, then roll back")
+    asyncio.run(import_curriculum(parser.parse_args()))
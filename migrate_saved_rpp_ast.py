@@ -0,0 +1,55 @@
+import asyncio
+import sys
+import os
+
+# Add current directory to path so imports work
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, select, update, text
+from app.database import engine
+from app.models import user, curriculum, rpp_data, payment
+from app.models.rpp_data import SavedRPP
+from app.utils.markdown_ast import build_content_ast, content_hash
+
+async def migrate():
+    """
+    Add saved_rpps.content_ast / content_hash to an existing database and fill them
+    for rows saved before they existed. Safe to re-run: only rows without a hash are parsed.
+    """
+    async with engine.begin() as conn:
+        columns = await conn.run_sync(
+            lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns("saved_rpps")}
+        )
+        if "content_ast" not in columns:
+            print("Adding saved_rpps.content_ast...")
+            await conn.execute(text("ALTER TABLE saved_rpps ADD COLUMN content_ast JSON"))
+        if "content_hash" not in columns:
+            print("Adding saved_rpps.content_hash...")
+            await conn.execute(text("ALTER TABLE saved_rpps ADD COLUMN content_hash VARCHAR(64)"))
+
+    total = 0
+    while True:
+        async with engine.begin() as conn:
+            res = await conn.execute(
+                select(SavedRPP.id, SavedRPP.content_markdown)
+                .where(SavedRPP.content_hash.is_(None))
+                .order_by(SavedRPP.id)
+                .limit(200)
+            )
+            rows = res.all()
+            if not rows:
+                break
+            for row in rows:
+                await conn.execute(
+                    update(SavedRPP).where(SavedRPP.id == row.id).values(
+                        content_ast=build_content_ast(row.content_markdown),
+                        content_hash=content_hash(row.content_markdown)
+                    )
+                )
+            total += len(rows)
+            print(f"  parsed {total} RPPs...")
+
+    print(f"✅ saved_rpps migrated ({total} rows backfilled).")
+
+if __name__ == "__main__":
+    asyncio.run(migrate())